@@ -0,0 +1,25 @@
+"""add summary, keywords and summary_status to artifacts
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2025-10-01 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('artifacts', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('artifacts', sa.Column('keywords', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('artifacts', sa.Column('summary_status', sa.String(length=16), nullable=True))
+
+def downgrade() -> None:
+    op.drop_column('artifacts', 'summary_status')
+    op.drop_column('artifacts', 'keywords')
+    op.drop_column('artifacts', 'summary')
@@ -0,0 +1,48 @@
+"""add jobs table for the background job queue
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2025-10-01 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0019'
+down_revision = '0018'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), server_default='queued', nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('dedupe_key', sa.String(length=128), nullable=True),
+        sa.Column('user_id', sa.BigInteger(), nullable=True),
+        sa.Column('chat_id', sa.BigInteger(), nullable=True),
+        sa.Column('progress_msg_id', sa.Integer(), nullable=True),
+        sa.Column('progress', sa.String(length=256), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('max_attempts', sa.Integer(), server_default='3', nullable=False),
+        sa.Column('cancel_requested', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('ix_jobs_dedupe_key', 'jobs', ['dedupe_key'])
+    op.create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'])
+    op.create_index('ux_jobs_dedupe_active', 'jobs', ['dedupe_key'], unique=True,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+def downgrade() -> None:
+    op.drop_index('ux_jobs_dedupe_active', table_name='jobs')
+    op.drop_index('ix_jobs_status_run_after', table_name='jobs')
+    op.drop_index('ix_jobs_dedupe_key', table_name='jobs')
+    op.drop_table('jobs')
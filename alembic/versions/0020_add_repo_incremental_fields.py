@@ -0,0 +1,24 @@
+"""add project_id and last_commit to repos
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2025-10-01 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0020'
+down_revision = '0019'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('repos', sa.Column('project_id', sa.Integer(), nullable=True))
+    op.add_column('repos', sa.Column('last_commit', sa.String(length=40), nullable=True))
+    op.create_foreign_key('fk_repos_project_id', 'repos', 'projects', ['project_id'], ['id'], ondelete='SET NULL')
+
+def downgrade() -> None:
+    op.drop_constraint('fk_repos_project_id', 'repos', type_='foreignkey')
+    op.drop_column('repos', 'last_commit')
+    op.drop_column('repos', 'project_id')
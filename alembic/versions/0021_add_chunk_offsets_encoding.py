@@ -0,0 +1,24 @@
+"""add start_offset, end_offset and encoding to chunks
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2025-10-01 10:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0021'
+down_revision = '0020'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('chunks', sa.Column('start_offset', sa.Integer(), nullable=True))
+    op.add_column('chunks', sa.Column('end_offset', sa.Integer(), nullable=True))
+    op.add_column('chunks', sa.Column('encoding', sa.String(length=32), nullable=True))
+
+def downgrade() -> None:
+    op.drop_column('chunks', 'encoding')
+    op.drop_column('chunks', 'end_offset')
+    op.drop_column('chunks', 'start_offset')
@@ -0,0 +1,20 @@
+"""add per-project chunker override
+
+Revision ID: 0022
+Revises: 0021
+Create Date: 2025-10-01 10:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0022'
+down_revision = '0021'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('projects', sa.Column('chunker', sa.String(length=32), nullable=True))
+
+def downgrade() -> None:
+    op.drop_column('projects', 'chunker')
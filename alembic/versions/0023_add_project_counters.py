@@ -0,0 +1,31 @@
+"""add project_counters table and keyset index on artifacts
+
+Revision ID: 0023
+Revises: 0022
+Create Date: 2025-10-01 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0023'
+down_revision = '0022'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'project_counters',
+        sa.Column('project_id', sa.Integer(), sa.ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('artifacts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    # artifacts может быть большой — индекс строим без блокировки записи
+    with op.get_context().autocommit_block():
+        op.create_index('ix_artifacts_project_created_id', 'artifacts', ['project_id', 'created_at', 'id'],
+                        postgresql_concurrently=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artifacts_project_created_id', table_name='artifacts', postgresql_concurrently=True)
+    op.drop_table('project_counters')
@@ -0,0 +1,28 @@
+"""add kv_state table for the shared state backend
+
+Revision ID: 0024
+Revises: 0023
+Create Date: 2025-10-01 11:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0024'
+down_revision = '0023'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'kv_state',
+        sa.Column('key', sa.String(length=255), primary_key=True),
+        sa.Column('value', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_kv_state_expires_at', 'kv_state', ['expires_at'])
+
+def downgrade() -> None:
+    op.drop_index('ix_kv_state_expires_at', table_name='kv_state')
+    op.drop_table('kv_state')
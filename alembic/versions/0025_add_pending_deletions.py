@@ -0,0 +1,25 @@
+"""add pending_deletions table for delayed message deletion
+
+Revision ID: 0025
+Revises: 0024
+Create Date: 2025-10-01 11:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0025'
+down_revision = '0024'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'pending_deletions',
+        sa.Column('chat_id', sa.BigInteger(), primary_key=True),
+        sa.Column('message_id', sa.Integer(), primary_key=True),
+        sa.Column('due_at', sa.DateTime(timezone=True), nullable=False),
+    )
+
+def downgrade() -> None:
+    op.drop_table('pending_deletions')
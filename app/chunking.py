@@ -1,34 +1,247 @@
+"""Chunking strategies behind one registry.
+
+Стратегия по умолчанию — settings.chunker (CHUNKER), у проекта может быть своя
+(Project.chunker). Все чанкеры возвращают ChunkSpan со смещениями в тексте.
+"""
+from __future__ import annotations
+import re
+import json
 from dataclasses import dataclass
-from app.tokenizer import make_chunks as make_token_chunks, count_tokens
-from typing import List
+from pathlib import PurePosixPath
+from typing import Callable, Dict, List, Optional, Sequence
+from app.config import settings
+from app.tokenizer import make_chunks as make_token_chunks, count_tokens, chunk_spans, chunk_spans_batch, ChunkSpan
 
 @dataclass
 class ChunkParams:
     size: int = 1600
     overlap: int = 150
+    # оверлап внутри слишком длинной секции у структурного чанкера
+    struct_overlap: int = 30
     model: str = "gpt-3.5-turbo"
 
-# Обновленная функция чанкинга на основе токенов
+    @classmethod
+    def from_settings(cls) -> "ChunkParams":
+        return cls(size=settings.chunk_size, overlap=settings.chunk_overlap,
+                   struct_overlap=settings.struct_chunk_overlap)
+
+Chunker = Callable[[str, Optional[str], ChunkParams], List[ChunkSpan]]
+CHUNKERS: Dict[str, Chunker] = {}
+DEFAULT_CHUNKER = "structure"
+
+def register_chunker(name: str):
+    """Register fn(text, file_name, params) -> list[ChunkSpan] under name."""
+    def deco(fn: Chunker) -> Chunker:
+        CHUNKERS[name] = fn
+        return fn
+    return deco
+
+def resolve_chunker(project=None) -> str:
+    """Chunker name for a project: its own override, else settings.chunker; unknown names fall back to the default."""
+    for name in (getattr(project, "chunker", None), settings.chunker):
+        if name in CHUNKERS:
+            return name
+    return DEFAULT_CHUNKER
+
+def chunk_document(text: str, name: str | None = None, params: ChunkParams | None = None,
+                   chunker: str | None = None) -> List[ChunkSpan]:
+    """Chunk one document with the named strategy (default from settings); name is the file name/title."""
+    fn = CHUNKERS.get(chunker or "") or CHUNKERS[resolve_chunker()]
+    return fn(text, name, params or ChunkParams.from_settings())
+
+def chunk_documents(texts: Sequence[str], names: Sequence[str | None], params: ChunkParams | None = None,
+                    chunker: str | None = None) -> List[List[ChunkSpan]]:
+    """chunk_document for many texts; documents that end up in the token window share one batched encode."""
+    params = params or ChunkParams.from_settings()
+    chunker = chunker if chunker in CHUNKERS else resolve_chunker()
+    if chunker == "token":
+        batched = list(range(len(texts)))
+    elif chunker == "structure":
+        batched = [i for i, name in enumerate(names) if not structure_kind(name)]
+    else:
+        batched = []
+    out: List[List[ChunkSpan] | None] = [None] * len(texts)
+    for i, spans in zip(batched, chunk_spans_batch([texts[i] for i in batched], params.size, params.overlap)):
+        out[i] = spans
+    for i, name in enumerate(names):
+        if out[i] is None:
+            out[i] = chunk_document(texts[i], name, params, chunker)
+    return out
+
 def make_chunks(text: str, size: int = 1600, overlap: int = 150, model: str = "gpt-3.5-turbo") -> List[str]:
     """
     Создает чанки текста на основе токенов tiktoken.
     Полностью заменяет старый посимвольный метод.
     """
-    return make_token_chunks(text, model, size, overlap)
+    return make_token_chunks(text, size, overlap)
+
+def legacy_spans(text: str, size: int = 1600, overlap: int = 150) -> List[ChunkSpan]:
+    """
+    Старый посимвольный чанкер: size/overlap в символах, токены считаются по каждому чанку.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return []
+    base = len(text) - len(text.lstrip())
+    step = max(1, size - overlap)
+    return [ChunkSpan(stripped[i:i + size], count_tokens(stripped[i:i + size]), base + i, base + min(i + size, len(stripped)))
+            for i in range(0, len(stripped), step)]
 
 # Оставляем старую функцию для обратной совместимости (для тестов)
 def make_chunks_legacy(text: str, size: int = 1600, overlap: int = 150) -> List[str]:
     """
     Старый посимвольный чанкер (только для обратной совместимости).
     """
-    text = text.strip()
-    if not text:
-        return []
-    step = max(1, size - overlap)
-    chunks = []
-    i = 0
-    while i < len(text):
-        chunk = text[i : i + size]
-        chunks.append(chunk)
-        i += step
-    return chunks
\ No newline at end of file
+    return [s.text for s in legacy_spans(text, size, overlap)]
+
+# --- Структурный чанкер: Markdown-заголовки, top-level def/class, ключи JSON ---
+
+# Расширение файла → вид структуры
+STRUCTURE_KINDS = {
+    ".md": "markdown", ".markdown": "markdown", ".mdx": "markdown",
+    ".py": "python", ".pyi": "python",
+    ".ts": "script", ".tsx": "script", ".js": "script", ".jsx": "script", ".mjs": "script", ".cjs": "script",
+    ".json": "json",
+}
+
+_MD_HEADING = re.compile(r"^#{1,6}\s")
+_MD_FENCE = re.compile(r"^(```|~~~)")
+_JSON_SEP = re.compile(r"[\s,]*")
+_JSON_COLON = re.compile(r"\s*:\s*")
+_PY_TOP = re.compile(r"^(@|def\s|async\s+def\s|class\s)")
+_SCRIPT_TOP = re.compile(
+    r"^(export\s+)?(default\s+)?(declare\s+)?(async\s+)?"
+    r"(function\b|class\b|abstract\s+class\b|interface\b|type\s+\w|enum\b|const\b|let\b|var\b|namespace\b)"
+)
+
+def structure_kind(name: str | None) -> str | None:
+    """Structure kind for a file name / uri / 'archive.zip:path' title, or None for plain text."""
+    if not name:
+        return None
+    return STRUCTURE_KINDS.get(PurePosixPath(name.rsplit(":", 1)[-1]).suffix.lower())
+
+def _line_starts(text: str):
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        yield pos, line
+        pos += len(line)
+
+def _markdown_bounds(text: str) -> List[int]:
+    bounds, fenced = [], False
+    for pos, line in _line_starts(text):
+        if _MD_FENCE.match(line):
+            fenced = not fenced
+        elif not fenced and _MD_HEADING.match(line):
+            bounds.append(pos)
+    return bounds
+
+def _code_bounds(text: str, top: re.Pattern) -> List[int]:
+    """Top-level definitions; decorators stay with the def that follows them."""
+    bounds, prev_decorator = [], False
+    for pos, line in _line_starts(text):
+        if not line.strip():
+            continue
+        m = top.match(line)
+        if m and not prev_decorator:
+            bounds.append(pos)
+        prev_decorator = bool(m) and line.startswith("@")
+    return bounds
+
+def _json_bounds(text: str) -> List[int] | None:
+    """Top-level object members (or array items) via raw_decode; None if the text is not JSON."""
+    dec = json.JSONDecoder()
+    ws = _JSON_SEP
+    i = ws.match(text).end()
+    if i >= len(text) or text[i] not in "{[":
+        return None
+    is_obj = text[i] == "{"
+    i += 1
+    bounds = []
+    try:
+        while True:
+            i = ws.match(text, i).end()
+            if i >= len(text) or text[i] in "}]":
+                return bounds
+            bounds.append(i)
+            if is_obj:
+                _, i = dec.raw_decode(text, i)  # ключ
+                i = _JSON_COLON.match(text, i).end()
+            _, i = dec.raw_decode(text, i)      # значение
+    except (ValueError, AttributeError):
+        return None
+
+def _section_bounds(text: str, kind: str) -> List[int] | None:
+    if kind == "markdown":
+        return _markdown_bounds(text)
+    if kind == "python":
+        return _code_bounds(text, _PY_TOP)
+    if kind == "script":
+        return _code_bounds(text, _SCRIPT_TOP)
+    if kind == "json":
+        return _json_bounds(text)
+    return None
+
+def _trimmed(text: str, s: int, e: int) -> tuple[int, int]:
+    while s < e and text[s].isspace():
+        s += 1
+    while e > s and text[e - 1].isspace():
+        e -= 1
+    return s, e
+
+def structure_spans(text: str, kind: str, size: int = 1600, overlap: int = 30) -> List[ChunkSpan]:
+    """
+    Чанки по границам структуры: соседние секции склеиваются до size токенов,
+    слишком длинная секция режется токенным окном с маленьким overlap.
+    Если структуру найти не удалось — обычное токенное окно.
+    """
+    bounds = _section_bounds(text, kind)
+    if not bounds:
+        return chunk_spans(text, size, overlap)
+    cuts = sorted({0, *bounds, len(text)})
+    sections = [(a, b) for a, b in zip(cuts, cuts[1:]) if text[a:b].strip()]
+    counts = [count_tokens(text[a:b]) for a, b in sections]
+
+    spans: List[ChunkSpan] = []
+    cur_s = cur_e = None
+    cur_n = 0
+
+    def flush():
+        nonlocal cur_s, cur_n
+        if cur_s is not None:
+            s, e = _trimmed(text, cur_s, cur_e)
+            spans.append(ChunkSpan(text[s:e], cur_n, s, e))
+        cur_s, cur_n = None, 0
+
+    for (a, b), n in zip(sections, counts):
+        if n > size:
+            # длинная функция / раздел: окнами, смещения в координатах всего текста;
+            # хвостовое окно не закрываем — к нему могут приклеиться следующие секции
+            flush()
+            windows = chunk_spans(text[a:b], size, overlap)
+            spans.extend(ChunkSpan(sp.text, sp.token_count, sp.start_offset + a, sp.end_offset + a)
+                         for sp in windows[:-1])
+            cur_s, cur_e, cur_n = windows[-1].start_offset + a, b, windows[-1].token_count
+            continue
+        if cur_s is not None and cur_n + n > size:
+            flush()
+        if cur_s is None:
+            cur_s = a
+        cur_e, cur_n = b, cur_n + n
+    flush()
+    return spans
+
+@register_chunker("token")
+def _token_chunker(text: str, name: str | None, p: ChunkParams) -> List[ChunkSpan]:
+    return chunk_spans(text, p.size, p.overlap)
+
+@register_chunker("structure")
+def _structure_chunker(text: str, name: str | None, p: ChunkParams) -> List[ChunkSpan]:
+    """Structure-aware for Markdown/Python/TS/JS/JSON by extension, token window otherwise."""
+    kind = structure_kind(name)
+    if kind:
+        return structure_spans(text, kind, p.size, p.struct_overlap)
+    return chunk_spans(text, p.size, p.overlap)
+
+@register_chunker("legacy")
+def _legacy_chunker(text: str, name: str | None, p: ChunkParams) -> List[ChunkSpan]:
+    return legacy_spans(text, p.size, p.overlap)
@@ -17,6 +17,25 @@ class Settings(BaseSettings):
     project_max_chunks: int = Field(default=200, alias="PROJECT_MAX_CHUNKS")
     chunk_size: int = Field(default=1600, alias="CHUNK_SIZE")
     chunk_overlap: int = Field(default=150, alias="CHUNK_OVERLAP")
+    # Перекрытие для структурного чанкера: режет по заголовкам/функциям/ключам,
+    # оверлап нужен только внутри слишком длинной секции
+    struct_chunk_overlap: int = Field(default=30, alias="STRUCT_CHUNK_OVERLAP")
+    # Стратегия чанкинга по умолчанию: structure | token | legacy (у проекта может быть своя — /chunker)
+    chunker: str = Field(default="structure", alias="CHUNKER")
+
+    # Режим получения апдейтов: polling | webhook (несколько реплик за балансировщиком)
+    bot_mode: str = Field(default="polling", alias="BOT_MODE")
+    # Публичный URL вебхука без пути (https://bot.example.com); пусто — setWebhook не вызываем
+    webhook_url: str | None = Field(default=None, alias="WEBHOOK_URL")
+    webhook_path: str = Field(default="/tg/webhook", alias="WEBHOOK_PATH")
+    # X-Telegram-Bot-Api-Secret-Token — общий для всех реплик, обязателен в режиме webhook
+    webhook_secret: str | None = Field(default=None, alias="WEBHOOK_SECRET")
+    webhook_host: str = Field(default="0.0.0.0", alias="WEBHOOK_HOST")
+    webhook_port: int = Field(default=8080, alias="WEBHOOK_PORT")
+    # Где живёт состояние хендлеров и FSM: memory (один процесс) | postgres (реплики, переживает рестарт)
+    state_backend: str = Field(default="memory", alias="STATE_BACKEND")
+    # webhook со STATE_BACKEND=memory — только если реплика точно одна (иначе не стартуем)
+    webhook_single_replica: bool = Field(default=False, alias="WEBHOOK_SINGLE_REPLICA")
     
     # MinIO settings
     minio_endpoint: str | None = Field(default=None, alias="MINIO_ENDPOINT")
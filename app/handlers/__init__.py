@@ -31,6 +31,7 @@ from .export import router as export_router
 from .repo import router as repo_router
 from .cleanup import router as cleanup_router
 from .batch_ops import router as batch_ops_router
+from .jobs import router as jobs_router
 
 router = Router(name="root")
 
@@ -43,6 +44,7 @@ router.include_router(kb_router)
 # 2) Then all the rest
 router.include_router(status_router)
 router.include_router(import_router)
+router.include_router(jobs_router)  # /jobs — до ask (там catch-all message handler)
 if memory_router:
     router.include_router(memory_router)
 
@@ -7,12 +7,15 @@ from app.services.memory import get_active_project, get_preferred_model, _ensure
 from app.services.memory import list_projects as list_all_projects
 from app.services.artifacts import get_chunks_by_artifact_ids
 from app.db import session_scope
-import asyncio
+import json
 from typing import cast
 import sqlalchemy as sa
 from html import escape
 # Import the new tags service
 from app.services.tags import get_presets
+from app.services.jobs import job_handler, JobContext
+from app.services.state_backend import get_state_backend
+from app.services.deletions import schedule_delete
 
 router = Router()
 
@@ -20,12 +23,27 @@ router = Router()
 GENERAL_TAG_PROMPT = "Свои теги (через запятую):"
 IMPORT_TAG_PROMPT_PREFIX = "Свои теги для импорта #"
 
-# текущее выбранное множество держим в памяти на 2 минуты (простая мапа)
-TAG_CACHE: dict[int, set[str]] = {}
+# текущее выбранное множество держим в StateBackend (общий для реплик, с TTL)
+TAG_PICK_TTL = 3600
+
+def _tags_key(msg_id: int) -> str:
+    return f"ans_tags:{msg_id}"
+
+
+async def _answer_run_meta(st, bm: BotMessage) -> dict | None:
+    """run_meta (tokens in/out/cached, duration) из last_answer, если bm — это последний ответ."""
+    stt = await _ensure_user_state(st, bm.user_id)
+    try:
+        ctx = json.loads(stt.last_answer) if stt.last_answer else {}
+    except Exception:
+        ctx = {}
+    ids = [ctx.get("answer_msg_id"), *(ctx.get("answer_msg_ids") or [])]
+    return ctx.get("run_meta") if bm.tg_message_id in ids else None
 
 
 # --- Теги для импорта (по artifact_id) ---
-IMP_TAG_CACHE: dict[int, set[str]] = {}
+def _imp_tags_key(art_id: int) -> str:
+    return f"imp_tags:{art_id}"
 
 
 def answer_actions_kb(msg_id: int):
@@ -99,7 +117,8 @@ async def ans_save(cb: CallbackQuery):
         text = ""
         if cb.message and isinstance(cb.message, Message):
             text = cb.message.text or cb.message.caption or ""
-        art = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False)
+        art = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False,
+            run_meta=await _answer_run_meta(st, bm))
         st.add(art)
         await st.flush()
         bm.artifact_id = art.id
@@ -154,7 +173,8 @@ async def ans_summary(cb: CallbackQuery):
 
         # если не сохранён base — создаём
         if not bm.saved or not bm.artifact_id:
-            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=True)
+            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=True,
+                run_meta=await _answer_run_meta(st, bm))
             st.add(base)
             await st.flush()
             bm.artifact_id = base.id
@@ -227,12 +247,8 @@ async def ans_del(cb: CallbackQuery):
         async with session_scope() as st:
             chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
             note = await cb.message.answer("🧹 Очищено", reply_markup=build_reply_kb(chat_on))
-    if note:
-        await asyncio.sleep(3)
-        try:
-            await note.delete()
-        except:
-            pass
+    if note and cb.bot:
+        schedule_delete(cb.bot, note.chat.id, note.message_id, delay=3.0)
     await cb.answer()
 
 
@@ -252,7 +268,7 @@ async def ans_tag(cb: CallbackQuery):
         presets = await get_presets(st, cb.from_user.id if cb.from_user else 0, pid)
         # Get chat_on flag to rebuild keyboard with correct state
         chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
-    TAG_CACHE[msg_id] = set()
+    await get_state_backend().set(_tags_key(msg_id), [], ttl=TAG_PICK_TTL)
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer("Выбери теги (тап по кнопкам), потом нажми «Готово».",
                                 reply_markup=build_tag_kb(presets, msg_id))
@@ -265,11 +281,8 @@ async def ans_tag_toggle(cb: CallbackQuery):
         return await cb.answer("Invalid data")
     _, _, msg_id, tag = cb.data.split(":", 3)
     msg_id = int(msg_id)
-    cur = TAG_CACHE.get(msg_id, set())
-    if tag in cur: cur.remove(tag)
-    else: cur.add(tag)
-    TAG_CACHE[msg_id] = cur
-    await cb.answer(f"{'+' if tag in cur else '-'} {escape(tag)}")
+    added = await get_state_backend().toggle(_tags_key(msg_id), tag, ttl=TAG_PICK_TTL)
+    await cb.answer(f"{'+' if added else '-'} {escape(tag)}")
 
 
 @router.callback_query(F.data.startswith("ans:tagdone:"))
@@ -279,7 +292,7 @@ async def ans_tag_done(cb: CallbackQuery):
     if not cb.data:
         return await cb.answer("Invalid data")
     msg_id = int(cb.data.split(":")[-1])
-    tags = sorted(TAG_CACHE.get(msg_id, set()))
+    tags = sorted(await get_state_backend().get(_tags_key(msg_id)) or [])
     if not tags:
         return await cb.answer("Не выбрано ни одного тега.", show_alert=True)
     # применим как раньше, только без ForceReply
@@ -304,7 +317,8 @@ async def ans_tag_done(cb: CallbackQuery):
                         # Get chat_on flag to rebuild keyboard with correct state
                         chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
                         return await cb.message.answer("Сначала выбери проект в Actions → Projects.", reply_markup=build_reply_kb(chat_on))
-            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False)
+            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False,
+                run_meta=await _answer_run_meta(st, bm))
             st.add(base)
             await st.flush()
             bm.artifact_id = base.id
@@ -336,7 +350,7 @@ async def ans_tag_done(cb: CallbackQuery):
         chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer(f"🏷 Теги: {escape(', '.join(tags))}", reply_markup=build_reply_kb(chat_on))
-    TAG_CACHE.pop(msg_id, None)
+    await get_state_backend().pop(_tags_key(msg_id))
     await cb.answer()
 
 
@@ -390,7 +404,8 @@ async def tags_free_reply(message: Message):
                 # Get chat_on flag to rebuild keyboard with correct state
                 chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
                 return await message.answer("Сначала выбери проект.", reply_markup=build_reply_kb(chat_on))
-            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False)
+            base = Artifact(project_id=target_pid, kind="answer", title="Chat answer", raw_text=text, pinned=False,
+                run_meta=await _answer_run_meta(st, bm))
             st.add(base)
             await st.flush()
             bm.artifact_id = base.id
@@ -445,7 +460,7 @@ async def imp_tag(cb: CallbackQuery):
             if active_proj:
                 pid = active_proj.id
         presets = await get_presets(st, cb.from_user.id if cb.from_user else 0, pid)
-    IMP_TAG_CACHE[art_id] = set()
+    await get_state_backend().set(_imp_tags_key(art_id), [], ttl=TAG_PICK_TTL)
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer("Выбери теги (тап по кнопкам), потом «Готово».",
                                 reply_markup=build_imp_tag_kb(presets, art_id))  # reuse разметки — msg_id нам не важен
@@ -461,11 +476,8 @@ async def imp_tag_toggle(cb: CallbackQuery):
         return await cb.answer("Invalid data format")
     _, _, art_id, tag = parts
     art_id = int(art_id)
-    cur = IMP_TAG_CACHE.get(art_id, set())
-    if tag in cur: cur.remove(tag)
-    else: cur.add(tag)
-    IMP_TAG_CACHE[art_id] = cur
-    await cb.answer(f"{'+' if tag in cur else '-'} {tag}")
+    added = await get_state_backend().toggle(_imp_tags_key(art_id), tag, ttl=TAG_PICK_TTL)
+    await cb.answer(f"{'+' if added else '-'} {tag}")
 
 
 @router.callback_query(F.data.startswith("imp:tagdone:"))
@@ -475,7 +487,7 @@ async def imp_tag_done(cb: CallbackQuery):
     if not cb.data:
         return await cb.answer("Invalid data")
     art_id = int(cb.data.split(":")[-1])
-    tags = sorted(IMP_TAG_CACHE.get(art_id, set()))
+    tags = sorted(await get_state_backend().get(_imp_tags_key(art_id)) or [])
     if not tags:
         return await cb.answer("Не выбрано ни одного тега.", show_alert=True)
     async with session_scope() as st:
@@ -506,7 +518,7 @@ async def imp_tag_done(cb: CallbackQuery):
         chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer(f"🏷 Теги для импорта: {escape(', '.join(tags))}", reply_markup=build_reply_kb(chat_on))
-    IMP_TAG_CACHE.pop(art_id, None)
+    await get_state_backend().pop(_imp_tags_key(art_id))
     await cb.answer()
 
 
@@ -588,6 +600,45 @@ async def imp_del(cb: CallbackQuery):
     await cb.answer()
 
 
+@router.callback_query(F.data.startswith("imp:sum:"))
+async def imp_summary(cb: CallbackQuery):
+    """Резюме всего импорта (map-reduce по чанкам) — фоновой задачей."""
+    from app.services.jobs import submit_job
+    if not cb.data:
+        return await cb.answer("Invalid data")
+    art_id = int(cb.data.split(":")[-1])
+    if cb.message and isinstance(cb.message, Message):
+        await submit_job(cb.bot, cb.message.chat.id, cb.from_user.id if cb.from_user else 0,
+                         "import_summary", {"artifact_id": art_id}, title=f"резюме импорта #{art_id}")
+    await cb.answer("🧾 Резюме поставлено в очередь")
+
+
+@job_handler("import_summary", max_attempts=2)
+async def _import_summary_job(ctx: JobContext):
+    """Сохраняет резюме как дочерний summary-артефакт и присылает его в чат."""
+    from app.handlers.keyboard import main_reply_kb as build_reply_kb
+    from app.services.memory import get_chat_flags
+    from app.services.summarizer import summarize_artifact
+    art_id = int(ctx.payload["artifact_id"])
+    async with session_scope() as st:
+        art = await st.get(Artifact, art_id)
+        if not art:
+            await ctx.send("Импорт не найден.")
+            return {"artifact_id": art_id, "summary_id": None}
+        await ctx.progress("суммаризация…", force=True)
+        summary = await summarize_artifact(st, art_id)
+        if not summary:
+            await ctx.send("⚠️ Не удалось сделать резюме импорта.")
+            return {"artifact_id": art_id, "summary_id": None}
+        summ = Artifact(project_id=art.project_id, kind="summary", title=f"Summary: {art.title}"[:256],
+                        raw_text=summary, pinned=True, parent_id=art.id)
+        st.add(summ)
+        await st.commit()
+        chat_on, *_ = await get_chat_flags(st, ctx.user_id)
+    await ctx.send(f"🧾 <b>Резюме импорта #{art_id}</b>\n\n{escape(summary[:3800])}", reply_markup=build_reply_kb(chat_on))
+    return {"artifact_id": art_id, "summary_id": summ.id}
+
+
 # где-то рядом с build_tag_kb — версия для импорта
 def build_imp_tag_kb(tags: list[str], art_id: int):
     rows, row = [], []
@@ -22,16 +22,28 @@ from app.db import session_scope
 from app.models import Artifact, Chunk, UserState, Tag, artifact_tags
 from app.services.memory import _ensure_user_state, get_active_project, get_chat_flags, get_linked_project_ids, set_chat_mode
 from app.handlers.keyboard import main_reply_kb
-from app.handlers.import_file import _LAST_DOC
 from app.services.artifacts import create_import
+from app.tokenizer import count_tokens
 from app.config import settings
 from app.storage import save_file
 from app.ignore import load_pmignore, iter_text_files
 from app.utils.zipfix import fix_zip_name, decode_text_bytes
-from app.utils.tg import _toast, _safe_delete, _send_ephemeral  # Add this import
+from app.utils.tg import _toast, _safe_delete, _send_ephemeral, delete_messages, parse_msg_ids, send_long_answer
+from app.utils.markdown import md_to_tg_html
+from app.ui import PanelSpec, register_panel, show_list_panel, parse_page_callback
+from app.services.panel_cache import PanelPos, PanelView, panel_view
+from app.utils.ordering import user_unlocked
+from app.services.deletions import schedule_delete
+from app.services.state_backend import get_state_backend
 
 # Add Berlin timezone
 BERLIN = ZoneInfo("Europe/Berlin")
+# Вопрос пользователя в работе — ключ в StateBackend (виден всем репликам), ставится атомарно.
+# TTL — страховка: упавший процесс не оставит пользователя «занятым» навсегда
+ASK_INFLIGHT_TTL = 600
+
+def _ask_inflight_key(user_id: int) -> str:
+    return f"ask_inflight:{user_id}"
 
 router = Router(name="ask")
 
@@ -90,8 +102,8 @@ def _budget_for_selection(chunks: Sequence[Chunk]) -> int:
             # Ensure we don't have negative token counts
             total += max(0, token_count)
         except Exception:
-            # Fallback estimation if tokens is not a valid number
-            total += max(1, len(ch.text)//4)
+            # Fallback if tokens is not a valid number
+            total += max(1, count_tokens(ch.text or ""))
     return total
 
 async def _get_selected_source_ids(st, user_id: int) -> list[int]:
@@ -122,13 +134,6 @@ async def _get_selected_source_ids(st, user_id: int) -> list[int]:
     
     return valid_ids
 
-async def _auto_delete_message(bot, chat_id: int, message_id: int, delay: float = 3.0):
-    """Auto-delete a message after a delay."""
-    import asyncio
-    await asyncio.sleep(delay)
-    with contextlib.suppress(Exception):
-        await bot.delete_message(chat_id, message_id)
-
 def _format_selected_summary(artifacts: list[Artifact]) -> str:
     """Format a summary of selected artifacts for display at the top of the panel."""
     if not artifacts:
@@ -193,11 +198,57 @@ def _parse_search_query(q: str) -> tuple[list[str], list[str], str | None]:
     # Otherwise, treat as title search
     return [], [], q
 
-async def _render_panel(m: Message, st, q: str | None = None, page: int = 1, user_id: int | None = None):
+def _ask_where(view: PanelView):
+    """WHERE for the ASK list: active + linked projects, narrowed by the search query (#tag, id or title)."""
+    cond = Artifact.project_id.in_(view.project_ids)
+    if not view.query:
+        return cond
+    tag_filters, id_filters, title_filter = _parse_search_query(view.query)
+    if tag_filters:
+        tag_subq = (
+            sa.select(artifact_tags.c.artifact_id)
+            .join(Tag, artifact_tags.c.tag_name == Tag.name)
+            .where(sa.func.lower(Tag.name).like(f"%{tag_filters[0].lower()}%"))
+        )
+        return sa.and_(cond, Artifact.id.in_(tag_subq))
+    if id_filters:
+        return sa.and_(cond, Artifact.id == int(id_filters[0]))
+    if title_filter:
+        return sa.and_(cond, sa.func.lower(Artifact.title).like(f"%{title_filter.lower()}%"))
+    return cond
+
+ASK_PANEL = register_panel(PanelSpec(
+    kind="aw",
+    where=_ask_where,
+    title=lambda view: f'Поиск: "{escape(view.query)}"' if view.query else "Найти источник",
+    page_cb="aw:page",
+    selected_mark="✅",
+    search=True,
+))
+
+async def _render_panel(m: Message, st, q: str | None = None, pos: PanelPos | None = None, user_id: int | None = None,
+                        edit: bool = False, keep_query: bool = False):
+    """ASK list panel as one message. edit=True re-renders m in place when m is the panel
+    (page flips, toggles, deletes); pos=None keeps the current page (first page for a new panel),
+    keep_query keeps the search."""
     # Use provided user_id if available, otherwise fallback to m.from_user.id
     actual_user_id = user_id if user_id is not None else (m.from_user.id if m.from_user else None)
-    if not actual_user_id:
+    if not actual_user_id or not m.bot:
         return
+
+    # Открытая панель: view в кэше — без чтения проекта/UserState, страница из кэша
+    view = panel_view(m.chat.id, m.message_id) if edit else None
+    if view is not None and view.kind == "aw":
+        if not keep_query and view.query != q:
+            view.query = q
+            pos = PanelPos()
+        panel_id = await show_list_panel(st, m.bot, m.chat.id, view, pos, message_id=m.message_id)
+        if panel_id != m.message_id:
+            stt = await _ensure_user_state(st, actual_user_id)
+            stt.ask_page_msg_ids = str(panel_id)
+            await st.commit()
+        return
+
     proj = await get_active_project(st, actual_user_id)
     print(f"DEBUG: proj: {proj}")
     if not proj:
@@ -207,7 +258,6 @@ async def _render_panel(m: Message, st, q: str | None = None, page: int = 1, use
         await m.answer("Нет активного проекта. Создай или выбери.", reply_markup=main_reply_kb(chat_on))
         return
     stt = await _ensure_user_state(st, actual_user_id)
-    sel = set(_ids_get(stt))
     
     # Get linked project IDs for proper search scope (Hotfix B)
     linked_project_ids = await get_linked_project_ids(st, actual_user_id)
@@ -215,250 +265,18 @@ async def _render_panel(m: Message, st, q: str | None = None, page: int = 1, use
     project_ids = [proj.id] + linked_project_ids
     
     # Log parameters for debugging (Hotfix A)
-    print(f"DEBUG: _render_panel - project_ids={project_ids}, search_query='{q}', page={page}")
-    
-    # Get selected artifacts for summary display
-    selected_artifacts = []
-    if sel:
-        sel_query = sa.select(Artifact).where(Artifact.id.in_(list(sel)))
-        selected_artifacts = (await st.execute(sel_query)).scalars().all()
-
-    # Build base query using subqueries to avoid DISTINCT ON issues (Variant B approach) (Hotfix D)
-    if q:
-        # Parse search query for different filter types
-        tag_filters, id_filters, title_filter = _parse_search_query(q)
-        
-        # Create subquery for artifact IDs based on search criteria
-        if tag_filters:
-            # Subquery for tag-based search using join and distinct (Variant B) (Hotfix D)
-            tag_subq = (
-                sa.select(sa.distinct(artifact_tags.c.artifact_id))
-                .join(Tag, artifact_tags.c.tag_name == Tag.name)
-                .where(
-                    sa.and_(
-                        artifact_tags.c.artifact_id == Artifact.id,  # Join condition in subquery
-                        Artifact.project_id.in_(project_ids),
-                        sa.func.lower(Tag.name).like(f"%{tag_filters[0].lower()}%")
-                    )
-                )
-            )
-            # Main query using the subquery (Variant B) (Hotfix D)
-            base = sa.select(Artifact).where(
-                Artifact.id.in_(tag_subq)
-            ).order_by(Artifact.created_at.desc())
-        elif id_filters:
-            # Direct ID match (Variant B) (Hotfix D)
-            try:
-                artifact_id = int(id_filters[0])
-                # Subquery for ID-based search (Variant B) (Hotfix D)
-                id_subq = sa.select(Artifact.id).where(
-                    sa.and_(
-                        Artifact.project_id.in_(project_ids),
-                        Artifact.id == artifact_id
-                    )
-                )
-                # Main query using the subquery (Variant B) (Hotfix D)
-                base = sa.select(Artifact).where(
-                    Artifact.id.in_(id_subq)
-                ).order_by(Artifact.created_at.desc())
-            except ValueError:
-                # If ID is not valid, return empty result
-                base = sa.select(Artifact).where(
-                    Artifact.id.is_(None)  # This will return empty result
-                ).order_by(Artifact.created_at.desc())
-        elif title_filter:
-            # Title-based search (Variant B) (Hotfix D)
-            # Subquery for title-based search (Variant B) (Hotfix D)
-            title_subq = sa.select(Artifact.id).where(
-                sa.and_(
-                    Artifact.project_id.in_(project_ids),
-                    sa.func.lower(Artifact.title).like(f"%{title_filter.lower()}%")
-                )
-            )
-            # Main query using the subquery (Variant B) (Hotfix D)
-            base = sa.select(Artifact).where(
-                Artifact.id.in_(title_subq)
-            ).order_by(Artifact.created_at.desc())
-        else:
-            # No specific filter, show all artifacts (Variant B) (Hotfix D)
-            # Subquery for all artifacts (Variant B) (Hotfix D)
-            all_subq = sa.select(Artifact.id).where(
-                Artifact.project_id.in_(project_ids)
-            )
-            # Main query using the subquery (Variant B) (Hotfix D)
-            base = sa.select(Artifact).where(
-                Artifact.id.in_(all_subq)
-            ).order_by(Artifact.created_at.desc())
-    else:
-        # No search query, show all artifacts (Variant B) (Hotfix D)
-        # Subquery for all artifacts (Variant B) (Hotfix D)
-        all_subq = sa.select(Artifact.id).where(
-            Artifact.project_id.in_(project_ids)
-        )
-        # Main query using the subquery (Variant B) (Hotfix D)
-        base = sa.select(Artifact).where(
-            Artifact.id.in_(all_subq)
-        ).order_by(Artifact.created_at.desc())
-    
-    page_size = 5  # Changed to 5 items per page as per SPEC v2
-    # Execute query with pagination
-    res = (await st.execute(base.limit(page_size).offset((page-1)*page_size))).scalars().all()
-    
-    # Additional uniqueness check in Python as a safety measure (Hotfix D)
-    unique_res = []
-    seen_ids = set()
-    for artifact in res:
-        if artifact.id not in seen_ids:
-            unique_res.append(artifact)
-            seen_ids.add(artifact.id)
-    res = unique_res
-
-    # Send header with search functionality
-    if m.bot:
-        # Header message with search button
-        header_builder = InlineKeyboardBuilder()
-        header_builder.button(text="🔍", callback_data="aw:search")
-        header_text = "Найти источник"
-        
-        # If there's an active search, show search chip
-        if q:
-            header_text = f'Поиск: "{q}"'
-            header_builder.button(text="✖ Очистить", callback_data="aw:clear_search")
-            header_builder.adjust(2)
-        else:
-            header_builder.adjust(1)
-            
-        # Send header message
-        header_msg = await m.bot.send_message(
-            chat_id=m.chat.id,
-            text=header_text,
-            reply_markup=header_builder.as_markup()
-        )
-        header_msg_id = header_msg.message_id
-
-    # Send each artifact as a separate message with its own inline keyboard
-    if m.bot:
-        # Delete previous messages if this is a pagination action
-        if stt.ask_page_msg_ids:
-            try:
-                msg_ids = [int(id_str) for id_str in stt.ask_page_msg_ids.split(',') if id_str.strip()]
-                for msg_id in msg_ids:
-                    await _safe_delete(m.bot, m.chat.id, msg_id)
-            except Exception:
-                pass  # Ignore errors when deleting messages
-        
-        # Delete previous footer message if it exists
-        if stt.ask_footer_msg_id:
-            try:
-                await _safe_delete(m.bot, m.chat.id, stt.ask_footer_msg_id)
-            except Exception:
-                pass  # Ignore errors when deleting messages
-        
-        # Send new messages
-        sent_msg_ids = []
-        for i, a in enumerate(res, 1):
-            # Create artifact text line in required format (N. <Название> [#tag1 #tag2] (id 689..., 2025-09-16))
-            tags = ""
-            if a.tags:
-                tag_list = [t.name for t in a.tags]
-                if tag_list:
-                    tags = " [" + " ".join(escape(t) for t in tag_list[:3]) + "]"
-            title = escape((a.title or str(a.id))[:80])
-            created_at = a.created_at.strftime("%Y-%m-%d") if a.created_at else ""
-            text_line = f"{i}. {title}{tags} (id {a.id}{', ' + created_at if created_at else ''})"
-            
-            # Create inline keyboard for this artifact
-            kb = InlineKeyboardBuilder()
-            mark = "✅" if a.id in sel else "➕"
-            kb.button(text=mark, callback_data=f"aw:toggle:{a.id}")
-            kb.button(text="🗑", callback_data=f"aw:delete:{a.id}")
-            kb.adjust(2)
-            
-            # Send message for this artifact
-            sent_msg = await m.bot.send_message(
-                chat_id=m.chat.id,
-                text=text_line,
-                reply_markup=kb.as_markup()
-            )
-            sent_msg_ids.append(str(sent_msg.message_id))
-        
-        # Store message IDs for future pagination
-        stt.ask_page_msg_ids = ",".join(sent_msg_ids) if sent_msg_ids else None
-        
-        # Send pagination footer
-        # Get total count for pagination using subquery approach (Variant B) (Hotfix D)
-        count_subq = sa.select(sa.func.count(Artifact.id)).where(Artifact.project_id.in_(project_ids))
-        # Apply filters if there's a search query
-        if q:
-            tag_filters, id_filters, title_filter = _parse_search_query(q)
-            if tag_filters:
-                tag_count_subq = (
-                    sa.select(sa.func.count(sa.distinct(artifact_tags.c.artifact_id)))
-                    .join(Tag, artifact_tags.c.tag_name == Tag.name)
-                    .where(
-                        sa.and_(
-                            artifact_tags.c.artifact_id == Artifact.id,
-                            Artifact.project_id.in_(project_ids),
-                            sa.func.lower(Tag.name).like(f"%{tag_filters[0].lower()}%")
-                        )
-                    )
-                )
-                count_subq = tag_count_subq
-            elif id_filters:
-                try:
-                    artifact_id = int(id_filters[0])
-                    id_count_subq = sa.select(sa.func.count(Artifact.id)).where(
-                        sa.and_(
-                            Artifact.project_id.in_(project_ids),
-                            Artifact.id == artifact_id
-                        )
-                    )
-                    count_subq = id_count_subq
-                except ValueError:
-                    count_subq = sa.select(sa.func.count(Artifact.id)).where(Artifact.id.is_(None))
-            elif title_filter:
-                title_count_subq = sa.select(sa.func.count(Artifact.id)).where(
-                    sa.and_(
-                        Artifact.project_id.in_(project_ids),
-                        sa.func.lower(Artifact.title).like(f"%{title_filter.lower()}%")
-                    )
-                )
-                count_subq = title_count_subq
-        
-        count_result = await st.execute(count_subq)
-        total_count = count_result.scalar_one_or_none() or 0
-        total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
-        
-        footer_msg_id = None
-        if total_pages > 1:
-            footer_builder = InlineKeyboardBuilder()
-            if page > 1:
-                footer_builder.button(text="⬅️ Назад", callback_data=f"aw:page:{page-1}")
-            footer_builder.button(text=f"Стр. {page}/{total_pages}", callback_data="aw:noop")
-            if page < total_pages:
-                footer_builder.button(text="Далее ➡️", callback_data=f"aw:page:{page+1}")
-            footer_builder.adjust(3)
-            
-            footer_msg = await m.bot.send_message(
-                chat_id=m.chat.id,
-                text="Пагинация:",
-                reply_markup=footer_builder.as_markup()
-            )
-            # Store footer message ID
-            footer_msg_id = footer_msg.message_id
-        else:
-            stt.ask_footer_msg_id = None
-        
-        # Update state with new message IDs
-        stt.ask_page_msg_ids = ",".join(sent_msg_ids) if sent_msg_ids else None
-        stt.ask_footer_msg_id = footer_msg_id
-        
-        await st.commit()
-    
-    # Always send reply keyboard to prevent it from disappearing
-    chat_on, *_ = await get_chat_flags(st, actual_user_id)
-    # Removed temporary "..." message - using toast instead
-    # await m.answer("...", reply_markup=main_reply_kb(chat_on))
+    print(f"DEBUG: _render_panel - project_ids={project_ids}, search_query='{q}', pos={pos}")
+    
+    view = PanelView("aw", actual_user_id, tuple(project_ids), q)
+    old_ids = parse_msg_ids(stt.ask_page_msg_ids)
+    # после рестарта кэш view пуст — узнаём свою панель по сохранённому id
+    edit_id = m.message_id if edit and m.message_id in old_ids else None
+    panel_id = await show_list_panel(st, m.bot, m.chat.id, view, pos, message_id=edit_id)
+    # Старые страницы (в т.ч. поштучные сообщения прежнего формата) и футер — одним deleteMessages
+    await delete_messages(m.bot, m.chat.id, [i for i in old_ids if i != panel_id] + [stt.ask_footer_msg_id])
+    stt.ask_page_msg_ids = str(panel_id)
+    stt.ask_footer_msg_id = None
+    await st.commit()
 
 @router.message(F.text == "❓ ASK‑WIZARD")
 async def ask_open(message: Message):
@@ -580,7 +398,7 @@ async def ask_search_reply(message: Message):
         
         await st.commit()
         
-        await _render_panel(message, st, q=q, page=1, user_id=message.from_user.id if message.from_user else None)
+        await _render_panel(message, st, q=q, user_id=message.from_user.id if message.from_user else None)
         
         # Always include reply keyboard
         chat_on, *_ = await get_chat_flags(st, message.from_user.id)
@@ -588,10 +406,9 @@ async def ask_search_reply(message: Message):
         # await message.answer("...", reply_markup=main_reply_kb(chat_on))
         
         # Delete the prompt message and user's reply message
-        if message.reply_to_message and message.bot:
-            await _safe_delete(message.bot, message.chat.id, message.reply_to_message.message_id)
-        if message.message_id and message.bot:
-            await _safe_delete(message.bot, message.chat.id, message.message_id)
+        if message.bot:
+            prompt_id = message.reply_to_message.message_id if message.reply_to_message else None
+            await _safe_delete(message.bot, message.chat.id, [prompt_id, message.message_id])
 
 @router.callback_query(F.data == "aw:list")
 async def ask_open_list(cb: CallbackQuery):
@@ -612,7 +429,7 @@ async def ask_open_list(cb: CallbackQuery):
             print(f"DEBUG: active_proj.id: {active_proj.id}, active_proj.name: {active_proj.name}")
         
         if cb.message and isinstance(cb.message, Message):
-            await _render_panel(cb.message, st, q=None, page=1, user_id=cb.from_user.id)
+            await _render_panel(cb.message, st, q=None, user_id=cb.from_user.id)
         # Always include reply keyboard
         # Removed temporary "..." message
         # chat_on, *_ = await get_chat_flags(st, cb.from_user.id)
@@ -622,16 +439,12 @@ async def ask_open_list(cb: CallbackQuery):
 
 @router.callback_query(F.data.startswith("aw:page:"))
 async def ask_page(cb: CallbackQuery):
-    if not cb.data:
-        page = 1
-    else:
-        try:
-            page = int(cb.data.split(":", 2)[-1])
-        except Exception:
-            page = 1
+    # aw:page:<page>:<n|p>:<cursor> — курсор (created_at, id) вместо OFFSET
+    pos = parse_page_callback(cb.data or "")
     async with session_scope() as st:
         if cb.message and isinstance(cb.message, Message):
-            await _render_panel(cb.message, st, q=None, page=page, user_id=cb.from_user.id if cb.from_user else None)
+            await _render_panel(cb.message, st, pos=pos, user_id=cb.from_user.id if cb.from_user else None,
+                                edit=True, keep_query=True)
             
         # Always include reply keyboard
         # Removed temporary "..." message
@@ -674,6 +487,13 @@ async def ask_toggle(cb: CallbackQuery):
         _ids_set(stt, current)
         await st.commit()
         
+        # Списочная панель: перерисовать отметки на месте (страница из кэша)
+        if cb.message and isinstance(cb.message, Message):
+            view = panel_view(cb.message.chat.id, cb.message.message_id)
+            if view is not None and view.kind == "aw":
+                await _render_panel(cb.message, st, user_id=cb.from_user.id, edit=True, keep_query=True)
+                return await cb.answer(action_text)
+        
         # Update the inline keyboard of the current message to show the new icon (instant toggle) (Hotfix E)
         if cb.message and isinstance(cb.message, Message) and cb.message.bot:
             # Create updated inline keyboard with new icon
@@ -736,7 +556,8 @@ async def ask_delete(cb: CallbackQuery):
         
         # Rerender current page
         if cb.message and isinstance(cb.message, Message):
-            await _render_panel(cb.message, st, q=None, page=1, user_id=cb.from_user.id if cb.from_user else None)
+            await _render_panel(cb.message, st, user_id=cb.from_user.id if cb.from_user else None,
+                                edit=True, keep_query=True)
             
         # Always include reply keyboard
         # Removed temporary "..." message
@@ -895,7 +716,7 @@ async def ask_clear_search(cb: CallbackQuery):
     
     async with session_scope() as st:
         if cb.message and isinstance(cb.message, Message):
-            await _render_panel(cb.message, st, q=None, page=1)
+            await _render_panel(cb.message, st, q=None, user_id=cb.from_user.id, edit=True)
             
         # Always include reply keyboard
         # Removed temporary "..." message
@@ -1040,21 +861,10 @@ async def answer_delete_execute(cb: CallbackQuery):
         # Delete messages
         if cb.message and isinstance(cb.message, Message) and cb.message.bot:
             try:
-                # Delete the answer message
-                with contextlib.suppress(Exception):
-                    await cb.message.delete()
-                
-                # Explicitly delete the original question upon confirmation
-                q_mid = last_answer.get("question_msg_id")
-                if q_mid:
-                    with contextlib.suppress(Exception):
-                        await cb.message.bot.delete_message(cb.message.chat.id, q_mid)
-                
-                # Delete any ForceReply prompt messages
-                pid = stt.ask_prompt_msg_id
-                if pid:
-                    with contextlib.suppress(Exception):
-                        await cb.message.bot.delete_message(cb.message.chat.id, pid)
+                # Delete the answer, the original question and any ForceReply prompt in one call
+                await delete_messages(cb.message.bot, cb.message.chat.id,
+                                      [cb.message.message_id, last_answer.get("question_msg_id"), stt.ask_prompt_msg_id,
+                                       *(last_answer.get("answer_msg_ids") or [])])
                 
                 # Clear last answer data and prompt message IDs
                 stt.last_answer = None
@@ -1452,9 +1262,9 @@ async def answer_summary(cb: CallbackQuery):
         if last_answer.get("run_id") != run_id:
             return await cb.answer("Нет контекста", show_alert=True)
         
-        # Get the answer text to summarize
-        answer_text = ""
-        if cb.message and isinstance(cb.message, Message):
+        # Get the answer text to summarize (целиком из last_answer — в сообщении может быть только последняя часть)
+        answer_text = last_answer.get("answer_text") or ""
+        if not answer_text and cb.message and isinstance(cb.message, Message):
             answer_text = cb.message.text or cb.message.caption or ""
         
         # Show a message that we're generating summary
@@ -1516,14 +1326,11 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
         return
         
     # FIX 10: Anti-duplicate ASK - check if already processing
-    async with session_scope() as st:
-        stt = await _ensure_user_state(st, msg.from_user.id)
-        # Check if already processing a question (in-flight protection)
-        if hasattr(stt, 'ask_inflight') and stt.ask_inflight:
-            if msg.bot:
-                temp_msg = await msg.answer("Обрабатываю предыдущий запрос...")
-                asyncio.create_task(_auto_delete_message(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0))
-            return
+    if await get_state_backend().get(_ask_inflight_key(msg.from_user.id)) is not None:
+        if msg.bot:
+            temp_msg = await msg.answer("Обрабатываю предыдущий запрос...")
+            schedule_delete(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0)
+        return
     
     # Check both FSM flag and reply-to-message conditions
     data = await state.get_data()
@@ -1563,8 +1370,7 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
         if msg.bot:
             temp_msg = await msg.answer("Включи чат кнопкой внизу или через ASK‑панель.")
             # Авто-удаляем через 3 секунды
-            import asyncio
-            asyncio.create_task(_auto_delete_message(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0))
+            schedule_delete(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0)
         return
 
     # подготовка ответа (одно сообщение, потом редактируем)
@@ -1598,19 +1404,19 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
         if msg.bot:
             temp_msg = await msg.answer("Выбери источники в List.")
             # Авто-удаляем через 3 секунды
-            import asyncio
-            asyncio.create_task(_auto_delete_message(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0))
+            schedule_delete(msg.bot, msg.chat.id, temp_msg.message_id, delay=3.0)
         await msg.bot.edit_message_text(chat_id=prep.chat.id, message_id=prep.message_id,
                                         text="Нет выбранных источников.",
                                         reply_markup=answer_actions_kb("test", saved=False, pinned=False))
         await state.update_data(awaiting_ask_question=False)
         return
 
-    # FIX 10: Set in-flight flag to prevent duplicate processing
-    async with session_scope() as st:
-        stt = await _ensure_user_state(st, msg.from_user.id)
-        stt.ask_inflight = True
-        await st.commit()
+    # FIX 10: Set in-flight flag to prevent duplicate processing (другая реплика могла успеть раньше)
+    if not await get_state_backend().add(_ask_inflight_key(msg.from_user.id), run_id, ASK_INFLIGHT_TTL):
+        await msg.bot.edit_message_text(chat_id=prep.chat.id, message_id=prep.message_id,
+                                        text="Обрабатываю предыдущий запрос...")
+        schedule_delete(msg.bot, prep.chat.id, prep.message_id, delay=3.0)
+        return
 
     # DEBUG ASK start: q=…, src=[…]
     print(f"DEBUG ASK start: q={msg.text} src={selected_ids}")
@@ -1622,12 +1428,13 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
             used = list(selected_ids)
             metadata = {"model": (await get_preferred_model_helper(msg.from_user.id)), "tokens_in": 0, "tokens_out": 0, "duration_ms": 0}
         else:
-            answer_text, used, metadata = await run_llm_pipeline(
-                user_id=msg.from_user.id,
-                selected_artifact_ids=selected_ids,
-                question=msg.text or "",
-                run_id=run_id
-            )
+            async with user_unlocked():
+                answer_text, used, metadata = await run_llm_pipeline(
+                    user_id=msg.from_user.id,
+                    selected_artifact_ids=selected_ids,
+                    question=msg.text or "",
+                    run_id=run_id
+                )
         # Keep ForceReply prompt message as per UX requirement (do not delete)
     except Exception as e:
         # LLM error: keep ForceReply and show warning block
@@ -1645,17 +1452,10 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
         )
         await msg.bot.edit_message_text(chat_id=prep.chat.id, message_id=prep.message_id, text=warn)
         await state.update_data(awaiting_ask_question=False)
-        async with session_scope() as st:
-            stt = await _ensure_user_state(st, msg.from_user.id)
-            stt.ask_inflight = False
-            await st.commit()
         return
     finally:
         # FIX 10: Clear in-flight flag
-        async with session_scope() as st:
-            stt = await _ensure_user_state(st, msg.from_user.id)
-            stt.ask_inflight = False
-            await st.commit()
+        await get_state_backend().pop(_ask_inflight_key(msg.from_user.id))
 
     # Update last_answer with used sources and keep ts
     async with session_scope() as st:
@@ -1672,7 +1472,11 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
             "source_ids": list(used),
             "saved": ctx.get("saved", False),
             "pinned": ctx.get("pinned", False),
-            "ts": ctx.get("ts") or int(time.time()*1000)
+            "ts": ctx.get("ts") or int(time.time()*1000),
+            # tokens_in/out/cached + duration: меряем выигрыш prompt caching на refine/follow-up
+            "run_meta": metadata,
+            # полный ответ — один раз: перерисовка/summary без повторного вызова LLM
+            "answer_text": answer_text,
         })
         stt.last_answer = json.dumps(ctx)
         await st.commit()
@@ -1718,18 +1522,24 @@ async def ask_question_receiver(msg: Message, state: FSMContext):
             short_title = short_title[:18] + " …"
         sources_line = f"📚 Sources: [#{short_title} … id{first_id}]"
 
-    # показать итог и панель
+    # показать итог и панель (длинный ответ — продолжениями или файлом, клавиатура на последней части)
     kb = answer_actions_kb(run_id, saved=False, pinned=False)
-    final_text = answer_text
-    if sources_line:
-        final_text += "\n\n" + sources_line
-    final_text += "\n" + context_line
-    await msg.bot.edit_message_text(
-        chat_id=prep.chat.id,
-        message_id=prep.message_id,
-        text=final_text,
-        reply_markup=kb
+    footer = ("\n\n" + sources_line if sources_line else "") + "\n" + context_line
+    answer_ids = await send_long_answer(
+        msg.bot, prep.chat.id, md_to_tg_html(answer_text) + escape(footer), kb,
+        edit_message_id=prep.message_id, plain=answer_text + footer, file_name=f"{run_id}.md",
     )
+    if len(answer_ids) > 1:
+        async with session_scope() as st:
+            stt = await _ensure_user_state(st, msg.from_user.id)
+            try:
+                ctx = json.loads(stt.last_answer) if stt.last_answer else {}
+            except Exception:
+                ctx = {}
+            if ctx.get("run_id") == run_id:
+                ctx["answer_msg_ids"] = answer_ids
+                stt.last_answer = json.dumps(ctx)
+                await st.commit()
     
     # Ensure reply keyboard is present after final answer
     async with session_scope() as st:
@@ -1754,7 +1564,7 @@ async def run_llm_pipeline(
         Tuple of (response_text, run_id, used_source_ids)
     """
     import time
-    from app.services.retrieval import load_selected_sources
+    from app.services.retrieval import load_selected_sources, pack_sources
     from app.services.prompt_builder import build_system_prompt, build_context_prompt, build_user_prompt
     from app.services.token_budget import calculate_token_budget, allocate_budget_per_source
     from app.services.llm import call_llm_with_retry
@@ -1770,7 +1580,11 @@ async def run_llm_pipeline(
     print(f"DEBUG LLM start: model={user_model} tokens_budget={in_budget}")
     
     # Load selected sources
-    sources, total_tokens = await load_selected_sources(user_id, selected_artifact_ids)
+    sources, total_tokens = await load_selected_sources(user_id, selected_artifact_ids, model=user_model)
+    # Не влезаем в бюджет — крупные источники заменяются их фоновыми резюме
+    sources, pack_stats = pack_sources(sources, in_budget, model=user_model)
+    if pack_stats["summarized"] or pack_stats["truncated"]:
+        print(f"DEBUG LLM pack: tokens {pack_stats['tokens_before']}->{pack_stats['tokens_after']} summarized={pack_stats['summarized']} truncated={pack_stats['truncated']}")
     
     # Build prompts
     system_prompt = build_system_prompt()
@@ -1793,9 +1607,9 @@ async def run_llm_pipeline(
         run_id = f"run-{int(time.time())}-{hash(question) % 10000}"
 
     # Extend metadata
-    metadata = {**metadata, "model": user_model}
+    metadata = {**metadata, "model": user_model, "summarized_sources": pack_stats["summarized"]}
 
     # DEBUG LLM done
-    print(f"DEBUG LLM done: run_id={run_id} used_sources={selected_artifact_ids} len(text)={len(response_text)} duration_ms={metadata.get('duration_ms', 0)}")
+    print(f"DEBUG LLM done: run_id={run_id} used_sources={selected_artifact_ids} len(text)={len(response_text)} duration_ms={metadata.get('duration_ms', 0)} cached={metadata.get('tokens_cached', 0)}")
     
     return response_text, selected_artifact_ids, metadata
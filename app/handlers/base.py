@@ -15,7 +15,9 @@ from html import escape
 
 logger = logging.getLogger(__name__)
 router = Router()
-_pending_clear: dict[int, str] = {}
+# Ожидание подтверждения /memory clear — в state_manager (общий StateBackend), 5 минут
+CLEAR_CONFIRM_STATE = "memory_clear"
+CLEAR_CONFIRM_TIMEOUT = 300
 
 @router.message(Command("start"))
 async def start(message: Message):
@@ -84,6 +86,36 @@ async def set_model(message: Message):
         chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
         await message.answer(f"Модель установлена: {applied}", reply_markup=build_reply_kb(chat_on))
 
+@router.message(Command("chunker"))
+async def set_chunker(message: Message):
+    """Per-project chunking strategy: /chunker structure|token|legacy|default."""
+    from app.db import session_scope
+    from app.handlers.keyboard import main_reply_kb as build_reply_kb
+    from app.services.memory import get_chat_flags
+    from app.chunking import CHUNKERS, resolve_chunker
+    user_id = message.from_user.id if message.from_user else 0
+    parts = (message.text or "").split(maxsplit=1)
+    async with session_scope() as st:
+        proj = await get_active_project(st, user_id)
+        chat_on, *_ = await get_chat_flags(st, user_id)
+        if not proj:
+            return await message.answer("Нет активного проекта. Используйте /project &lt;name&gt;", reply_markup=build_reply_kb(chat_on))
+        names = " | ".join(sorted(CHUNKERS))
+        if len(parts) < 2:
+            current = resolve_chunker(proj)
+            origin = "проект" if proj.chunker else "по умолчанию"
+            return await message.answer(
+                f"Чанкер проекта <b>{escape(proj.name)}</b>: {current} ({origin})\n"
+                f"Использование: /chunker {names} | default\n"
+                "Действует на новые импорты.",
+                reply_markup=build_reply_kb(chat_on))
+        choice = parts[1].strip().lower()
+        if choice != "default" and choice not in CHUNKERS:
+            return await message.answer(f"Неизвестный чанкер. Доступны: {names} | default", reply_markup=build_reply_kb(chat_on))
+        proj.chunker = None if choice == "default" else choice
+        await st.commit()
+        await message.answer(f"Чанкер проекта <b>{escape(proj.name)}</b>: {resolve_chunker(proj)}", reply_markup=build_reply_kb(chat_on))
+
 @router.message(Command("project"))
 async def project_select(message: Message):
     from app.db import session_scope
@@ -298,7 +330,8 @@ async def memory_clear_ask(message: Message):
             chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
             await message.answer("Сначала выберите проект: <code>/project &lt;name&gt;</code>", reply_markup=build_reply_kb(chat_on))
             return
-        _pending_clear[message.from_user.id if message.from_user else 0] = proj.name
+        await state_manager.set_state(message.from_user.id if message.from_user else 0, CLEAR_CONFIRM_STATE,
+                                      {"project": proj.name}, timeout_seconds=CLEAR_CONFIRM_TIMEOUT)
         # Get chat_on flag to rebuild keyboard with correct state
         chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
         await message.answer(f"⚠️ Подтверждение: /memory clear {escape(proj.name)}", reply_markup=build_reply_kb(chat_on))
@@ -318,7 +351,8 @@ async def memory_clear_confirm(message: Message):
             await message.answer("Формат: <code>/memory clear &lt;project&gt;</code>", reply_markup=build_reply_kb(chat_on))
             return
         proj_name = parts[2]
-        expected = _pending_clear.get(message.from_user.id if message.from_user else 0)
+        pending = await state_manager.get_state(message.from_user.id if message.from_user else 0)
+        expected = pending.get("data", {}).get("project") if pending.get("state") == CLEAR_CONFIRM_STATE else None
         if expected != proj_name:
             # Get chat_on flag to rebuild keyboard with correct state
             chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
@@ -332,7 +366,7 @@ async def memory_clear_confirm(message: Message):
             return
         await clear_project(st, proj)
         await st.commit()
-        _pending_clear.pop(message.from_user.id if message.from_user else 0, None)
+        await state_manager.clear_state(message.from_user.id if message.from_user else 0)
         # Get chat_on flag to rebuild keyboard with correct state
         chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
         await message.answer("Память проекта очищена.", reply_markup=build_reply_kb(chat_on))
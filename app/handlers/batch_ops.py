@@ -4,6 +4,7 @@ from app.db import session_scope
 from app.handlers.keyboard import main_reply_kb as build_reply_kb
 from app.services.memory import get_chat_flags, _ensure_user_state
 from app.services.tags import get_presets
+from app.services.state_backend import get_state_backend
 from sqlalchemy import delete
 from app.models import Artifact, artifact_tags, Tag
 from html import escape
@@ -11,8 +12,11 @@ import sqlalchemy as sa
 
 router = Router()
 
-# Cache for batch tag selection (similar to answer_actions.py)
-BATCH_TAG_CACHE: dict[int, set[str]] = {}
+# Batch tag selection lives in the shared state backend (similar to answer_actions.py)
+TAG_PICK_TTL = 3600
+
+def _batch_tags_key(user_id: int) -> str:
+    return f"batch_tags:{user_id}"
 
 @router.callback_query(F.data == "batch:tag")
 async def batch_tag(cb: CallbackQuery):
@@ -35,7 +39,7 @@ async def batch_tag(cb: CallbackQuery):
             return await cb.answer("Invalid batch", show_alert=True)
             
         # Initialize tag cache for this user
-        BATCH_TAG_CACHE[cb.from_user.id if cb.from_user else 0] = set()
+        await get_state_backend().set(_batch_tags_key(cb.from_user.id if cb.from_user else 0), [], ttl=TAG_PICK_TTL)
         
         if cb.message and isinstance(cb.message, Message):
             await cb.message.answer(
@@ -77,13 +81,8 @@ async def batch_tag_toggle(cb: CallbackQuery):
     _, _, user_id_str, tag = parts
     user_id = int(user_id_str)
     
-    cur = BATCH_TAG_CACHE.get(user_id, set())
-    if tag in cur:
-        cur.remove(tag)
-    else:
-        cur.add(tag)
-    BATCH_TAG_CACHE[user_id] = cur
-    await cb.answer(f"{'+' if tag in cur else '-'} {escape(tag)}")
+    added = await get_state_backend().toggle(_batch_tags_key(user_id), tag, ttl=TAG_PICK_TTL)
+    await cb.answer(f"{'+' if added else '-'} {escape(tag)}")
 
 @router.callback_query(F.data.startswith("batch:tagdone:"))
 async def batch_tag_done(cb: CallbackQuery):
@@ -98,7 +97,7 @@ async def batch_tag_done(cb: CallbackQuery):
         return await cb.answer("Invalid data format")
         
     user_id = int(parts[2])
-    tags = sorted(BATCH_TAG_CACHE.get(user_id, set()))
+    tags = sorted(await get_state_backend().get(_batch_tags_key(user_id)) or [])
     
     if not tags:
         return await cb.answer("Не выбрано ни одного тега.", show_alert=True)
@@ -150,7 +149,7 @@ async def batch_tag_done(cb: CallbackQuery):
         chat_on, *_ = await get_chat_flags(st, user_id)
         
         # Clear tag cache
-        BATCH_TAG_CACHE.pop(user_id, None)
+        await get_state_backend().pop(_batch_tags_key(user_id))
         
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer(
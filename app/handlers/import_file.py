@@ -11,24 +11,31 @@ import datetime as dt
 import uuid
 import hashlib
 from html import escape
+from itertools import islice
 from zoneinfo import ZoneInfo
 
 from app.config import settings
 from app.services.memory import get_active_project, _ensure_user_state
-from app.services.artifacts import create_import
+from app.services.artifacts import create_import, chunk_texts, IMPORT_BATCH_DOCS
 from app.storage import save_file
 from app.db import session_scope
 from app.ignore import load_pmignore, iter_text_files
+from app.utils.sniff import decode_sniffed
 from app.models import Tag, artifact_tags
+from app.services.jobs import submit_job, job_handler, JobContext
+from app.services.state_backend import get_state_backend
 
 # Add Berlin timezone
 BERLIN = ZoneInfo("Europe/Berlin")
 
 router = Router()
 
-# Храним "последний документ" на пользователя/чат (fallback, если нет reply)
-# ключ: (chat_id, user_id) -> (file_id, file_name)
-_LAST_DOC: dict[tuple[int, int], tuple[str, str]] = {}
+# Храним "последний документ" на пользователя/чат (fallback, если нет reply) в StateBackend
+# ключ: last_doc:<chat_id>:<user_id> -> [file_id, file_name]
+LAST_DOC_TTL = 24 * 3600
+
+def _last_doc_key(chat_id: int, user_id: int) -> str:
+    return f"last_doc:{chat_id}:{user_id}"
 
 ALLOWED_EXTS = {".txt", ".md", ".json", ".zip"}
 
@@ -93,7 +100,8 @@ async def on_document(message: Message):
     doc = message.document
     if not doc or not message.from_user:
         return
-    _LAST_DOC[(message.chat.id, message.from_user.id)] = (doc.file_id, doc.file_name or "file")
+    await get_state_backend().set(_last_doc_key(message.chat.id, message.from_user.id),
+                                  [doc.file_id, doc.file_name or "file"], ttl=LAST_DOC_TTL)
     
     # Save to database as well
     async with session_scope() as st:
@@ -135,8 +143,7 @@ async def import_document(message: Message):
 
         # 2) Если нет reply — берем последний документ пользователя в этом чате
         if not doc:
-            key = (message.chat.id, message.from_user.id)
-            last = _LAST_DOC.get(key)
+            last = await get_state_backend().get(_last_doc_key(message.chat.id, message.from_user.id))
             if last:
                 file_id, file_name = last
                 # подтягиваем объект файла через get_file, чтобы скачать
@@ -165,8 +172,11 @@ async def import_document(message: Message):
                     chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
                     await message.answer("Файл найден, но расширение не поддерживается. Доступно: .txt .md .json .zip", reply_markup=build_reply_kb(chat_on))
                     return
+                text = decode_sniffed(data)
+                if text is None:
+                    await message.answer("Файл выглядит бинарным — импорт пропущен.")
+                    return
                 uri = await save_file(file_name, data)  # MinIO (может вернуть None, если не настроен)
-                text = data.decode("utf-8", errors="ignore")
                 title = file_name or "import.txt"
                 tags = _parse_tags(message.text)
                 
@@ -202,6 +212,7 @@ async def import_document(message: Message):
                 builder.button(text="🏷 Теги", callback_data=f"imp:tag:{art.id}")
                 builder.button(text="🗑 Удалить", callback_data=f"imp:del:{art.id}")
                 builder.button(text="🔎 Ask this", callback_data=f"imp:ask:{art.id}")
+                builder.button(text="🧾 Summary", callback_data=f"imp:sum:{art.id}")
                 builder.adjust(2)
                 
                 # Get chat_on flag to rebuild keyboard with correct state
@@ -248,8 +259,10 @@ async def import_document(message: Message):
             return
             
         data = file_bytes_io.read()
+        text = decode_sniffed(data)
+        if text is None:
+            return await message.answer("Файл выглядит бинарным — импорт пропущен.")
         uri = await save_file(file_name, data)  # MinIO (публичный URL или None)
-        text = data.decode("utf-8", errors="ignore")
         tags = _parse_tags(message.text)
         
         # Add auto-tags using the new function
@@ -284,6 +297,7 @@ async def import_document(message: Message):
         builder.button(text="🏷 Теги", callback_data=f"imp:tag:{art.id}")
         builder.button(text="🗑 Удалить", callback_data=f"imp:del:{art.id}")
         builder.button(text="🔎 Ask this", callback_data=f"imp:ask:{art.id}")
+        builder.button(text="🧾 Summary", callback_data=f"imp:sum:{art.id}")
         builder.adjust(2)
         
         # Get chat_on flag to rebuild keyboard with correct state
@@ -334,78 +348,91 @@ async def import_zip(message: Message):
     else:
         tags = auto_tags
     
-    # Скачиваем ZIP
-    if not message.bot:
-        # Get chat_on flag to rebuild keyboard with correct state
-        async with session_scope() as st:
-            chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
-        return await message.answer("Ошибка доступа к боту", reply_markup=build_reply_kb(chat_on))
-        
-    tg_file = await message.bot.get_file(doc.file_id)
-    if not tg_file.file_path:
-        # Get chat_on flag to rebuild keyboard with correct state
-        async with session_scope() as st:
-            chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
-        return await message.answer("Не удалось получить путь к файлу", reply_markup=build_reply_kb(chat_on))
-        
-    file_bytes_io = await message.bot.download_file(tg_file.file_path)
-    if not file_bytes_io:
-        # Get chat_on flag to rebuild keyboard with correct state
-        async with session_scope() as st:
-            chat_on, *_ = await get_chat_flags(st, message.from_user.id if message.from_user else 0)
-        return await message.answer("Не удалось скачать файл", reply_markup=build_reply_kb(chat_on))
-        
-    data = file_bytes_io.read()
-    
-    # Сохраняем временно
-    tmp = Path("/tmp/pm_zip")
-    if tmp.exists():
-        import shutil
-        shutil.rmtree(tmp)
-
-    tmp.mkdir(parents=True, exist_ok=True)
-    
-    # Сохраняем ZIP
-    zip_path = tmp / doc.file_name
-    with open(zip_path, "wb") as f:
-        f.write(data)
-    
-    # Распаковываем
-    import zipfile
-    with zipfile.ZipFile(zip_path) as z:
-        z.extractall(tmp)
-    
-    # Загружаем .pmignore
-    spec = load_pmignore(tmp)
-    
-    # Импортируем текстовые файлы
+    # Проект фиксируем в момент постановки задачи
     async with session_scope() as st:
         proj = await get_active_project(st, message.from_user.id if message.from_user else 0)
         if not proj:
             return await message.answer("Сначала выберите проект: <code>/project &lt;name&gt;</code>")
-        
-        imported = 0
-        for rel, text in iter_text_files(tmp, spec):
-            title = f"{escape(doc.file_name)}:{rel}"
-            await create_import(
-                st, proj,
-                title=title,
-                text=text,
-                chunk_size=settings.chunk_size,
-                overlap=settings.chunk_overlap,
-                tags=tags
-            )
-            imported += 1
-        await st.commit()
-    
-    await message.answer(f"Импорт ZIP завершён: {imported} файлов.\nТег: <code>{escape(batch_tag)}</code>")
+        project_id = proj.id
+
+    # Скачивание/распаковка/импорт — в фоне, хендлер отвечает сразу
+    await submit_job(
+        message.bot, message.chat.id, message.from_user.id if message.from_user else 0,
+        "import_zip",
+        {"file_id": doc.file_id, "file_name": doc.file_name, "tags": tags,
+         "batch_tag": batch_tag, "project_id": project_id},
+        title=f"импорт {escape(doc.file_name)}",
+    )
+
+@job_handler("import_zip", max_attempts=3)
+async def _import_zip_job(ctx: JobContext):
+    import shutil
+    import tempfile
+    import zipfile
+    from app.models import Project
+
+    p = ctx.payload
+    file_name = p["file_name"]
+    if not ctx.bot:
+        raise RuntimeError("bot is not available in job worker")
+    await ctx.progress("скачиваю архив", force=True)
+    tg_file = await ctx.bot.get_file(p["file_id"])
+    if not tg_file.file_path:
+        raise RuntimeError("Не удалось получить путь к файлу")
+    file_bytes_io = await ctx.bot.download_file(tg_file.file_path)
+    if not file_bytes_io:
+        raise RuntimeError("Не удалось скачать файл")
+    data = file_bytes_io.read()
+
+    # Отдельный каталог на задачу — параллельные импорты не затирают друг друга
+    tmp = Path(tempfile.mkdtemp(prefix=f"pm_zip_{ctx.job_id}_"))
+    try:
+        zip_path = tmp / "archive.zip"
+        zip_path.write_bytes(data)
+        src = tmp / "src"
+        with zipfile.ZipFile(zip_path) as z:
+            z.extractall(src)
+
+        # Загружаем .pmignore
+        spec = load_pmignore(src)
+
+        # Импортируем текстовые файлы; коммит один в конце — повтор задачи не даёт дублей
+        async with session_scope() as st:
+            proj = await st.get(Project, p["project_id"])
+            if not proj:
+                raise RuntimeError("Проект удалён")
+            imported = 0
+            files = iter_text_files(src, spec)
+            # пачками: один encode_ordinary_batch в пуле потоков на IMPORT_BATCH_DOCS файлов
+            while batch := list(islice(files, IMPORT_BATCH_DOCS)):
+                chunked = await chunk_texts([text for _, text in batch], settings.chunk_size, settings.chunk_overlap,
+                                            names=[rel for rel, _ in batch], project=proj)
+                for (rel, _), (text, spans) in zip(batch, chunked):
+                    title = f"{escape(file_name)}:{rel}"
+                    await create_import(
+                        st, proj,
+                        title=title,
+                        text=text,
+                        chunk_size=settings.chunk_size,
+                        overlap=settings.chunk_overlap,
+                        tags=p["tags"],
+                        spans=spans,
+                    )
+                    imported += 1
+                    if imported % 20 == 0:
+                        await ctx.progress(f"импортировано {imported} файлов…")
+            await st.commit()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    await ctx.send(f"Импорт ZIP завершён: {imported} файлов.\nТег: <code>{escape(p['batch_tag'])}</code>")
+    return {"imported": imported}
 
 # --- экспортируем для меню ---
 async def import_last_for_user(message: Message, st: AsyncSession, tags: list[str] | None) -> bool:
     if not message.from_user:
         return False
-    key = (message.chat.id, message.from_user.id)
-    last = _LAST_DOC.get(key)
+    last = await get_state_backend().get(_last_doc_key(message.chat.id, message.from_user.id))
     if not last:
         return False
     file_id, file_name = last
@@ -449,7 +476,8 @@ async def import_last_for_user(message: Message, st: AsyncSession, tags: list[st
         import zipfile
         import tempfile
         from app.ignore import load_pmignore, iter_text_files
-        from app.utils.zipfix import fix_zip_name, decode_text_bytes
+        from app.utils.zipfix import fix_zip_name
+        from app.utils.sniff import read_text_file
         
         try:
             # Create temporary directory and file
@@ -492,8 +520,9 @@ async def import_last_for_user(message: Message, st: AsyncSession, tags: list[st
                             
                         # Read and decode content with proper encoding detection
                         try:
-                            raw_data = p.read_bytes()
-                            content = decode_text_bytes(raw_data)
+                            content = read_text_file(p)
+                            if content is None:
+                                continue
                             
                             title = f"{escape(file_name)}:{escape(fixed_rel_path)}"
                             await create_import(
@@ -518,8 +547,11 @@ async def import_last_for_user(message: Message, st: AsyncSession, tags: list[st
             return True
     else:
         # Handle regular text files
+        text = decode_sniffed(data)
+        if text is None:
+            await message.answer("Файл выглядит бинарным — импорт пропущен.")
+            return True
         uri = await save_file(file_name, data)
-        text = data.decode("utf-8", errors="ignore")
         art = await create_import(
             st, proj,
             title=file_name, text=text,
@@ -540,6 +572,7 @@ async def import_last_for_user(message: Message, st: AsyncSession, tags: list[st
         builder.button(text="🏷 Теги", callback_data=f"imp:tag:{art.id}")
         builder.button(text="🗑 Удалить", callback_data=f"imp:del:{art.id}")
         builder.button(text="🔎 Ask this", callback_data=f"imp:ask:{art.id}")
+        builder.button(text="🧾 Summary", callback_data=f"imp:sum:{art.id}")
         builder.adjust(2)
         
         await message.answer("\n".join(lines), reply_markup=builder.as_markup())
@@ -0,0 +1,41 @@
+from __future__ import annotations
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message
+from html import escape
+from app.db import session_scope
+from app.services.jobs import cancel_job, list_jobs
+
+router = Router()
+
+_STATUS_ICON = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌", "cancelled": "⏹"}
+
+@router.message(Command("jobs"))
+async def jobs_list(message: Message):
+    async with session_scope() as st:
+        items = await list_jobs(st, message.from_user.id if message.from_user else 0)
+    if not items:
+        return await message.answer("Фоновых задач нет.")
+    lines = ["<b>Фоновые задачи</b>"]
+    for j in items:
+        icon = _STATUS_ICON.get(j.status, "•")
+        tail = f" — {escape(j.progress)}" if j.progress and j.status == "running" else ""
+        if j.status == "failed" and j.error:
+            tail = f" — {escape(j.error[:80])}"
+        lines.append(f"{icon} #{j.id} {j.kind} ({j.status}, попыток {j.attempts}/{j.max_attempts}){tail}")
+    await message.answer("\n".join(lines))
+
+@router.callback_query(F.data.startswith("job:cancel:"))
+async def job_cancel_cb(cb: CallbackQuery):
+    if not cb.data:
+        return await cb.answer("Invalid data")
+    job_id = int(cb.data.split(":")[-1])
+    status = await cancel_job(job_id, cb.from_user.id if cb.from_user else 0)
+    if status is None:
+        return await cb.answer("Задача уже завершена", show_alert=True)
+    if status == "cancelled" and cb.message and isinstance(cb.message, Message):
+        try:
+            await cb.message.edit_text(f"⏹ Job #{job_id} отменён")
+        except Exception:
+            pass
+    await cb.answer("Отменяю…" if status == "running" else "Отменено")
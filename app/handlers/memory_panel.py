@@ -13,7 +13,9 @@ from app.db import session_scope
 from app.models import Artifact, Project, Tag, artifact_tags
 from app.services.memory import get_active_project, _ensure_user_state, get_chat_flags
 from app.handlers.keyboard import main_reply_kb
-from app.ui import show_panel
+from app.ui import show_panel, PanelSpec, register_panel, show_list_panel, parse_page_callback
+from app.services.panel_cache import PanelPos, PanelView, panel_view
+from app.utils.tg import delete_messages, parse_msg_ids
 from app.services.artifacts import create_import
 
 router = Router(name="memory_panel")
@@ -73,18 +75,41 @@ async def memory_open(message: Message):
             
         await message.answer("Memory панель:", reply_markup=_memory_kb())
 
-# List artifacts with pagination
+def _memory_where(view: PanelView):
+    return Artifact.project_id.in_(view.project_ids)
+
+MEMORY_PANEL = register_panel(PanelSpec(
+    kind="mem",
+    where=_memory_where,
+    title=lambda view: "<b>Memory — записи</b>",
+    page_cb="mem:list",
+    selected_mark="🧺",
+))
+
+async def _rerender_memory_panel(cb: CallbackQuery, st, pos: PanelPos | None = None) -> bool:
+    """Re-render the panel the callback came from in place; False if cb.message is not a Memory panel."""
+    if not (cb.message and isinstance(cb.message, Message) and cb.message.bot):
+        return False
+    view = panel_view(cb.message.chat.id, cb.message.message_id)
+    if view is None or view.kind != "mem":
+        return False
+    await show_list_panel(st, cb.message.bot, cb.message.chat.id, view, pos, message_id=cb.message.message_id)
+    return True
+
+# List artifacts with keyset pagination: one message per page, page flips edit it in place
 @router.callback_query(F.data.startswith("mem:list:"))
 async def memory_list(cb: CallbackQuery):
     if not cb.from_user or not cb.data:
         return await cb.answer("Invalid user")
     
-    try:
-        page = int(cb.data.split(":")[2])
-    except (IndexError, ValueError):
-        page = 1
+    # mem:list:<page>:<n|p>:<cursor> — курсор (created_at, id) вместо OFFSET
+    pos = parse_page_callback(cb.data)
     
     async with session_scope() as st:
+        # Листание уже открытой панели: view в кэше — без чтения UserState/проекта
+        if await _rerender_memory_panel(cb, st, pos):
+            return await cb.answer()
+
         proj = await get_active_project(st, cb.from_user.id)
         if not proj:
             # Always include reply keyboard
@@ -92,120 +117,25 @@ async def memory_list(cb: CallbackQuery):
             if cb.message and isinstance(cb.message, Message):
                 await cb.message.answer("Нет активного проекта", reply_markup=main_reply_kb(chat_on))
             return await cb.answer("Нет активного проекта")
-            
-        page_size = 5  # Changed to 5 items per page as per SPEC v2
-        offset = (page - 1) * page_size
         
-        # Get artifacts with their tags using selectinload to avoid duplicates
-        stmt = (
-            select(Artifact)
-            .options(selectinload(Artifact.tags))
-            .where(Artifact.project_id == proj.id)
-            .order_by(Artifact.created_at.desc())
-            .offset(offset)
-            .limit(page_size)
-        )
-        result = await st.execute(stmt)
-        artifacts = result.scalars().all()
-        
-        # Anti-duplication: remove duplicates by ID
-        seen = set()
-        unique_artifacts = []
-        for art in artifacts:
-            if art.id not in seen:
-                seen.add(art.id)
-                unique_artifacts.append(art)
-        artifacts = unique_artifacts
-        
-        # Get user state to check selected artifacts
         stt = await _ensure_user_state(st, cb.from_user.id)
-        selected_ids = set()
-        if stt.selected_artifact_ids:
-            try:
-                selected_ids = {int(id_str.strip()) for id_str in stt.selected_artifact_ids.split(',') if id_str.strip()}
-            except ValueError:
-                pass
-        
-        # Send each artifact as a separate message with its own inline keyboard
         if cb.message and isinstance(cb.message, Message) and cb.message.bot:
-            # Delete previous messages if this is a pagination action
-            if stt.memory_page_msg_ids:
-                try:
-                    msg_ids = [int(id_str) for id_str in stt.memory_page_msg_ids.split(',') if id_str.strip()]
-                    for msg_id in msg_ids:
-                        await cb.message.bot.delete_message(chat_id=cb.message.chat.id, message_id=msg_id)
-                except Exception:
-                    pass  # Ignore errors when deleting messages
-            
-            # Delete previous footer message if it exists
-            if stt.memory_footer_msg_id:
-                try:
-                    await cb.message.bot.delete_message(chat_id=cb.message.chat.id, message_id=stt.memory_footer_msg_id)
-                except Exception:
-                    pass  # Ignore errors when deleting messages
-            
-            # Send new messages
-            sent_msg_ids = []
-            for art in artifacts:
-                # Create artifact text line
-                tag_names = [t.name for t in art.tags] if art.tags else []
-                tags_str = ""
-                if tag_names:
-                    tags_str = " [" + " ".join(escape(tag) for tag in tag_names[:3]) + "]"
-                title = escape((art.title or str(art.id))[:80])
-                created_at = art.created_at.strftime("%Y-%m-%d") if art.created_at else ""
-                text_line = f"{title}{tags_str} (id {art.id}{', ' + created_at if created_at else ''})"
-                
-                # Create inline keyboard for this artifact
-                builder = InlineKeyboardBuilder()
-                toggle_icon = "🧺" if art.id in selected_ids else "➕"
-                builder.button(text=toggle_icon, callback_data=f"mem:toggle:{art.id}")
-                builder.button(text="🗑", callback_data=f"mem:delete:{art.id}")
-                builder.adjust(2)
-                
-                # Send message for this artifact
-                sent_msg = await cb.message.bot.send_message(
-                    chat_id=cb.message.chat.id,
-                    text=text_line,
-                    reply_markup=builder.as_markup()
-                )
-                sent_msg_ids.append(str(sent_msg.message_id))
-            
-            # Store message IDs for future pagination
-            stt.memory_page_msg_ids = ",".join(sent_msg_ids) if sent_msg_ids else None
-            
-            # Send pagination footer
-            # Get total count for pagination
-            count_stmt = select(func.count(Artifact.id)).where(Artifact.project_id == proj.id)
-            count_result = await st.execute(count_stmt)
-            total_count = count_result.scalar_one_or_none() or 0
-            total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
-            
-            if total_pages > 1:
-                footer_builder = InlineKeyboardBuilder()
-                if page > 1:
-                    footer_builder.button(text="⬅️ Назад", callback_data=f"mem:list:{page-1}")
-                footer_builder.button(text=f"Стр. {page}/{total_pages}", callback_data="mem:noop")
-                if page < total_pages:
-                    footer_builder.button(text="Далее ➡️", callback_data=f"mem:list:{page+1}")
-                footer_builder.adjust(3)
-                
-                footer_msg = await cb.message.bot.send_message(
-                    chat_id=cb.message.chat.id,
-                    text="Пагинация:",
-                    reply_markup=footer_builder.as_markup()
-                )
-                # Store footer message ID
-                stt.memory_footer_msg_id = footer_msg.message_id
-            else:
-                stt.memory_footer_msg_id = None
-            
+            bot, chat_id = cb.message.bot, cb.message.chat.id
+            old_ids = parse_msg_ids(stt.memory_page_msg_ids)
+            view = PanelView("mem", cb.from_user.id, (proj.id,), None)
+            # после рестарта кэш view пуст — узнаём свою панель по сохранённому id
+            edit_id = cb.message.message_id if cb.message.message_id in old_ids else None
+            panel_id = await show_list_panel(st, bot, chat_id, view, pos, message_id=edit_id)
+            # Старые страницы (в т.ч. поштучные сообщения прежнего формата) и футер — одним deleteMessages
+            await delete_messages(bot, chat_id, [i for i in old_ids if i != panel_id] + [stt.memory_footer_msg_id])
+            stt.memory_page_msg_ids = str(panel_id)
+            stt.memory_footer_msg_id = None
             await st.commit()
             
-        # Always include reply keyboard
-        chat_on, *_ = await get_chat_flags(st, cb.from_user.id)
-        if cb.message and isinstance(cb.message, Message):
-            await cb.message.answer("...", reply_markup=main_reply_kb(chat_on))
+            if edit_id is None:
+                # Always include reply keyboard
+                chat_on, *_ = await get_chat_flags(st, cb.from_user.id)
+                await cb.message.answer("...", reply_markup=main_reply_kb(chat_on))
     await cb.answer()
 
 # Show memory summary
@@ -566,6 +496,10 @@ async def memory_delete(cb: CallbackQuery):
         deleted_count = result.rowcount
         await st.commit()
         
+        # Удаление из списочной панели — перерисовать ту же страницу на месте
+        if await _rerender_memory_panel(cb, st):
+            return await cb.answer("Удалено")
+        
         lines = [
             "<b>Memory — запись удалена</b>",
             f"Удалено записей: {deleted_count}",
@@ -891,6 +825,10 @@ async def memory_toggle(cb: CallbackQuery):
             
         await st.commit()
         
+        # Списочная панель: отметки перерисовываются из кэша страницы (без запроса списка)
+        if await _rerender_memory_panel(cb, st):
+            return await cb.answer(action_text)
+        
         # Update the inline keyboard of the current message to show the new icon
         if cb.message and isinstance(cb.message, Message) and cb.message.bot:
             # Create updated inline keyboard with new icon
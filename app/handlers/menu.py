@@ -357,7 +357,12 @@ async def wizard_import(cb: CallbackQuery):
                 await cb.message.answer(f"Ошибка при импорте ZIP: {str(e)}", reply_markup=build_reply_kb(chat_on))
                 return await cb.answer()
 
-        text = data.decode("utf-8", errors="ignore")
+        from app.utils.sniff import decode_sniffed
+        text = decode_sniffed(data)
+        if text is None:
+            if cb.message and isinstance(cb.message, Message):
+                await cb.message.answer("Файл выглядит бинарным — импорт пропущен.")
+            return await cb.answer()
         art = await create_import(st, proj, title=stt.last_doc_name or "import.txt", text=text,
                                 chunk_size=settings.chunk_size, overlap=settings.chunk_overlap,
                                 tags=extra_tags)
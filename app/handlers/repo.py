@@ -2,8 +2,10 @@ from __future__ import annotations
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ForceReply, Message
 from app.db import session_scope
-from app.repo import repo_add, repo_list, repo_sync, repo_remove
+from app.repo import repo_add, repo_list, repo_sync, repo_sync_all, repo_remove
 from app.config import settings
+from app.services.jobs import submit_job, job_handler, JobContext
+from html import escape
 
 router = Router()
 
@@ -11,6 +13,8 @@ def repo_menu_kb():
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="➕ Add", callback_data="repo:add"),
         InlineKeyboardButton(text="📜 List", callback_data="repo:list"),
+    ], [
+        InlineKeyboardButton(text="🔄 Sync all", callback_data="repo:syncall"),
     ]])
 
 @router.callback_query(F.data == "repo:open")
@@ -33,8 +37,12 @@ async def repo_add_reply(message: Message):
         return await message.answer("Нужно: <alias> <url> [branch]")
     alias, url, *rest = parts
     branch = rest[0] if rest else "main"
+    from app.services.memory import get_active_project
     async with session_scope() as st:
-        await repo_add(st, message.from_user.id if message.from_user else 0, alias, url, branch)
+        # содержимое репозитория индексируется в активный на момент добавления проект
+        proj = await get_active_project(st, message.from_user.id if message.from_user else 0)
+        await repo_add(st, message.from_user.id if message.from_user else 0, alias, url, branch,
+                       project_id=proj.id if proj else None)
         await st.commit()
     await message.answer(f"Репозиторий добавлен: {alias} ({branch})")
 
@@ -52,26 +60,67 @@ async def repo_list_open(cb: CallbackQuery):
             InlineKeyboardButton(text="Sync", callback_data=f"repo:sync:{r.alias}"),
             InlineKeyboardButton(text="Remove", callback_data=f"repo:rm:{r.alias}"),
         ])
+    rows.append([InlineKeyboardButton(text="🔄 Sync all", callback_data="repo:syncall")])
     if cb.message and isinstance(cb.message, Message):
         await cb.message.answer("Репозитории:", reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
     await cb.answer()
 
 @router.callback_query(F.data.startswith("repo:sync:"))
 async def repo_sync_cb(cb: CallbackQuery):
-    from app.handlers.keyboard import main_reply_kb as build_reply_kb
-    from app.services.memory import get_chat_flags
     if not cb.data:
         return await cb.answer("Invalid data")
     alias = cb.data.split(":")[-1]
+    user_id = cb.from_user.id if cb.from_user else 0
+    if cb.message and isinstance(cb.message, Message):
+        job_id = await submit_job(cb.bot, cb.message.chat.id, user_id,
+                                  "repo_sync", {"alias": alias}, title=f"sync {alias}",
+                                  dedupe_key=f"repo:{user_id}:{alias}")
+        if job_id is None:
+            return await cb.answer("Синк уже идёт")
+    await cb.answer("Синк поставлен в очередь")
+
+@router.callback_query(F.data == "repo:syncall")
+async def repo_sync_all_cb(cb: CallbackQuery):
+    user_id = cb.from_user.id if cb.from_user else 0
+    if cb.message and isinstance(cb.message, Message):
+        job_id = await submit_job(cb.bot, cb.message.chat.id, user_id,
+                                  "repo_sync_all", {}, title="sync всех репозиториев",
+                                  dedupe_key=f"repo_all:{user_id}")
+        if job_id is None:
+            return await cb.answer("Синк уже идёт")
+    await cb.answer("Синк всех репозиториев поставлен в очередь")
+
+@job_handler("repo_sync_all", max_attempts=1)
+async def _repo_sync_all_job(ctx: JobContext):
+    from app.handlers.keyboard import main_reply_kb as build_reply_kb
+    from app.services.memory import get_chat_flags
     token = getattr(settings, "github_token", None)
+    await ctx.progress("запуск", force=True)
+    results = await repo_sync_all(ctx.user_id, token=token, progress=ctx.progress,
+                                  force=bool(ctx.payload.get("force")))
+    if not results:
+        await ctx.send("Список пуст. Нажми ➕ Add.")
+        return {"repos": 0}
+    lines = [f"<b>{escape(alias)}</b>: {escape(status[:200])}" for alias, status in results]
     async with session_scope() as st:
-        out = await repo_sync(st, cb.from_user.id if cb.from_user else 0, alias, token=token)
+        chat_on, *_ = await get_chat_flags(st, ctx.user_id)
+    await ctx.send("🔄 Sync all\n" + "\n".join(lines), reply_markup=build_reply_kb(chat_on))
+    return {"repos": len(results)}
+
+@job_handler("repo_sync", max_attempts=2)
+async def _repo_sync_job(ctx: JobContext):
+    from app.handlers.keyboard import main_reply_kb as build_reply_kb
+    from app.services.memory import get_chat_flags
+    alias = ctx.payload["alias"]
+    token = getattr(settings, "github_token", None)
+    await ctx.progress(f"git sync {alias}", force=True)
+    async with session_scope() as st:
+        out = await repo_sync(st, ctx.user_id, alias, token=token, progress=ctx.progress)
         await st.commit()
         # Get chat_on flag to rebuild keyboard with correct state
-        chat_on, *_ = await get_chat_flags(st, cb.from_user.id if cb.from_user else 0)
-    if cb.message and isinstance(cb.message, Message):
-        await cb.message.answer(f"<code>{out[:3500]}</code>", reply_markup=build_reply_kb(chat_on))
-    await cb.answer()
+        chat_on, *_ = await get_chat_flags(st, ctx.user_id)
+    await ctx.send(f"<code>{escape(out[:3500])}</code>", reply_markup=build_reply_kb(chat_on))
+    return {"alias": alias}
 
 @router.callback_query(F.data.startswith("repo:rm:"))
 async def repo_rm_cb(cb: CallbackQuery):
@@ -4,7 +4,9 @@ from aiogram.types import Message, BufferedInputFile
 from aiogram.filters import Command
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.db import get_session
+from app.db import get_session, session_scope
+from app.models import Project
+from app.services.jobs import submit_job, job_handler, JobContext
 from app.services.memory import get_active_project
 from app.services.artifacts import create_import, get_or_create_project
 from app.storage import save_file, load_file
@@ -193,17 +195,36 @@ async def generate_zip_archive(message: Message, session: AsyncSession = get_ses
             tags_part = remaining_text.split("tags", 1)[1].strip()
             tags = [t.strip() for t in tags_part.split(',') if t.strip()]
             
-        await message.answer("Generating archive files...")
+        await submit_job(
+            message.bot, message.chat.id, message.from_user.id, "gen_zip",
+            {"project_id": proj.id, "task": task_description, "tags": tags},
+            title="генерация архива",
+        )
         
+    except Exception as e:
+        logger.error(f"Error generating ZIP: {e}")
+        await message.answer(f"Error generating ZIP: {str(e)}")
+
+@job_handler("gen_zip", max_attempts=2)
+async def _gen_zip_job(ctx: JobContext):
+    task_description = ctx.payload["task"]
+    tags = ctx.payload.get("tags") or []
+    async with session_scope() as st:
+        proj = await st.get(Project, ctx.payload["project_id"])
+        if not proj:
+            raise RuntimeError("Project not found")
+            
+        await ctx.progress("gathering context", force=True)
         # Gather project context
-        context_chunks = await gather_context(st, proj, user_id=message.from_user.id, max_chunks=settings.project_max_chunks)
+        context_chunks = await gather_context(st, proj, user_id=ctx.user_id, max_chunks=settings.project_max_chunks)
         
+        await ctx.progress("generating files")
         # Generate files using AI
         generated_files = await generate_zip_files(task_description, context_chunks, tags)
         
         if not generated_files:
-            await message.answer("Failed to generate files")
-            return
+            await ctx.send("Failed to generate files")
+            return {"files": 0}
             
         # Create ZIP archive
         zip_data = make_zip(generated_files)
@@ -228,24 +249,22 @@ async def generate_zip_archive(message: Message, session: AsyncSession = get_ses
         
         await st.commit()
         
-        # Send ZIP file as document
-        zip_file = BufferedInputFile(zip_data, filename=zip_filename)
-        
-        tags_str = ', '.join(tags) if tags else 'none'
-        caption = (
-            f"Generated archive for project <b>{escape(proj.name)}</b>\n\n"
-            f"Task: {escape(task_description)}\n"
-            f"Files: {len(generated_files)}\n"
-            f"Tags: {tags_str}\n"
-            f"URI: {zip_uri}\n\n"
-            f"Files:\n{files_list}"
-        )
-        
-        await message.answer_document(zip_file, caption=caption)
-        
-    except Exception as e:
-        logger.error(f"Error generating ZIP: {e}")
-        await message.answer(f"Error generating ZIP: {str(e)}")
+    # Send ZIP file as document
+    zip_file = BufferedInputFile(zip_data, filename=zip_filename)
+    
+    tags_str = ', '.join(tags) if tags else 'none'
+    caption = (
+        f"Generated archive for project <b>{escape(proj.name)}</b>\n\n"
+        f"Task: {escape(task_description)}\n"
+        f"Files: {len(generated_files)}\n"
+        f"Tags: {tags_str}\n"
+        f"URI: {zip_uri}\n\n"
+        f"Files:\n{files_list}"
+    )
+    
+    if ctx.bot and ctx.chat_id:
+        await ctx.bot.send_document(ctx.chat_id, zip_file, caption=caption[:1024])
+    return {"files": len(generated_files), "uri": zip_uri}
 
 @router.message(Command("genfile"))
 async def generate_single_file_handler(message: Message, session: AsyncSession = get_session()):
@@ -283,10 +302,28 @@ async def generate_single_file_handler(message: Message, session: AsyncSession =
             
         task_description = desc_parts[1].strip()
         
-        await message.answer(f"Generating file {file_path}...")
+        await submit_job(
+            message.bot, message.chat.id, message.from_user.id, "gen_file",
+            {"project_id": proj.id, "path": file_path, "task": task_description},
+            title=f"генерация {escape(file_path)}",
+        )
         
+    except Exception as e:
+        logger.error(f"Error generating file: {e}")
+        await message.answer(f"Error generating file: {str(e)}")
+
+@job_handler("gen_file", max_attempts=2)
+async def _gen_file_job(ctx: JobContext):
+    file_path = ctx.payload["path"]
+    task_description = ctx.payload["task"]
+    async with session_scope() as st:
+        proj = await st.get(Project, ctx.payload["project_id"])
+        if not proj:
+            raise RuntimeError("Project not found")
+            
+        await ctx.progress(f"generating {file_path}", force=True)
         # Gather project context
-        context_chunks = await gather_context(st, proj, user_id=message.from_user.id, max_chunks=settings.project_max_chunks)
+        context_chunks = await gather_context(st, proj, user_id=ctx.user_id, max_chunks=settings.project_max_chunks)
         
         # Generate file content using AI
         file_content = await generate_single_file(file_path, task_description, context_chunks)
@@ -310,25 +347,23 @@ async def generate_single_file_handler(message: Message, session: AsyncSession =
         
         await st.commit()
         
-        # Send file as document
-        file_doc = BufferedInputFile(
-            file_content.encode('utf-8'), 
-            filename=file_path.split('/')[-1]
-        )
-        
-        caption = (
-            f"Generated file for project <b>{escape(proj.name)}</b>\n\n"
-            f"Path: {escape(file_path)}\n"
-            f"Task: {escape(task_description)}\n"
-            f"Size: {len(file_content)} characters\n"
-            f"URI: {file_uri}"
-        )
-        
-        await message.answer_document(file_doc, caption=caption)
-        
-    except Exception as e:
-        logger.error(f"Error generating file: {e}")
-        await message.answer(f"Error generating file: {str(e)}")
+    # Send file as document
+    file_doc = BufferedInputFile(
+        file_content.encode('utf-8'), 
+        filename=file_path.split('/')[-1]
+    )
+    
+    caption = (
+        f"Generated file for project <b>{escape(proj.name)}</b>\n\n"
+        f"Path: {escape(file_path)}\n"
+        f"Task: {escape(task_description)}\n"
+        f"Size: {len(file_content)} characters\n"
+        f"URI: {file_uri}"
+    )
+    
+    if ctx.bot and ctx.chat_id:
+        await ctx.bot.send_document(ctx.chat_id, file_doc, caption=caption)
+    return {"path": file_path, "uri": file_uri}
 
 @router.message(Command("diffzip"), F.reply_to_message)
 async def diff_zip_archives(message: Message, session: AsyncSession = get_session()):
@@ -349,30 +384,44 @@ async def diff_zip_archives(message: Message, session: AsyncSession = get_sessio
             await message.answer("Need to reply with /diffzip command to a message with ZIP file")
             return
             
-        await message.answer("Comparing archives...")
-        
-        # Download new ZIP
-        if not message.bot:
-            await message.answer("Bot access error")
-            return
-            
-        file = await message.bot.get_file(doc.file_id)
-        if not file.file_path:
-            await message.answer("Could not get file path")
-            return
-            
-        file_bytes_io = await message.bot.download_file(file.file_path)
-        if not file_bytes_io:
-            await message.answer("Could not download file")
-            return
-            
-        new_zip_data = file_bytes_io.read()
+        await submit_job(
+            message.bot, message.chat.id, message.from_user.id, "diff_zip",
+            {"project_id": proj.id, "file_id": doc.file_id, "file_name": doc.file_name},
+            title=f"сравнение {escape(doc.file_name)}",
+        )
         
-        # Validate new ZIP
-        is_valid, error_msg = validate_zip_file(new_zip_data)
-        if not is_valid:
-            await message.answer(f"Error: {error_msg}")
-            return
+    except Exception as e:
+        logger.error(f"Error comparing ZIP archives: {e}")
+        await message.answer(f"Error comparing archives: {str(e)}")
+
+@job_handler("diff_zip", max_attempts=2)
+async def _diff_zip_job(ctx: JobContext):
+    file_name = ctx.payload["file_name"]
+    if not ctx.bot:
+        raise RuntimeError("Bot access error")
+    await ctx.progress("downloading archive", force=True)
+    
+    # Download new ZIP
+    file = await ctx.bot.get_file(ctx.payload["file_id"])
+    if not file.file_path:
+        raise RuntimeError("Could not get file path")
+        
+    file_bytes_io = await ctx.bot.download_file(file.file_path)
+    if not file_bytes_io:
+        raise RuntimeError("Could not download file")
+        
+    new_zip_data = file_bytes_io.read()
+    
+    # Validate new ZIP
+    is_valid, error_msg = validate_zip_file(new_zip_data)
+    if not is_valid:
+        await ctx.send(f"Error: {error_msg}")
+        return {"error": error_msg}
+        
+    async with session_scope() as st:
+        proj = await st.get(Project, ctx.payload["project_id"])
+        if not proj:
+            raise RuntimeError("Project not found")
             
         # Find the latest ZIP/snapshot artifact
         artifacts = await list_artifacts(st, proj, kinds={'importzip', 'snapshot', 'blob'})
@@ -384,22 +433,23 @@ async def diff_zip_archives(message: Message, session: AsyncSession = get_sessio
                 break
                 
         if not latest_zip_artifact or not latest_zip_artifact.uri:
-            await message.answer("No previous archive found for comparison")
-            return
+            await ctx.send("No previous archive found for comparison")
+            return {"compared": False}
             
         # Download old ZIP from MinIO
         old_zip_key = latest_zip_artifact.uri.split('/')[-1]  # Extract key from URI
         old_zip_data = await load_file(old_zip_key)
         
         if not old_zip_data:
-            await message.answer("Could not load previous archive")
-            return
+            await ctx.send("Could not load previous archive")
+            return {"compared": False}
             
+        await ctx.progress("comparing archives")
         # Generate diff
         summary, diff_details = diff_archives(old_zip_data, new_zip_data)
         
         # Create full diff text
-        full_diff = f"Comparison between {escape(latest_zip_artifact.title)} and {escape(doc.file_name)}\n\n"
+        full_diff = f"Comparison between {escape(latest_zip_artifact.title)} and {escape(file_name)}\n\n"
         full_diff += summary + "\n\n"
         full_diff += "DETAILED DIFF:\n" + "="*50 + "\n"
         
@@ -409,11 +459,12 @@ async def diff_zip_archives(message: Message, session: AsyncSession = get_sessio
             full_diff += file_diff
             
         # Save diff to MinIO
-        diff_filename = f"diff_{escape(proj.name)}_{escape(doc.file_name)}.txt"
+        diff_filename = f"diff_{escape(proj.name)}_{escape(file_name)}.txt"
         diff_uri = await save_file(diff_filename, full_diff.encode('utf-8'))
         
+        await ctx.progress("analyzing changes")
         # Gather context for analysis
-        context_chunks = await gather_context(st, proj, user_id=message.from_user.id, max_chunks=20)
+        context_chunks = await gather_context(st, proj, user_id=ctx.user_id, max_chunks=20)
         
         # Get AI analysis
         analysis = await analyze_diff_context(summary, context_chunks)
@@ -421,7 +472,7 @@ async def diff_zip_archives(message: Message, session: AsyncSession = get_sessio
         # Create diff artifact
         await create_import(
             st, proj,
-            title=f"Diff: {escape(latest_zip_artifact.title)} vs {escape(doc.file_name)}",
+            title=f"Diff: {escape(latest_zip_artifact.title)} vs {escape(file_name)}",
             text=full_diff[:10000] + ("..." if len(full_diff) > 10000 else ""),  # Truncate for storage
             chunk_size=settings.chunk_size,
             overlap=settings.chunk_overlap,
@@ -431,28 +482,26 @@ async def diff_zip_archives(message: Message, session: AsyncSession = get_sessio
         
         await st.commit()
         
-        # Send summary and analysis
-        response = f"Archive comparison <b>Results</b>\n\n{summary}\n\n{analysis}\n\nFull diff: {diff_uri}"
-        
-        # Split long messages
-        if len(response) > 4000:
-            await message.answer(f"Archive comparison <b>Results</b>\n\n{summary}")
-            await message.answer(analysis)
-            await message.answer(f"Full diff: {diff_uri}")
-        else:
-            await message.answer(response)
-            
-        # Send diff file if not too large
-        if len(full_diff.encode('utf-8')) < 10 * 1024 * 1024:  # 10MB limit
-            diff_doc = BufferedInputFile(
-                full_diff.encode('utf-8'),
-                filename=diff_filename
-            )
-            await message.answer_document(
-                diff_doc,
-                caption="Full diff between archives"
-            )
-        
-    except Exception as e:
-        logger.error(f"Error comparing ZIP archives: {e}")
-        await message.answer(f"Error comparing archives: {str(e)}")
\ No newline at end of file
+    # Send summary and analysis
+    response = f"Archive comparison <b>Results</b>\n\n{summary}\n\n{analysis}\n\nFull diff: {diff_uri}"
+    
+    # Split long messages
+    if len(response) > 4000:
+        await ctx.send(f"Archive comparison <b>Results</b>\n\n{summary}")
+        await ctx.send(analysis)
+        await ctx.send(f"Full diff: {diff_uri}")
+    else:
+        await ctx.send(response)
+        
+    # Send diff file if not too large
+    if ctx.chat_id and len(full_diff.encode('utf-8')) < 10 * 1024 * 1024:  # 10MB limit
+        diff_doc = BufferedInputFile(
+            full_diff.encode('utf-8'),
+            filename=diff_filename
+        )
+        await ctx.bot.send_document(
+            ctx.chat_id,
+            diff_doc,
+            caption="Full diff between archives"
+        )
+    return {"compared": True, "uri": diff_uri}
@@ -1,7 +1,10 @@
 from __future__ import annotations
+import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Iterable
 from pathspec import PathSpec
+from app.utils.sniff import read_text_file
 
 DEFAULT_PMIGNORE = """
 # папки
@@ -26,40 +29,103 @@ __pycache__/
 *.log
 """
 
-def load_pmignore(root: Path, extra_patterns: Iterable[str] | None = None) -> PathSpec:
-    patts: list[str] = []
-    pm = root / ".pmignore"
-    if pm.exists():
-        patts += pm.read_text(encoding="utf-8", errors="ignore").splitlines()
-    else:
-        patts += DEFAULT_PMIGNORE.splitlines()
+class IgnoreSpec:
+    """Compiled .pmignore with directory-prefix pruning.
+
+    Как в git: если каталог проигнорирован, файлы внутри не матчатся по одному —
+    решение по каталогу кэшируется, и весь node_modules/ отсекается одной проверкой.
+    Для самих файлов паттерны вида "dir/" не проверяются: они срабатывают только на каталогах.
+    """
+    __slots__ = ("spec", "file_spec", "_dirs")
+
+    def __init__(self, spec: PathSpec, file_spec: PathSpec | None = None):
+        self.spec = spec
+        self.file_spec = file_spec or spec
+        self._dirs: dict[str, bool] = {}
+
+    def is_dir_ignored(self, rel_dir: str) -> bool:
+        """rel_dir without trailing slash, e.g. "a/node_modules"."""
+        hit = self._dirs.get(rel_dir)
+        if hit is None:
+            parent, sep, _ = rel_dir.rpartition("/")
+            hit = (bool(sep) and self.is_dir_ignored(parent)) or self.spec.match_file(rel_dir + "/")
+            self._dirs[rel_dir] = hit
+        return hit
+
+    def match_file(self, rel: str) -> bool:
+        parent, sep, _ = rel.rpartition("/")
+        if sep and self.is_dir_ignored(parent):
+            return True
+        return self.file_spec.match_file(rel)
+
+@lru_cache(maxsize=64)
+def _compile(patterns: tuple[str, ...]) -> tuple[PathSpec, PathSpec]:
+    """(full spec, spec without directory-only patterns) for the given pattern lines."""
+    file_lines = [p for p in patterns if not p.strip().endswith("/")]
+    return PathSpec.from_lines("gitwildmatch", patterns), PathSpec.from_lines("gitwildmatch", file_lines)
+
+# (path, mtime_ns, size) -> строки .pmignore; файл перечитывается только если изменился
+_PMIGNORE_FILES: dict[tuple[str, int, int], tuple[str, ...]] = {}
+
+def _read_pmignore(pm: Path) -> tuple[str, ...] | None:
+    try:
+        st = pm.stat()
+    except OSError:
+        return None
+    key = (str(pm), st.st_mtime_ns, st.st_size)
+    lines = _PMIGNORE_FILES.get(key)
+    if lines is None:
+        if len(_PMIGNORE_FILES) > 256:
+            _PMIGNORE_FILES.clear()
+        lines = tuple(pm.read_text(encoding="utf-8", errors="ignore").splitlines())
+        _PMIGNORE_FILES[key] = lines
+    return lines
+
+_DEFAULT_LINES = tuple(DEFAULT_PMIGNORE.splitlines())
+
+def load_pmignore(root: Path, extra_patterns: Iterable[str] | None = None) -> IgnoreSpec:
+    patts = _read_pmignore(root / ".pmignore") or _DEFAULT_LINES
     if extra_patterns:
-        patts += list(extra_patterns)
-    return PathSpec.from_lines("gitwildmatch", patts)
+        patts = patts + tuple(extra_patterns)
+    # компиляция кэшируется по тексту паттернов, IgnoreSpec (кэш каталогов) — свой на каждый импорт
+    return IgnoreSpec(*_compile(patts))
+
+def default_spec() -> IgnoreSpec:
+    """Matcher for DEFAULT_PMIGNORE (archives without their own .pmignore); compiled once."""
+    return IgnoreSpec(*_compile(_DEFAULT_LINES))
 
 def should_ignore(filename: str, root: Path | None = None) -> bool:
     """
     Check if a file should be ignored based on .pmignore patterns.
     If root is not provided, uses default patterns only.
+    Для пачки файлов выгоднее один раз взять load_pmignore()/default_spec().
     """
     if root and root.exists():
-        spec = load_pmignore(root)
+        spec = load_pmignore(root).spec
     else:
         # Use default patterns only
-        spec = PathSpec.from_lines("gitwildmatch", DEFAULT_PMIGNORE.splitlines())
+        spec = _default_pathspec()
     
     return spec.match_file(filename)
 
-def iter_text_files(root: Path, spec: PathSpec):
-    for p in root.rglob("*"):
-        if p.is_file():
-            rel = p.relative_to(root).as_posix()
+@lru_cache(maxsize=1)
+def _default_pathspec() -> PathSpec:
+    return _compile(_DEFAULT_LINES)[0]
+
+def iter_text_files(root: Path, spec: IgnoreSpec | PathSpec):
+    if not isinstance(spec, IgnoreSpec):
+        spec = IgnoreSpec(spec)
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root).as_posix()
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        # проигнорированные каталоги не обходим вовсе
+        dirnames[:] = sorted(d for d in dirnames if not spec.is_dir_ignored(prefix + d))
+        for name in sorted(filenames):
+            rel = prefix + name
             if spec.match_file(rel):
                 continue
-            # простая эвристика «текст/нет»
-            try:
-                data = p.read_bytes()
-                data.decode("utf-8")
-            except Exception:
+            # текст/бинарник решается по первым 4 КБ, бинарники целиком не читаем
+            text = read_text_file(Path(dirpath) / name)
+            if text is None:
                 continue
-            yield rel, data.decode("utf-8", errors="ignore")
\ No newline at end of file
+            yield rel, text
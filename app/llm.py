@@ -6,22 +6,37 @@ LLM_DISABLED = os.getenv("LLM_DISABLED", "0") == "1"  # 0 = ON by default, 1 = O
 import asyncio
 import logging
 import json
-from typing import Sequence, List, Dict
+import importlib.util
+from typing import TYPE_CHECKING, Sequence, List, Dict
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-# Try to import OpenAI
-try:
+# openai импортируется лениво: сам пакет тянет ~0.5 с на холодном старте
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+if not OPENAI_AVAILABLE:
+    logger.warning("OpenAI package not installed. LLM features will not work.")
+if TYPE_CHECKING:
     from openai import AsyncOpenAI
     from openai.types.chat import ChatCompletionMessageParam
-    _client = AsyncOpenAI(api_key=settings.openai_api_key)
-    OPENAI_AVAILABLE = True
-except ImportError:
-    _client = None
-    OPENAI_AVAILABLE = False
-    logger.warning("OpenAI package not installed. LLM features will not work.")
+
+_client: "AsyncOpenAI | None" = None
+
+def _get_client() -> "AsyncOpenAI | None":
+    """AsyncOpenAI client created on first use (or by the startup warm-up); None without the SDK."""
+    global _client
+    if _client is None and OPENAI_AVAILABLE:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=settings.openai_api_key)
+    return _client
+
+# Общий лимитер параллельных запросов к модели (map-reduce суммаризация и пр.)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+_llm_limiter = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Бюджет контекста для генерации файлов/анализа диффа: всё, что больше, сжимается map-reduce
+GEN_CONTEXT_TOKENS = int(os.getenv("GEN_CONTEXT_TOKENS", "12000"))
 
 SYSTEM_BASE = (
     "Ты — инженер-ассистент по проекту. Используй предоставленный контекст строго как факты проекта. "
@@ -30,16 +45,15 @@ SYSTEM_BASE = (
 )
 
 def _make_messages(prompt: str, ctx_chunks: Sequence[str]) -> list[ChatCompletionMessageParam]:
-    ctx_block = ""
+    # Порядок важен для prompt caching: статичный SYSTEM_BASE, затем контекст,
+    # вопрос — последним. Так follow-up по тем же источникам делит общий префикс.
+    messages: list[ChatCompletionMessageParam] = [{"role": "system", "content": SYSTEM_BASE}]
     if ctx_chunks:
         # Жёстко отделяем контекст, чтобы модель не «мешала» его с инструкциями
         joined = "\n\n---\n".join(ctx_chunks)
-        ctx_block = f"\n\nКонтекст проекта (фрагменты):\n---\n{joined}\n---"
-    system = SYSTEM_BASE + ctx_block
-    return [
-        {"role": "system", "content": system},
-        {"role": "user", "content": prompt},
-    ]
+        messages.append({"role": "user", "content": f"Контекст проекта (фрагменты):\n---\n{joined}\n---"})
+    messages.append({"role": "user", "content": prompt})
+    return messages
 
 async def ask_llm(prompt: str, ctx_chunks: Sequence[str], model: str = "gpt-4o", max_tokens: int = 1200) -> str:
     """
@@ -49,7 +63,7 @@ async def ask_llm(prompt: str, ctx_chunks: Sequence[str], model: str = "gpt-4o",
         ctx_n = len(ctx_chunks or [])
         return f"🧪 TEST: LLM отключён.\nВопрос: {prompt[:400]}\nКонтекст: {ctx_n} фрагм."
     
-    if not OPENAI_AVAILABLE or _client is None:
+    if _get_client() is None:
         return "⚠️ OpenAI SDK не установлен. Установите openai>=1.40.0"
     
     messages = _make_messages(prompt, ctx_chunks)
@@ -57,48 +71,79 @@ async def ask_llm(prompt: str, ctx_chunks: Sequence[str], model: str = "gpt-4o",
 
     try:
         # Chat Completions — надёжно и просто.
-        resp = await _client.chat.completions.create(
+        resp = await _get_client().chat.completions.create(
             model=use_model,
             messages=messages,
             temperature=0.3,
             max_tokens=max_tokens,
         )
+        usage = resp.usage
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        logger.info("ask_llm usage: model=%s prompt=%s cached=%s", use_model,
+                    usage.prompt_tokens if usage else 0, getattr(details, "cached_tokens", 0) if details else 0)
         return (resp.choices[0].message.content or "").strip()
     except Exception as e:
         logger.exception("LLM error: %s", e)
         return "⚠️ Не удалось получить ответ от модели. Попробуй ещё раз или проверь ключ/лимиты."
 
-async def summarize_text(text: str, model: str | None = None, max_tokens: int = 500) -> str:
+async def summarize_once(text: str, instruction: str, model: str = "gpt-4o", max_tokens: int = 500) -> str:
     """
-    Краткое резюме ответа (используется кнопкой 📌 Summary).
+    Один запрос суммаризации под общим лимитером. Ошибки пробрасываются наружу
+    (map-reduce не должен кэшировать текст ошибки как резюме) — и заглушку при
+    отключённом LLM тоже не возвращаем, а бросаем.
     """
     if LLM_DISABLED:
-        return "🧪 TEST: LLM отключён. Резюме не создано."
-        
-    if not OPENAI_AVAILABLE or _client is None:
-        return "⚠️ OpenAI SDK не установлен. Установите openai>=1.40.0"
-        
-    model = model or "gpt-4o"
-    prompt = (
-        "Сделай сжатое, фактологичное резюме текста ниже: 5–10 пунктов или ~120–200 слов. "
-        "Без рассуждений, только итог.\n\nТекст:\n" + text
-    )
+        raise RuntimeError("LLM отключён")
+    if _get_client() is None:
+        raise RuntimeError("OpenAI SDK не установлен")
     messages: list[ChatCompletionMessageParam] = [
         {"role": "system", "content": SYSTEM_BASE},
-        {"role": "user", "content": prompt}
+        {"role": "user", "content": f"{instruction}\n\nТекст:\n{text}"}
     ]
-    try:
-        resp = await _client.chat.completions.create(
+    async with _llm_limiter:
+        resp = await _get_client().chat.completions.create(
             model=model,
             messages=messages,
             temperature=0.2,
             max_tokens=max_tokens,
         )
-        return (resp.choices[0].message.content or "").strip()
+    return (resp.choices[0].message.content or "").strip()
+
+async def summarize_text(text: str, model: str | None = None, max_tokens: int = 500) -> str:
+    """
+    Краткое резюме ответа (используется кнопкой 📌 Summary).
+    Большие тексты режутся на чанки и сворачиваются map-reduce (см. app.services.summarizer).
+    """
+    if LLM_DISABLED:
+        return "🧪 TEST: LLM отключён. Резюме не создано."
+        
+    if _get_client() is None:
+        return "⚠️ OpenAI SDK не установлен. Установите openai>=1.40.0"
+        
+    from app.services.summarizer import summarize_chunks, FINAL_INSTRUCTION, SUMMARY_SINGLE_PASS_TOKENS
+    from app.tokenizer import make_chunks, count_tokens
+    from app.config import settings
+
+    model = model or "gpt-4o"
+    try:
+        if count_tokens(text) <= SUMMARY_SINGLE_PASS_TOKENS:
+            return await summarize_once(text, FINAL_INSTRUCTION, model=model, max_tokens=max_tokens)
+        chunks = make_chunks(text, settings.chunk_size, settings.chunk_overlap)
+        return await summarize_chunks(chunks, model=model, max_tokens=max_tokens)
     except Exception as e:
         logger.exception("Summarize error: %s", e)
         return "⚠️ Не удалось сделать краткое резюме."
 
+async def _fit_context(context_chunks: Sequence[str], budget_tokens: int = GEN_CONTEXT_TOKENS) -> str:
+    """Join context chunks; if they overflow the budget, compress them with map-reduce instead of truncating."""
+    from app.services.summarizer import reduce_to_budget
+    try:
+        parts = await reduce_to_budget(list(context_chunks), budget_tokens)
+    except Exception as e:
+        logger.warning("Context compression failed, falling back to head: %s", e)
+        parts = list(context_chunks[:30])
+    return "\n\n".join(parts)
+
 async def generate_zip_files(task_description: str, context_chunks: Sequence[str], tags: List[str]) -> Dict[str, str]:
     """
     Generate multiple files for ZIP archive based on task description.
@@ -114,11 +159,11 @@ async def generate_zip_files(task_description: str, context_chunks: Sequence[str
     if LLM_DISABLED:
         return {"test.txt": "🧪 TEST: LLM отключён. Файлы не созданы."}
         
-    if not OPENAI_AVAILABLE or _client is None:
+    if _get_client() is None:
         return {"error.txt": "OpenAI SDK не установлен. Установите openai>=1.40.0"}
     
     # Prepare context and prompt
-    context = "\n\n".join(context_chunks[:30])
+    context = await _fit_context(context_chunks)
     tags_str = ", ".join(tags) if tags else "general"
     
     prompt = f"""
@@ -147,7 +192,7 @@ async def generate_zip_files(task_description: str, context_chunks: Sequence[str
 
     try:
         # Call OpenAI API
-        resp = await _client.chat.completions.create(
+        resp = await _get_client().chat.completions.create(
             model="gpt-4o",
             messages=messages,
             temperature=0.3,
@@ -184,10 +229,10 @@ async def generate_single_file(file_path: str, task_description: str, context_ch
     if LLM_DISABLED:
         return "# 🧪 TEST: LLM отключён. Файл не создан."
         
-    if not OPENAI_AVAILABLE or _client is None:
+    if _get_client() is None:
         return "# OpenAI SDK не установлен. Установите openai>=1.40.0"
         
-    context = "\n\n".join(context_chunks[:30])
+    context = await _fit_context(context_chunks)
     
     prompt = f"""
 Вы — эксперт-разработчик. Создайте файл по указанному пути.
@@ -214,7 +259,7 @@ async def generate_single_file(file_path: str, task_description: str, context_ch
 
     try:
         # Call OpenAI API
-        resp = await _client.chat.completions.create(
+        resp = await _get_client().chat.completions.create(
             model="gpt-4o",
             messages=messages,
             temperature=0.3,
@@ -241,10 +286,10 @@ async def analyze_diff_context(summary: str, context_chunks: Sequence[str]) -> s
     if LLM_DISABLED:
         return "🧪 TEST: LLM отключён. Анализ не выполнен."
         
-    if not OPENAI_AVAILABLE or _client is None:
+    if _get_client() is None:
         return "⚠️ OpenAI SDK не установлен. Установите openai>=1.40.0"
         
-    context = "\n\n".join(context_chunks[:20])
+    context = await _fit_context(context_chunks, GEN_CONTEXT_TOKENS // 2)
     
     prompt = f"""
 Вы — эксперт-аналитик кода. Проанализируйте изменения в проекте.
@@ -270,7 +315,7 @@ async def analyze_diff_context(summary: str, context_chunks: Sequence[str]) -> s
 
     try:
         # Call OpenAI API
-        resp = await _client.chat.completions.create(
+        resp = await _get_client().chat.completions.create(
             model="gpt-4o",
             messages=messages,
             temperature=0.2,
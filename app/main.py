@@ -6,7 +6,6 @@ from aiogram.types import MenuButtonCommands, BotCommand
 from aiogram.exceptions import TelegramUnauthorizedError, TelegramAPIError
 from app.config import settings
 from app.handlers import router as root_router
-from app.storage import ensure_bucket
 
 # Enable logging
 logging.basicConfig(level=logging.INFO)
@@ -15,12 +14,78 @@ async def main():
     logger = logging.getLogger(__name__)
     logger.info("Starting Telegram bot...")
     
-    await ensure_bucket()
-    logger.info("MinIO bucket ensured")
-    
     # Create bot instance
     bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode='HTML'))
+    # Все исходящие вызовы — через планировщик (лимиты Telegram, склейка правок, RetryAfter)
+    from app.utils.outbound import install_outbound_scheduler
+    install_outbound_scheduler(bot)
     
+    # Create dispatcher and start polling (or the webhook server, BOT_MODE=webhook)
+    try:
+        # FSM и состояние хендлеров — в StateBackend (STATE_BACKEND=postgres для нескольких реплик)
+        from app.services.state_backend import fsm_storage
+        dp = Dispatcher(storage=fsm_storage())
+        dp.include_router(root_router)
+        # Апдейты одного пользователя — по очереди, разных — параллельно
+        from app.utils.ordering import install_user_ordering, UPDATES_CONCURRENCY
+        ordering = install_user_ordering(dp)
+        # с ordering лимит держит middleware и не считает апдейты, ждущие своего пользователя
+        updates_limit = 0 if ordering is not None else UPDATES_CONCURRENCY
+        # Фоновые задачи (импорты, синки, генерация, резюме источников) — очередь в Postgres
+        from app.services.jobs import start_job_workers
+        import app.services.token_recount  # noqa: F401 — регистрирует задачу recount_tokens
+        job_tasks = start_job_workers(bot)
+        # Отложенные удаления эфемерных сообщений — один планировщик, хвост из БД после рестарта
+        from app.services.deletions import start_deletion_scheduler
+        job_tasks.append(start_deletion_scheduler(bot))
+        background: list[asyncio.Task] = []
+
+        async def on_startup():
+            # Всё, что не нужно для ответа на первый апдейт, — в фоне после старта поллинга
+            background.append(asyncio.create_task(_after_start(bot)))
+
+        dp.startup.register(on_startup)
+        
+        try:
+            if settings.bot_mode == "webhook":
+                from app.webhook import run_webhook
+                logger.info("Routers registered, starting webhook server...")
+                await run_webhook(dp, bot, concurrency=updates_limit)
+            else:
+                logger.info("Routers registered, starting polling...")
+                # после webhook-режима getUpdates отвечает 409, пока вебхук не снят; апдейты не теряем
+                await bot.delete_webhook(drop_pending_updates=False)
+                await dp.start_polling(bot, tasks_concurrency_limit=updates_limit or None)
+        finally:
+            for t in job_tasks + background:
+                t.cancel()
+    except TelegramUnauthorizedError:
+        logger.error("Invalid bot token. Please check your BOT_TOKEN in .env file.")
+        logger.info("Bot shutting down due to invalid token.")
+    except Exception as e:
+        logger.error(f"Error starting bot: {e}")
+        raise
+
+async def _after_start(bot: Bot):
+    """Bot commands, source-summary resume, token recount and warm-up of lazy clients — after polling has started."""
+    logger = logging.getLogger(__name__)
+    from app.services.source_summaries import resume_source_summaries
+    from app.services.token_recount import enqueue_token_recount
+    from app.warmup import warm_up
+    await _set_commands(bot)
+    try:
+        await resume_source_summaries()
+    except Exception as e:
+        logger.warning(f"Could not resume source summaries: {e}")
+    try:
+        await enqueue_token_recount()
+    except Exception as e:
+        logger.warning(f"Could not check chunk token encodings: {e}")
+    await warm_up()
+    logger.info("Warm-up finished")
+
+async def _set_commands(bot: Bot):
+    logger = logging.getLogger(__name__)
     # Set bot commands (handle errors gracefully)
     try:
         await bot.set_my_commands([
@@ -31,9 +96,11 @@ async def main():
             BotCommand(command="ask", description="Ask questions with context"),
             BotCommand(command="ctx", description="Set context filters"),
             BotCommand(command="model", description="Select AI model"),
+            BotCommand(command="chunker", description="Chunking strategy for the project"),
             BotCommand(command="menu", description="Open quick actions menu"),
             BotCommand(command="actions", description="Open advanced actions panel"),
             BotCommand(command="status", description="Show current status"),
+            BotCommand(command="jobs", description="Background jobs"),
             BotCommand(command="kb_on", description="Enable keyboard"),
         ])
         await bot.set_chat_menu_button(menu_button=MenuButtonCommands())
@@ -44,20 +111,6 @@ async def main():
         logger.warning(f"Telegram API error when setting commands: {e}")
     except Exception as e:
         logger.warning(f"Unexpected error when setting bot commands: {e}")
-    
-    # Create dispatcher and start polling
-    try:
-        dp = Dispatcher()
-        dp.include_router(root_router)
-        logger.info("Routers registered, starting polling...")
-        
-        await dp.start_polling(bot)
-    except TelegramUnauthorizedError:
-        logger.error("Invalid bot token. Please check your BOT_TOKEN in .env file.")
-        logger.info("Bot shutting down due to invalid token.")
-    except Exception as e:
-        logger.error(f"Error starting bot: {e}")
-        raise
 
 if __name__ == "__main__":
     try:
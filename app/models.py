@@ -1,6 +1,6 @@
 import json
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, ForeignKey, Integer, DateTime, func, Table, Column, BigInteger, Boolean
+from sqlalchemy import String, Text, ForeignKey, Integer, DateTime, func, Table, Column, BigInteger, Boolean, Index, text
 from sqlalchemy.dialects import postgresql
 from app.db import Base
 
@@ -28,6 +28,8 @@ class Project(Base):
     __tablename__ = "projects"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(128), unique=True, index=True)
+    # Переопределение settings.chunker для проекта (None — по умолчанию)
+    chunker: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     artifacts: Mapped[list["Artifact"]] = relationship(back_populates="project", cascade="all, delete-orphan")
@@ -46,6 +48,10 @@ class Artifact(Base):
     # Answer metadata fields
     related_source_ids: Mapped[dict | None] = mapped_column(postgresql.JSONB, nullable=True)
     run_meta: Mapped[dict | None] = mapped_column(postgresql.JSONB, nullable=True)
+    # Сжатый уровень для ретривала: фоновое резюме + ключевые слова (см. services/source_summaries.py)
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    keywords: Mapped[list | None] = mapped_column(postgresql.JSONB, nullable=True)
+    summary_status: Mapped[str | None] = mapped_column(String(16), nullable=True)  # None|done|failed
 
     project: Mapped[Project] = relationship(back_populates="artifacts")
     chunks: Mapped[list["Chunk"]] = relationship(back_populates="artifact", cascade="all, delete-orphan")
@@ -68,6 +74,17 @@ class Artifact(Base):
         back_populates="source_artifacts"
     )
 
+    # keyset-пагинация панелей: WHERE project_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+    __table_args__ = (Index("ix_artifacts_project_created_id", "project_id", "created_at", "id"),)
+
+class ProjectCounter(Base):
+    """Approximate per-project counters for panel page totals (see services/counters.py)."""
+    __tablename__ = "project_counters"
+    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    artifacts: Mapped[int] = mapped_column(Integer, default=0)
+    # когда artifacts пересчитан COUNT(*); между пересчётами поддерживается инкрементами
+    refreshed_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
 class Chunk(Base):
     __tablename__ = "chunks"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -75,6 +92,11 @@ class Chunk(Base):
     idx: Mapped[int] = mapped_column(Integer)  # порядковый номер чанка
     text: Mapped[str] = mapped_column(Text)
     tokens: Mapped[int] = mapped_column(Integer)
+    # [start_offset, end_offset) в символах Artifact.raw_text — для подсветки/цитат
+    start_offset: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    end_offset: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # кодировка, в которой посчитан tokens ("o200k_base", "cl100k_base", "bytes"); NULL — до появления колонки
+    encoding: Mapped[str | None] = mapped_column(String(32), nullable=True)
 
     artifact: Mapped[Artifact] = relationship(back_populates="chunks")
 
@@ -136,7 +158,7 @@ class UserState(Base):
     ask_refine_run_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
     # ASK last answer data (for Delete/Refine/Sources functionality)
     last_answer: Mapped[str | None] = mapped_column(Text, nullable=True)
-    # ASK in-flight flag (for anti-duplicate protection)
+    # ASK in-flight flag (for anti-duplicate protection) — устарел, флаг теперь в StateBackend (handlers.ask._ask_inflight_key)
     ask_inflight: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
 
 class Repo(Base):
@@ -147,3 +169,57 @@ class Repo(Base):
     url: Mapped[str] = mapped_column(String(512))
     branch: Mapped[str] = mapped_column(String(64), default="main")
     last_synced_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True))
+    # Инкрементальная индексация: куда импортируем и до какого коммита уже проиндексировано
+    project_id: Mapped[int | None] = mapped_column(ForeignKey("projects.id", ondelete="SET NULL"), nullable=True)
+    last_commit: Mapped[str | None] = mapped_column(String(40), nullable=True)
+
+class SummaryCache(Base):
+    """Кэш map/reduce-резюме: ключ — sha256(версия промпта, модель, инструкция, текст)."""
+    __tablename__ = "summary_cache"
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String(64))
+    summary: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class KVState(Base):
+    """Общее состояние хендлеров и FSM для всех реплик (services/state_backend.py, STATE_BACKEND=postgres)."""
+    __tablename__ = "kv_state"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    value: Mapped[dict | list | str | None] = mapped_column(postgresql.JSONB, nullable=True)
+    expires_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
+class PendingDeletion(Base):
+    """Отложенное удаление эфемерного сообщения (services/deletions.py) — переживает рестарт."""
+    __tablename__ = "pending_deletions"
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    message_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    due_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True))
+
+class Job(Base):
+    """Фоновая задача (импорт, синк, генерация). Воркеры забирают через FOR UPDATE SKIP LOCKED."""
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    status: Mapped[str] = mapped_column(String(16), default="queued")  # queued|running|done|failed|cancelled
+    payload: Mapped[dict] = mapped_column(postgresql.JSONB, default=dict)
+    result: Mapped[dict | None] = mapped_column(postgresql.JSONB, nullable=True)
+    dedupe_key: Mapped[str | None] = mapped_column(String(128), nullable=True, index=True)
+    user_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    chat_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    progress_msg_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    progress: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, default=False)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    run_after: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    locked_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        # одна активная задача на dedupe_key — enqueue вставляет с ON CONFLICT DO NOTHING
+        Index("ux_jobs_dedupe_active", "dedupe_key", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')")),
+    )
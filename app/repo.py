@@ -1,21 +1,38 @@
 from __future__ import annotations
-import subprocess, os, shlex, datetime as dt
+import os, asyncio, datetime as dt
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Awaitable, Callable
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, update
-from app.models import Repo
+from app.models import Repo, Artifact, Project
+from app.ignore import load_pmignore, DEFAULT_PMIGNORE
+from app.utils.sniff import read_text_file
 
 BASE = Path("/app/repos")
+REPO_CMD_TIMEOUT = int(os.getenv("REPO_CMD_TIMEOUT", "300"))
+# Sync all: сколько репозиториев синкаем одновременно и как часто один и тот же
+REPO_SYNC_CONCURRENCY = int(os.getenv("REPO_SYNC_CONCURRENCY", "4"))
+REPO_SYNC_MIN_INTERVAL = int(os.getenv("REPO_SYNC_MIN_INTERVAL", "600"))
+# Файлы больше этого в память не тянем (минифицированные бандлы, дампы)
+REPO_MAX_FILE_BYTES = int(os.getenv("REPO_MAX_FILE_BYTES", str(512 * 1024)))
 
-def _runcmd(cmd: str, cwd: Optional[Path] = None) -> tuple[int, str]:
-    p = subprocess.Popen(shlex.split(cmd), cwd=str(cwd) if cwd else None,
-                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    out, _ = p.communicate()
-    return p.returncode, out
+Progress = Optional[Callable[[str], Awaitable[None]]]
 
-async def repo_add(st: AsyncSession, user_id: int, alias: str, url: str, branch: str = "main"):
-    r = Repo(user_id=user_id, alias=alias, url=url, branch=branch)
+async def _runcmd(args: list[str], cwd: Optional[Path] = None, timeout: int = REPO_CMD_TIMEOUT) -> tuple[int, str]:
+    """Run a command without blocking the event loop; returns (code, combined output). Code 124 on timeout."""
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    p = await asyncio.create_subprocess_exec(*args, cwd=str(cwd) if cwd else None, env=env,
+                                             stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    try:
+        out, _ = await asyncio.wait_for(p.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        p.kill()
+        await p.wait()
+        return 124, f"timeout after {timeout}s: {' '.join(args[:3])}"
+    return p.returncode or 0, out.decode("utf-8", errors="replace")
+
+async def repo_add(st: AsyncSession, user_id: int, alias: str, url: str, branch: str = "main", project_id: int | None = None):
+    r = Repo(user_id=user_id, alias=alias, url=url, branch=branch, project_id=project_id)
     st.add(r)
     await st.flush()
     return r
@@ -27,30 +44,190 @@ async def repo_list(st: AsyncSession, user_id: int):
 async def repo_remove(st: AsyncSession, user_id: int, alias: str):
     await st.execute(delete(Repo).where(Repo.user_id==user_id, Repo.alias==alias))
 
-async def repo_sync(st: AsyncSession, user_id: int, alias: str, token: str | None = None) -> str:
+# Один и тот же рабочий каталог не синкаем параллельно (кнопка Sync + Sync all)
+_path_locks: dict[Path, asyncio.Lock] = {}
+
+def _repo_path(user_id: int, alias: str) -> Path:
+    # у разных пользователей могут быть одинаковые alias
+    return BASE / str(user_id) / alias
+
+def _sparse_patterns(pmignore_text: str) -> list[str]:
+    """Turn .pmignore lines into non-cone sparse-checkout patterns: everything except ignored paths.
+
+    Порядок сохраняется (последний совпавший шаблон решает, как в .gitignore):
+    «foo» -> «!foo» исключает, «!foo» -> «foo» включает обратно.
+    """
+    pats = ["/*"]
+    for line in pmignore_text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pats.append(line[1:] if line.startswith("!") else "!" + line)
+    return pats
+
+async def _apply_sparse(path: Path, rev: str) -> tuple[int, str]:
+    """Configure sparse checkout from the repo's own .pmignore at rev (defaults if absent); _runcmd result."""
+    code, text = await _runcmd(["git", "show", f"{rev}:.pmignore"], cwd=path)
+    patterns = _sparse_patterns(text if code == 0 else DEFAULT_PMIGNORE)
+    return await _runcmd(["git", "sparse-checkout", "set", "--no-cone", *patterns], cwd=path)
+
+def _repo_uri(alias: str, rel: str) -> str:
+    return f"repo://{alias}/{rel}"[:512]
+
+def _read_text(path: Path) -> str | None:
+    """Text or None (binary/oversized) — same sniffing decision as the other import paths."""
+    return read_text_file(path, max_bytes=REPO_MAX_FILE_BYTES)
+
+async def _changed_files(path: Path, old: str | None, new: str) -> tuple[dict[str, str], bool]:
+    """Return ({rel: status A|M|D}, full). full=True when there is nothing to diff against."""
+    if old:
+        code, _ = await _runcmd(["git", "cat-file", "-e", f"{old}^{{commit}}"], cwd=path)
+        if code == 0:
+            code, out = await _runcmd(["git", "diff", "--name-status", "--no-renames", "-z", old, new], cwd=path)
+            if code == 0:
+                parts = out.split("\0")
+                return {parts[i + 1]: parts[i][:1] for i in range(0, len(parts) - 1, 2)}, False
+    code, out = await _runcmd(["git", "ls-files", "-z"], cwd=path)
+    return {rel: "A" for rel in out.split("\0") if rel}, True
+
+async def index_repo_changes(st: AsyncSession, r: Repo, proj: Project, path: Path, old: str | None, new: str,
+                             progress: Progress = None) -> dict[str, int]:
+    """Re-import only files that changed between old and new commits (honours .pmignore)."""
+    from app.config import settings
+    from app.services.artifacts import create_import, chunk_texts, IMPORT_BATCH_DOCS
+
+    changes, full = await _changed_files(path, old, new)
+    spec = load_pmignore(path)
+    if full:
+        # старый коммит недоступен — переиндексируем репозиторий целиком
+        await st.execute(delete(Artifact).where(Artifact.project_id == proj.id,
+                                                Artifact.uri.like(_repo_uri(r.alias, "%"))))
+    else:
+        stale = [_repo_uri(r.alias, rel) for rel, status in changes.items() if status in ("M", "D", "T")]
+        for i in range(0, len(stale), 500):
+            await st.execute(delete(Artifact).where(Artifact.project_id == proj.id,
+                                                    Artifact.uri.in_(stale[i:i + 500])))
+
+    tags = [f"repo:{r.alias}", f"commit:{new[:7]}"]
+    stats = {"imported": 0, "deleted": sum(1 for s in changes.values() if s == "D"), "skipped": 0}
+    todo = [rel for rel, status in sorted(changes.items()) if status != "D"]
+    for n in range(0, len(todo), IMPORT_BATCH_DOCS):
+        batch: list[tuple[str, str]] = []
+        for rel in todo[n:n + IMPORT_BATCH_DOCS]:
+            text = None if spec.match_file(rel) else await asyncio.to_thread(_read_text, path / rel)
+            if text is None or not text.strip():
+                stats["skipped"] += 1
+                continue
+            batch.append((rel, text))
+        chunked = await chunk_texts([text for _, text in batch], settings.chunk_size, settings.chunk_overlap,
+                                    names=[rel for rel, _ in batch], project=proj)
+        for (rel, _), (text, spans) in zip(batch, chunked):
+            await create_import(st, proj, title=f"{r.alias}:{rel}", text=text,
+                                chunk_size=settings.chunk_size, overlap=settings.chunk_overlap,
+                                tags=tags, uri=_repo_uri(r.alias, rel), spans=spans)
+            stats["imported"] += 1
+        if progress:
+            await progress(f"{r.alias}: {min(n + IMPORT_BATCH_DOCS, len(todo))}/{len(todo)} файлов")
+    return stats
+
+async def repo_sync(st: AsyncSession, user_id: int, alias: str, token: str | None = None,
+                    progress: Progress = None) -> str:
+    lock = _path_locks.setdefault(_repo_path(user_id, alias), asyncio.Lock())
+    async with lock:
+        return await _repo_sync_locked(st, user_id, alias, token, progress)
+
+async def _repo_sync_locked(st: AsyncSession, user_id: int, alias: str, token: str | None,
+                            progress: Progress) -> str:
+    from app.services.memory import get_active_project
+
     res = await st.execute(select(Repo).where(Repo.user_id==user_id, Repo.alias==alias))
     r = res.scalars().first()
     if not r: return "Repo not found."
-    BASE.mkdir(parents=True, exist_ok=True)
-    path = BASE / alias
+    path = _repo_path(user_id, alias)
+    path.parent.mkdir(parents=True, exist_ok=True)
     # URL с токеном для приватных реп
     url = r.url
     if token and url.startswith("https://github.com/"):
         url = url.replace("https://", f"https://{token}@", 1)
 
+    if progress:
+        await progress(f"{alias}: git fetch")
     if not path.exists():
-        code, out = _runcmd(f"git clone --depth=1 --branch {r.branch} {shlex.quote(url)} {shlex.quote(str(path))}")
+        # partial clone: коммиты и деревья сразу, блобы — только для того, что попадёт в sparse checkout
+        code, out = await _runcmd(["git", "clone", "--filter=blob:none", "--no-checkout",
+                                   "--branch", r.branch, url, str(path)])
+        if code==0:
+            # без sparse checkout git скачал бы все блобы — лучше вернуть ошибку
+            code, out2 = await _apply_sparse(path, f"origin/{r.branch}")
+            if code == 0:
+                code, out2 = await _runcmd(["git", "checkout", r.branch], cwd=path)
+            out += "\n" + out2
     else:
-        code, out = _runcmd("git fetch --all", cwd=path)
+        # только нужная ветка; фильтр partial clone git помнит сам (remote.origin.partialclonefilter)
+        code, out = await _runcmd(["git", "fetch", "origin", r.branch], cwd=path)
         if code==0:
-            code, out2 = _runcmd(f"git reset --hard origin/{r.branch}", cwd=path)
+            code, out2 = await _apply_sparse(path, f"origin/{r.branch}")
+            if code == 0:
+                code, out2 = await _runcmd(["git", "reset", "--hard", f"origin/{r.branch}"], cwd=path)
             out += "\n" + out2
-    if code==0:
-        # Update the last_synced_at field using an update statement
-        await st.execute(
-            update(Repo)
-            .where(Repo.id == r.id)
-            .values(last_synced_at=dt.datetime.now(dt.timezone.utc))
-        )
+    if token:
+        out = out.replace(token, "***")
+    if code!=0:
+        await st.flush()
+        return out
+
+    code, head = await _runcmd(["git", "rev-parse", "HEAD"], cwd=path)
+    new = head.strip()
+    values: dict = {"last_synced_at": dt.datetime.now(dt.timezone.utc)}
+    if code == 0 and new and new != r.last_commit:
+        proj = await st.get(Project, r.project_id) if r.project_id else None
+        if not proj:
+            proj = await get_active_project(st, user_id)
+        if proj:
+            stats = await index_repo_changes(st, r, proj, path, r.last_commit, new, progress)
+            values.update(last_commit=new, project_id=proj.id)
+            out += (f"\nIndexed {r.last_commit[:7] if r.last_commit else '∅'}..{new[:7]} → {proj.name}: "
+                    f"+{stats['imported']} -{stats['deleted']} skipped {stats['skipped']}")
+        else:
+            out += "\nNo active project — content not indexed."
+    elif code == 0:
+        out += f"\nUp to date at {new[:7]}."
+    # Update the last_synced_at field using an update statement
+    await st.execute(update(Repo).where(Repo.id == r.id).values(**values))
     await st.flush()
-    return out
\ No newline at end of file
+    return out
+
+async def repo_sync_all(user_id: int, token: str | None = None, progress: Progress = None,
+                        force: bool = False) -> list[tuple[str, str]]:
+    """Sync all user's repos concurrently (bounded); skips repos synced within REPO_SYNC_MIN_INTERVAL.
+
+    Каждый репозиторий — в своей сессии и транзакции, падение одного не откатывает остальные.
+    Returns [(alias, status line)].
+    """
+    from app.db import session_scope
+
+    async with session_scope() as st:
+        repos = await repo_list(st, user_id)
+    now = dt.datetime.now(dt.timezone.utc)
+    fresh_after = now - dt.timedelta(seconds=REPO_SYNC_MIN_INTERVAL)
+    sem = asyncio.Semaphore(REPO_SYNC_CONCURRENCY)
+    done = 0
+
+    async def one(r: Repo) -> tuple[str, str]:
+        nonlocal done
+        if not force and r.last_synced_at and r.last_synced_at > fresh_after:
+            return r.alias, "skipped (recently synced)"
+        async with sem:
+            try:
+                async with session_scope() as st:
+                    out = await repo_sync(st, user_id, r.alias, token=token)
+                    await st.commit()
+                status = out.strip().splitlines()[-1] if out.strip() else "ok"
+            except Exception as e:
+                status = f"error: {e}"
+        done += 1
+        if progress:
+            await progress(f"синк {done}/{len(repos)}: {r.alias}")
+        return r.alias, status
+
+    return list(await asyncio.gather(*(one(r) for r in repos)))
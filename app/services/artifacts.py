@@ -1,8 +1,13 @@
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import Project, Artifact, Chunk, Tag
-from app.tokenizer import make_chunks, count_tokens
-from typing import Optional, List
+from app.tokenizer import ChunkSpan, count_tokens, encoding_label
+from app.chunking import ChunkParams, chunk_document, chunk_documents, resolve_chunker
+from app.services.source_summaries import enqueue_source_summary
+from app.utils.textnorm import normalize_text
+from typing import Optional, List, Sequence
+import asyncio
+from dataclasses import replace
 
 async def get_chunks_by_artifact_ids(session: AsyncSession, artifact_ids: list[int], limit: int = 200) -> list[str]:
     """Get text chunks for specific artifact IDs."""
@@ -23,11 +28,10 @@ async def approx_tokens_for_selection(session: AsyncSession, artifact_ids: list[
     # Get chunks for the specified artifacts
     chunks = await get_chunks_by_artifact_ids(session, artifact_ids, limit=2000)
     
-    # Calculate approximate tokens
+    # Считаем в кодировке выбранной модели (o200k для gpt-4o/gpt-5), а не len/4
     toks = 0
     for text in chunks:
-        # If chunk has tokens field, use it; otherwise estimate as len(text)/4
-        toks += max(1, len(text) // 4)
+        toks += max(1, count_tokens(text, model=model))
     return toks
 
 
@@ -52,23 +56,49 @@ async def _ensure_tags(session: AsyncSession, tag_names: list[str]) -> list[Tag]
         out.append(t)
     return out
 
+def _add_chunks(session: AsyncSession, art: Artifact, spans: Sequence[ChunkSpan]) -> None:
+    label = encoding_label()
+    for idx, sp in enumerate(spans):
+        session.add(Chunk(artifact_id=art.id, idx=idx, text=sp.text, tokens=sp.token_count,
+                          start_offset=sp.start_offset, end_offset=sp.end_offset, encoding=label))
+
+# Сколько документов кодировать одним encode_ordinary_batch при пакетном импорте
+IMPORT_BATCH_DOCS = 32
+
+async def chunk_texts(texts: Sequence[str], chunk_size: int, overlap: int,
+                      names: Sequence[str | None] | None = None,
+                      project: Project | None = None) -> list[tuple[str, list[ChunkSpan]]]:
+    """Normalize and chunk many documents off the event loop with the project's chunker.
+
+    Returns [(normalized_text, spans)] to pass to create_import(text=..., spans=...).
+    """
+    normalized = [normalize_text(t) for t in texts]
+    params = replace(ChunkParams.from_settings(), size=chunk_size, overlap=overlap)
+    spans = await asyncio.to_thread(chunk_documents, normalized, names or [None] * len(texts),
+                                    params, resolve_chunker(project))
+    return list(zip(normalized, spans))
+
 async def create_note(session: AsyncSession, project: Project, title: str, text: str, chunk_size: int, overlap: int, tags: Optional[List[str]] = None):
+    # нормализуем один раз при записи — retrieval не делает это на каждом ASK
+    text = normalize_text(text)
     art = Artifact(project_id=project.id, kind="note", title=title, raw_text=text)
     if tags:
         art.tags = await _ensure_tags(session, tags)
     session.add(art)
     await session.flush()
     
-    chunks = make_chunks(text, chunk_size, overlap)
-    for idx, ch in enumerate(chunks):
-        token_count = count_tokens(ch)
-        session.add(Chunk(artifact_id=art.id, idx=idx, text=ch, tokens=token_count))
+    params = replace(ChunkParams.from_settings(), size=chunk_size, overlap=overlap)
+    _add_chunks(session, art, chunk_document(text, None, params, resolve_chunker(project)))
+    await enqueue_source_summary(session, art.id)
     return art
 
-async def create_import(session: AsyncSession, project: Project, title: str, text: str, chunk_size: int, overlap: int, tags: Optional[List[str]] = None, uri: Optional[str] = None):
+async def create_import(session: AsyncSession, project: Project, title: str, text: str, chunk_size: int, overlap: int, tags: Optional[List[str]] = None, uri: Optional[str] = None,
+                        spans: Optional[Sequence[ChunkSpan]] = None):
+    """spans — готовые чанки из chunk_texts() (пакетный импорт); иначе текст режется здесь."""
     from sqlalchemy import insert
-    from app.models import Artifact, Chunk, artifact_tags
+    from app.models import Artifact, artifact_tags
     
+    text = normalize_text(text)
     art = Artifact(project_id=project.id, kind="import", title=title, raw_text=text)
     if uri:
         art.uri = uri
@@ -85,9 +115,10 @@ async def create_import(session: AsyncSession, project: Project, title: str, tex
         if rows:
             await session.execute(insert(artifact_tags).values(rows))
     
-    # дальше — чанки
-    chunks = make_chunks(text, chunk_size, overlap)
-    for idx, ch in enumerate(chunks):
-        token_count = count_tokens(ch)
-        session.add(Chunk(artifact_id=art.id, idx=idx, text=ch, tokens=token_count))
+    # дальше — чанки (один encode на документ, смещения в raw_text); чанкер проекта, структура — по расширению
+    if spans is None:
+        params = replace(ChunkParams.from_settings(), size=chunk_size, overlap=overlap)
+        spans = chunk_document(text, title or uri, params, resolve_chunker(project))
+    _add_chunks(session, art, spans)
+    await enqueue_source_summary(session, art.id)
     return art
@@ -0,0 +1,104 @@
+"""Approximate per-project artifact counters for panel page totals.
+
+COUNT(*) по проекту на каждое листание растёт вместе с проектом; вместо этого
+project_counters хранит число артефактов. Вставки/удаления через ORM двигают его
+инкрементами в той же транзакции; массовые DELETE мимо объектов и записи других
+реплик ловит периодический пересчёт (COUNTER_REFRESH_SECONDS) — поэтому «примерно».
+"""
+from __future__ import annotations
+import os
+import logging
+import datetime as dt
+from collections import Counter
+from typing import Iterable
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db import session_scope
+from app.models import Artifact, ProjectCounter
+
+logger = logging.getLogger(__name__)
+
+COUNTER_REFRESH_SECONDS = int(os.getenv("COUNTER_REFRESH_SECONDS", "900"))
+
+# Массовый DELETE/INSERT по artifacts в этом процессе: счётчики старше — пересчитать
+_bulk_changed_at: dt.datetime | None = None
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+async def approx_artifact_count(st: AsyncSession, project_ids: Iterable[int]) -> int:
+    """Sum of the projects' counters; missing or stale ones are recounted exactly (one COUNT ... GROUP BY).
+
+    Пересчёт пишется в своей сессии — транзакцию вызывающего (хендлер рисует
+    панель) не коммитим.
+    """
+    ids = sorted(set(project_ids))
+    if not ids:
+        return 0
+    res = await st.execute(
+        sa.select(ProjectCounter.project_id, ProjectCounter.artifacts, ProjectCounter.refreshed_at)
+        .where(ProjectCounter.project_id.in_(ids))
+    )
+    fresh_after = _utcnow() - dt.timedelta(seconds=COUNTER_REFRESH_SECONDS)
+    if _bulk_changed_at is not None:
+        fresh_after = max(fresh_after, _bulk_changed_at)
+    counts, stale = {}, set(ids)
+    for pid, n, refreshed_at in res.all():
+        counts[pid] = n
+        if refreshed_at is not None and refreshed_at >= fresh_after:
+            stale.discard(pid)
+    if stale:
+        res = await st.execute(
+            sa.select(Artifact.project_id, sa.func.count())
+            .where(Artifact.project_id.in_(stale))
+            .group_by(Artifact.project_id)
+        )
+        exact = dict(res.all())
+        counts.update({pid: exact.get(pid, 0) for pid in stale})
+        await _store_counts({pid: exact.get(pid, 0) for pid in stale})
+    return sum(counts.get(pid, 0) for pid in ids)
+
+async def _store_counts(exact: dict[int, int]) -> None:
+    now = _utcnow()
+    stmt = pg_insert(ProjectCounter).values(
+        [{"project_id": pid, "artifacts": n, "refreshed_at": now} for pid, n in exact.items()])
+    try:
+        async with session_scope() as own:
+            # строку счётчика может держать незакоммиченная транзакция вызывающего — не ждём её
+            await own.execute(sa.text("SET LOCAL lock_timeout = '2s'"))
+            await own.execute(stmt.on_conflict_do_update(
+                index_elements=[ProjectCounter.project_id],
+                set_={"artifacts": stmt.excluded.artifacts, "refreshed_at": stmt.excluded.refreshed_at},
+            ))
+            await own.commit()
+    except Exception as e:
+        # счётчик пересчитается при следующем обращении
+        logger.warning(f"Could not store project counters: {e}")
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed(session, flush_context) -> None:
+    delta: Counter = Counter()
+    for obj in session.new:
+        if isinstance(obj, Artifact) and obj.project_id is not None:
+            delta[obj.project_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Artifact) and obj.project_id is not None:
+            delta[obj.project_id] -= 1
+    for pid, d in delta.items():
+        if d:
+            # нет строки счётчика — UPDATE ничего не затронет, её создаст первый пересчёт
+            session.execute(
+                sa.update(ProjectCounter).where(ProjectCounter.project_id == pid)
+                .values(artifacts=sa.func.greatest(ProjectCounter.artifacts + d, 0))
+            )
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_artifacts(state) -> None:
+    global _bulk_changed_at
+    if (state.is_delete or state.is_insert) and getattr(getattr(state.statement, "table", None), "name", None) == "artifacts":
+        _bulk_changed_at = _utcnow()
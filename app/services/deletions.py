@@ -0,0 +1,163 @@
+"""Delayed message deletion: one scheduler instead of a sleeping task per message.
+
+Эфемерные сообщения («Обрабатываю предыдущий запрос…», подсказки, тосты в чат)
+ставятся в TTLStore по (chat_id, message_id); один таймер снимает наступившие
+дедлайны и удаляет их пачками по чату через deleteMessages с приоритетом уборки —
+отдельной задачей на чат, так что занятый (ждущий лимита) чат не держит таймер.
+Отложенные удаления пишутся в pending_deletions (пачкой раз в
+DELETION_PERSIST_SECONDS) и поднимаются при старте — рестарт не оставляет
+сообщения висеть. Несколько реплик поднимут одни и те же строки — повторное
+удаление безвредно (NotFound подавляется).
+"""
+from __future__ import annotations
+import os
+import asyncio
+import logging
+import datetime as dt
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from aiogram import Bot
+
+from app.db import session_scope
+from app.models import PendingDeletion
+from app.utils.ttl import TTLStore
+from app.utils.tg import delete_messages
+from app.utils.outbound import outbound_priority, PRIORITY_CLEANUP
+
+logger = logging.getLogger(__name__)
+
+DELETION_PERSIST_SECONDS = float(os.getenv("DELETION_PERSIST_SECONDS", "1"))
+# Удаление может опоздать на столько, зато всё, что истекает рядом, уходит одним deleteMessages
+DELETION_LINGER_SECONDS = float(os.getenv("DELETION_LINGER_SECONDS", "0.5"))
+
+Key = Tuple[int, int]  # (chat_id, message_id)
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+class DeletionScheduler:
+    """Priority queue of (due, chat_id, msg_id) with per-chat batched deletes and a persisted backlog."""
+
+    def __init__(self, bot: Bot, persist: bool = True, linger: float = DELETION_LINGER_SECONDS):
+        self.bot = bot
+        self.persist = persist
+        self.linger = linger
+        self.store = TTLStore(on_expire=self._delete_due)
+        self.api_calls = 0
+        # ещё не записанные / уже удалённые — пишутся в БД одной пачкой
+        self._unsaved: Dict[Key, dt.datetime] = {}
+        self._done: Set[Key] = set()
+        self._tasks: Set[asyncio.Task] = set()  # удаления в работе, по задаче на чат
+
+    def schedule(self, chat_id: int, msg_id: int, delay: float) -> None:
+        key = (chat_id, msg_id)
+        self.store.set(key, None, max(0.0, delay))
+        if self.persist:
+            self._unsaved[key] = _utcnow() + dt.timedelta(seconds=delay)
+            self._done.discard(key)
+
+    def cancel(self, chat_id: int, msg_id: int) -> None:
+        key = (chat_id, msg_id)
+        self.store.pop(key)
+        self._forget([key])
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _delete_due(self, items: List[Tuple[Key, None]]) -> None:
+        by_chat: Dict[int, List[int]] = defaultdict(list)
+        for (chat_id, msg_id), _ in items:
+            by_chat[chat_id].append(msg_id)
+        for chat_id, ids in by_chat.items():
+            task = asyncio.create_task(self._delete_chat(chat_id, ids))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _delete_chat(self, chat_id: int, ids: List[int]) -> None:
+        try:
+            with outbound_priority(PRIORITY_CLEANUP):
+                self.api_calls += await delete_messages(self.bot, chat_id, ids)
+        except Exception as e:
+            logger.warning(f"Delayed delete failed in chat {chat_id}: {e}")
+        self._forget([(chat_id, m) for m in ids])
+
+    def _forget(self, keys: List[Key]) -> None:
+        for key in keys:
+            # не успели записать — и записывать не нужно
+            if self._unsaved.pop(key, None) is None and self.persist:
+                self._done.add(key)
+
+    async def restore(self) -> int:
+        """Schedule deletions persisted before a restart (overdue ones right away)."""
+        async with session_scope() as st:
+            res = await st.execute(sa.select(PendingDeletion.chat_id, PendingDeletion.message_id, PendingDeletion.due_at))
+            rows = res.all()
+        now = _utcnow()
+        for chat_id, msg_id, due_at in rows:
+            self.store.set((chat_id, msg_id), None, max(0.0, (due_at - now).total_seconds()))
+        return len(rows)
+
+    async def flush(self) -> None:
+        """Write newly scheduled deletions and drop finished ones in pending_deletions."""
+        new, done = self._unsaved, self._done
+        self._unsaved, self._done = {}, set()
+        if not new and not done:
+            return
+        try:
+            async with session_scope() as st:
+                if new:
+                    stmt = pg_insert(PendingDeletion).values(
+                        [{"chat_id": c, "message_id": m, "due_at": due} for (c, m), due in new.items()])
+                    await st.execute(stmt.on_conflict_do_update(
+                        index_elements=[PendingDeletion.chat_id, PendingDeletion.message_id],
+                        set_={"due_at": stmt.excluded.due_at}))
+                if done:
+                    await st.execute(sa.delete(PendingDeletion).where(
+                        sa.tuple_(PendingDeletion.chat_id, PendingDeletion.message_id).in_(list(done))))
+                await st.commit()
+        except Exception as e:
+            logger.warning(f"Could not persist pending deletions: {e}")
+            # вернуть в очередь записи (новые записи поверх старых)
+            self._unsaved = {**new, **self._unsaved}
+            self._done |= done
+
+    async def _persist_loop(self) -> None:
+        while True:
+            await asyncio.sleep(DELETION_PERSIST_SECONDS)
+            await self.flush()
+
+    async def run(self) -> None:
+        if self.persist:
+            try:
+                n = await self.restore()
+                if n:
+                    logger.info(f"Restored {n} pending message deletions")
+            except Exception as e:
+                logger.warning(f"Could not restore pending deletions: {e}")
+        tasks = [asyncio.create_task(self.store.run(self.linger))]
+        if self.persist:
+            tasks.append(asyncio.create_task(self._persist_loop()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks + list(self._tasks):
+                t.cancel()
+
+_scheduler: Optional[DeletionScheduler] = None
+
+def start_deletion_scheduler(bot: Bot) -> asyncio.Task:
+    global _scheduler
+    _scheduler = DeletionScheduler(bot)
+    return asyncio.create_task(_scheduler.run())
+
+def schedule_delete(bot: Bot, chat_id: int, msg_id: int, delay: float) -> None:
+    """Delete a message after delay seconds (no task per message once the scheduler runs)."""
+    if _scheduler is not None and _scheduler.bot is bot:
+        _scheduler.schedule(chat_id, msg_id, delay)
+        return
+    # вне бота (утилиты, другой Bot) — по-старому, задачей
+    from app.utils.tg import _delayed_delete
+    asyncio.create_task(_delayed_delete(bot, chat_id, msg_id, delay))
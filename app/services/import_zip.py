@@ -1,8 +1,9 @@
 from __future__ import annotations
 import zipfile, io, re, secrets
 from app.services.artifacts import create_import
-from app.ignore import should_ignore
-from app.utils.zipfix import fix_zip_name, decode_text_bytes   # у тебя уже есть
+from app.ignore import default_spec
+from app.utils.zipfix import fix_zip_name   # у тебя уже есть
+from app.utils.sniff import read_zip_member_text
 from zoneinfo import ZoneInfo
 from datetime import datetime
 from typing import List, Tuple, Optional
@@ -34,16 +35,18 @@ async def import_zip_bytes(session, project, data: bytes, base_name: str,
     date_tag = f"rel-{datetime.now(BERLIN).date().isoformat()}"
     batch = _rand_batch()
     batch_tag = f"batch-{batch}"
+    spec = default_spec()
     for info in z.infolist():
         if info.is_dir():
             continue
         fixed_name = fix_zip_name(info.filename, info.flag_bits)
-        if should_ignore(fixed_name):
+        if spec.match_file(fixed_name):
             continue
         if not fixed_name.lower().endswith((".md",".txt",".json")):
             continue
-        raw = z.read(info)
-        text = decode_text_bytes(raw)
+        text = read_zip_member_text(z, info)
+        if text is None:
+            continue  # бинарник под текстовым расширением
         # авто-теги этого файла
         per_file = [date_tag, batch_tag]
         nt = _name_tag_from_basename(fixed_name)
@@ -0,0 +1,319 @@
+"""Durable background job queue backed by the `jobs` table.
+
+Хендлеры кладут задачу (submit_job / enqueue) и сразу отвечают; N воркеров забирают
+задачи через SELECT … FOR UPDATE SKIP LOCKED, шлют прогресс в исходный чат,
+повторяют упавшие с бэкоффом и поддерживают отмену. Задачи, которые выполнялись
+в момент рестарта, возвращаются в очередь по истечении аренды (JOB_LEASE_SECONDS).
+"""
+from __future__ import annotations
+import os
+import time
+import asyncio
+import logging
+import datetime as dt
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import event, select, text, update, and_, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db import session_scope
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "15"))
+# Не чаще одного edit'а прогресса за столько секунд
+JOB_PROGRESS_MIN_INTERVAL = float(os.getenv("JOB_PROGRESS_MIN_INTERVAL", "2"))
+
+ACTIVE_STATUSES = ("queued", "running")
+# предикат частичного индекса ux_jobs_dedupe_active — литералом, чтобы ON CONFLICT его вывел
+_ACTIVE_WHERE = "status IN ('queued', 'running')"
+
+class JobCancelled(Exception):
+    """Raised inside a job when the user asked to cancel it."""
+
+@dataclass
+class JobContext:
+    job_id: int
+    kind: str
+    payload: Dict[str, Any]
+    user_id: int
+    chat_id: Optional[int]
+    attempt: int
+    bot: Optional[Bot]
+    progress_msg_id: Optional[int] = None
+    _last_progress: float = field(default=0.0, repr=False)
+
+    async def progress(self, text: str, force: bool = False) -> None:
+        """Update job progress (DB + status message in chat); raises JobCancelled if cancel was requested."""
+        now = time.monotonic()
+        throttled = not force and now - self._last_progress < JOB_PROGRESS_MIN_INTERVAL
+        async with session_scope() as st:
+            res = await st.execute(
+                update(Job).where(Job.id == self.job_id)
+                .values(**({} if throttled else {"progress": text[:256]}), locked_at=_utcnow())
+                .returning(Job.cancel_requested)
+            )
+            cancel = bool(res.scalar())
+            await st.commit()
+        if cancel:
+            raise JobCancelled()
+        if throttled:
+            return
+        self._last_progress = now
+        await self._edit_status(f"⏳ Job #{self.job_id} ({self.kind}): {text}", with_cancel=True)
+
+    async def send(self, text: str, **kwargs):
+        """Send a message to the chat that started the job."""
+        if self.bot and self.chat_id:
+            return await self.bot.send_message(self.chat_id, text, **kwargs)
+
+    async def _edit_status(self, text: str, with_cancel: bool = False) -> None:
+        if not self.bot or not self.chat_id:
+            return
+        kb = cancel_kb(self.job_id) if with_cancel else None
+        try:
+            if self.progress_msg_id:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.progress_msg_id, reply_markup=kb)
+                return
+        except Exception as e:
+            # "message is not modified" / сообщение удалено — шлём новое ниже только во втором случае
+            if "not modified" in str(e):
+                return
+        try:
+            msg = await self.bot.send_message(self.chat_id, text, reply_markup=kb)
+            self.progress_msg_id = msg.message_id
+        except Exception as e:
+            logger.warning(f"Job #{self.job_id}: status message failed: {e}")
+
+JobHandler = Callable[[JobContext], Awaitable[Optional[Dict[str, Any]]]]
+_HANDLERS: Dict[str, JobHandler] = {}
+_MAX_ATTEMPTS: Dict[str, int] = {}
+
+def job_handler(kind: str, max_attempts: int = 3):
+    """Register a coroutine as the handler for jobs of this kind."""
+    def deco(fn: JobHandler) -> JobHandler:
+        _HANDLERS[kind] = fn
+        _MAX_ATTEMPTS[kind] = max_attempts
+        return fn
+    return deco
+
+_wakeup = asyncio.Event()
+
+def _utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+def _wake_workers() -> None:
+    try:
+        asyncio.get_running_loop().call_soon(_wakeup.set)
+    except RuntimeError:
+        pass
+
+# Будим воркеров после COMMIT транзакции, поставившей задачу: до него они её не увидят
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session) -> None:
+    if session.info.pop("jobs_enqueued", False):
+        _wake_workers()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session) -> None:
+    session.info.pop("jobs_enqueued", None)
+
+def cancel_kb(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⏹ Отменить", callback_data=f"job:cancel:{job_id}")
+    ]])
+
+async def enqueue(
+    st: AsyncSession,
+    kind: str,
+    payload: Dict[str, Any],
+    user_id: int | None = None,
+    chat_id: int | None = None,
+    dedupe_key: str | None = None,
+) -> Job | None:
+    """Add a job in the caller's transaction (caller commits). Returns None if an active duplicate exists.
+
+    Дубль отсекает частичный уникальный индекс ux_jobs_dedupe_active (ON CONFLICT DO
+    NOTHING) — и между репликами, и между параллельными хендлерами.
+    """
+    stmt = pg_insert(Job).values(kind=kind, payload=payload, user_id=user_id, chat_id=chat_id,
+                                 dedupe_key=dedupe_key, max_attempts=_MAX_ATTEMPTS.get(kind, 3),
+                                 status="queued", attempts=0, cancel_requested=False)
+    if dedupe_key:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Job.dedupe_key],
+                                           index_where=text(_ACTIVE_WHERE))
+    job = (await st.execute(stmt.returning(Job))).scalar_one_or_none()
+    if job is None:
+        return None
+    st.sync_session.info["jobs_enqueued"] = True
+    return job
+
+async def submit_job(bot: Bot | None, chat_id: int, user_id: int, kind: str, payload: Dict[str, Any], title: str,
+                     dedupe_key: str | None = None) -> int | None:
+    """Enqueue a job from a handler and post its status message (with a cancel button) to the chat.
+
+    Returns None if the same job (dedupe_key) is already queued or running.
+    """
+    async with session_scope() as st:
+        job = await enqueue(st, kind, payload, user_id=user_id, chat_id=chat_id, dedupe_key=dedupe_key)
+        if job is None:
+            return None
+        if bot:
+            try:
+                msg = await bot.send_message(chat_id, f"⏳ Job #{job.id}: {title} — в очереди", reply_markup=cancel_kb(job.id))
+                job.progress_msg_id = msg.message_id
+            except Exception as e:
+                logger.warning(f"Job #{job.id}: could not post status message: {e}")
+        await st.commit()
+        return job.id
+
+async def cancel_job(job_id: int, user_id: int) -> str | None:
+    """Cancel a queued job right away or flag a running one. Returns the new status or None."""
+    async with session_scope() as st:
+        job = await st.get(Job, job_id, with_for_update=True)
+        if not job or job.user_id != user_id or job.status not in ACTIVE_STATUSES:
+            return None
+        if job.status == "queued":
+            job.status = "cancelled"
+        else:
+            job.cancel_requested = True
+        await st.commit()
+        return job.status
+
+async def list_jobs(st: AsyncSession, user_id: int, limit: int = 10) -> list[Job]:
+    res = await st.execute(select(Job).where(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit))
+    return list(res.scalars())
+
+async def _claim() -> Job | None:
+    """Atomically take the oldest runnable job (or one whose lease expired).
+
+    Задача с истёкшей арендой, у которой попытки кончились (процесс падал на ней
+    каждый раз), не берётся снова, а помечается failed.
+    """
+    now = _utcnow()
+    stale = now - dt.timedelta(seconds=JOB_LEASE_SECONDS)
+    async with session_scope() as st:
+        while True:
+            res = await st.execute(
+                select(Job)
+                .where(or_(
+                    and_(Job.status == "queued", Job.run_after <= now),
+                    and_(Job.status == "running", Job.locked_at < stale),
+                ))
+                .order_by(Job.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = res.scalar_one_or_none()
+            if not job:
+                return None
+            if job.status == "running" and (job.attempts or 0) >= job.max_attempts:
+                logger.error(f"Job #{job.id} ({job.kind}): lease expired after {job.attempts} attempts, giving up")
+                job.status = "failed"
+                job.error = "lease expired after max attempts"
+                job.locked_at = None
+                await st.commit()
+                continue
+            break
+        job.status = "running"
+        job.attempts = (job.attempts or 0) + 1
+        job.locked_at = now
+        await st.commit()
+        return job
+
+async def _heartbeat(job_id: int) -> None:
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            async with session_scope() as st:
+                await st.execute(update(Job).where(Job.id == job_id, Job.status == "running").values(locked_at=_utcnow()))
+                await st.commit()
+        except Exception as e:
+            logger.warning(f"Job #{job_id}: heartbeat failed: {e}")
+
+async def _finish(job_id: int, **values) -> None:
+    async with session_scope() as st:
+        await st.execute(update(Job).where(Job.id == job_id).values(locked_at=None, **values))
+        await st.commit()
+
+async def _run_one(job: Job, bot: Bot | None) -> None:
+    ctx = JobContext(job_id=job.id, kind=job.kind, payload=dict(job.payload or {}),
+                     user_id=job.user_id or 0, chat_id=job.chat_id, attempt=job.attempts,
+                     bot=bot, progress_msg_id=job.progress_msg_id)
+    handler = _HANDLERS.get(job.kind)
+    if not handler:
+        logger.error(f"Job #{job.id}: no handler for kind {job.kind!r}")
+        await _finish(job.id, status="failed", error=f"unknown job kind {job.kind}")
+        return
+    if job.cancel_requested:
+        await _finish(job.id, status="cancelled")
+        await ctx._edit_status(f"⏹ Job #{job.id} ({job.kind}) отменён")
+        return
+
+    logger.debug(f"Job #{job.id} start: kind={job.kind} attempt={job.attempts}/{job.max_attempts}")
+    hb = asyncio.create_task(_heartbeat(job.id))
+    started = time.monotonic()
+    try:
+        result = await handler(ctx)
+    except JobCancelled:
+        await _finish(job.id, status="cancelled")
+        await ctx._edit_status(f"⏹ Job #{job.id} ({job.kind}) отменён")
+    except asyncio.CancelledError:
+        # воркер останавливается — задача вернётся в очередь по истечении аренды
+        raise
+    except Exception as e:
+        logger.exception(f"Job #{job.id} ({job.kind}) failed: {e}")
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+            await _finish(job.id, status="queued", error=str(e)[:2000],
+                          run_after=_utcnow() + dt.timedelta(seconds=delay))
+            await ctx._edit_status(f"🔁 Job #{job.id} ({job.kind}): ошибка, повтор через {delay}s", with_cancel=True)
+        else:
+            await _finish(job.id, status="failed", error=str(e)[:2000])
+            await ctx._edit_status(f"❌ Job #{job.id} ({job.kind}) не выполнен: {str(e)[:300]}")
+    else:
+        await _finish(job.id, status="done", result=result or {}, error=None)
+        await ctx._edit_status(f"✅ Job #{job.id} ({job.kind}) готов")
+    finally:
+        hb.cancel()
+    logger.debug(f"Job #{job.id} end: kind={job.kind} duration_ms={int((time.monotonic() - started) * 1000)}")
+
+async def _worker(n: int, bot: Bot | None) -> None:
+    logger.info(f"Job worker {n} started")
+    while True:
+        try:
+            job = await _claim()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Job worker {n}: claim failed: {e}")
+            job = None
+        if job:
+            try:
+                await _run_one(job, bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # не удалось даже записать итог — задача вернётся в очередь по истечении аренды
+                logger.exception(f"Job worker {n}: job #{job.id} crashed: {e}")
+            else:
+                continue
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+def start_job_workers(bot: Bot | None, count: int = JOB_WORKERS) -> list[asyncio.Task]:
+    """Spawn worker coroutines in the current loop. Separate processes can run the same loop safely."""
+    return [asyncio.create_task(_worker(i, bot)) for i in range(count)]
@@ -3,9 +3,7 @@ import os
 import logging
 import asyncio
 import time
-from typing import Tuple, List, Dict, Any, Optional
-from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletionMessageParam
+from typing import TYPE_CHECKING, Tuple, List, Dict, Any, Optional
 
 from app.config import settings
 
@@ -18,8 +16,19 @@ LLM_MAX_TOKENS_OUT = int(os.getenv("LLM_MAX_TOKENS_OUT", "2048"))
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
 LLM_DISABLED = os.getenv("LLM_DISABLED", "0") == "1"
 
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=settings.openai_api_key) if settings.openai_api_key else None
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from openai.types.chat import ChatCompletionMessageParam
+
+# OpenAI client is created on first use (or by the startup warm-up) — import openai is slow
+client: "Optional[AsyncOpenAI]" = None
+
+def get_client() -> "Optional[AsyncOpenAI]":
+    global client
+    if client is None and settings.openai_api_key:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=settings.openai_api_key)
+    return client
 
 # HOTFIX: put near your OpenAI call builder
 TEMPERATURE_SUPPORTED = (
@@ -56,6 +65,11 @@ def build_openai_payload(model: str, messages: list, *, temperature: float|None,
 
     return payload
 
+def _cached_tokens(usage: Any) -> int:
+    """Extract cached prompt tokens from usage.prompt_tokens_details (0 if not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return int(getattr(details, "cached_tokens", 0) or 0) if details else 0
+
 async def call_llm(
     system_prompt: str,
     context_prompt: str,
@@ -74,13 +88,17 @@ async def call_llm(
     if LLM_DISABLED:
         return "LLM functionality is currently disabled.", {}
     
+    client = get_client()
     if not client:
         raise ValueError("OpenAI API key not configured")
     
-    # Combine prompts
+    # Cache-friendly layout: static system block -> sources -> question.
+    # Вопрос всегда последний, чтобы общий префикс (system + context) совпадал
+    # между уточнениями и попадал в prompt caching провайдера.
     messages: List[ChatCompletionMessageParam] = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": context_prompt + "\n\n" + user_prompt}
+        {"role": "user", "content": context_prompt},
+        {"role": "user", "content": user_prompt}
     ]
     
     start_time = time.time()
@@ -111,6 +129,7 @@ async def call_llm(
             "model": model,
             "tokens_in": response.usage.prompt_tokens if response.usage else 0,
             "tokens_out": response.usage.completion_tokens if response.usage else 0,
+            "tokens_cached": _cached_tokens(response.usage),
             "duration_ms": int(duration * 1000)
         }
         
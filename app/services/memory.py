@@ -81,16 +81,25 @@ async def gather_context(session: AsyncSession, project: Project, user_id: int |
     
     # Get artifacts (with potential filtering)
     artifacts = await list_artifacts(session, [project.id], kinds=kinds, tags=tags)
-    
-    context_chunks: list[str] = []
+    return await _collect_chunks(session, artifacts, max_chunks)
+
+async def _collect_chunks(session: AsyncSession, artifacts: list[Artifact], max_chunks: int) -> list[str]:
+    """Take up to max_chunks (newest artifacts first), return them in stable (artifact_id, idx) order.
+
+    Стабильный порядок нужен для prompt caching: тот же набор чанков даёт тот же префикс промпта.
+    """
+    picked: list[tuple[int, int, str]] = []
     for art in artifacts:
         res2 = await session.execute(select(Chunk).where(Chunk.artifact_id == art.id).order_by(Chunk.idx.asc()))
         chs = list(res2.scalars().all())
         for c in chs:
-            if len(context_chunks) >= max_chunks:
-                return context_chunks
-            context_chunks.append(c.text)
-    return context_chunks
+            if len(picked) >= max_chunks:
+                break
+            picked.append((art.id, c.idx, c.text))
+        if len(picked) >= max_chunks:
+            break
+    picked.sort(key=lambda t: (t[0], t[1]))
+    return [text for _, _, text in picked]
 
 async def set_context_filters(session: AsyncSession, user_id: int, kinds_csv: str = "", tags_csv: str = ""):
     """Set context filtering preferences for a user."""
@@ -245,18 +254,7 @@ async def gather_context_sources(
         return []
         
     artifacts = await list_artifacts(session, [proj.id], kinds=set(kinds) if kinds else None, tags=set(tags) if tags else None)
-    
-    context_chunks: list[str] = []
-    for art in artifacts:
-        from sqlalchemy import select
-        from app.models import Chunk
-        res2 = await session.execute(select(Chunk).where(Chunk.artifact_id == art.id).order_by(Chunk.idx.asc()))
-        chs = list(res2.scalars().all())
-        for c in chs:
-            if len(context_chunks) >= max_chunks:
-                return context_chunks
-            context_chunks.append(c.text)
-    return context_chunks
+    return await _collect_chunks(session, artifacts, max_chunks)
 
 
 async def fetch_chunks_for_question(st, user_id, project_id, model: str):
@@ -271,7 +269,8 @@ async def fetch_chunks_for_question(st, user_id, project_id, model: str):
     # упаковать под бюджет
     # For now, we'll just return the chunks as-is
     # In a real implementation, you might want to implement token-based packing
-    approx_tokens = sum(len(chunk) // 4 for chunk in chunks)  # Rough estimate
+    from app.tokenizer import count_tokens
+    approx_tokens = sum(count_tokens(chunk, model=model) for chunk in chunks)
     return chunks, approx_tokens, bool(sel_ids), stt.auto_clear_selection
 
 
@@ -0,0 +1,233 @@
+"""In-process cache for the single-message list panels (Memory / ASK).
+
+Страница панели кэшируется по (проекты, запрос, позиция, версии этих проектов);
+выбор источников накладывается при отрисовке и хранится во view панели вместе
+с версией выбора пользователя. Версии поднимаются хуками SQLAlchemy на запись в
+artifacts/tags, которая меняет видимое в панели (заголовок, дата, теги, проект),
+— только у затронутого проекта; массовый оператор без явного project_id в WHERE
+поднимает общую эпоху. Фоновые UPDATE резюме/ключевых слов панели не трогают.
+Смена UserState.selected_artifact_ids поднимает версию выбора, так что хендлерам
+не нужно помнить про инвалидацию. Хуки только копят затронутое в session.info,
+а версии поднимаются после COMMIT (при откате — забываются): иначе панель,
+отрисованная между flush и commit, закэширует старые строки под новой версией.
+TTL — страховка от записей мимо ORM.
+"""
+from __future__ import annotations
+import os
+import time
+import datetime as dt
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from app.models import Artifact, UserState
+
+PANEL_CACHE_TTL = float(os.getenv("PANEL_CACHE_TTL", "300"))
+PANEL_CACHE_SIZE = 2000
+PANEL_VIEWS_SIZE = 5000
+
+class PanelItem(NamedTuple):
+    id: int
+    title: str
+    tags: Tuple[str, ...]
+    created_at: Optional[dt.datetime]
+
+class PanelPos(NamedTuple):
+    """Keyset position of a page: its number (for display) and the (created_at, id) cursor it seeks from.
+
+    cursor=None — первая страница; back=True — страница перед cursor (кнопка «Назад»).
+    """
+    page: int = 1
+    cursor: Optional[str] = None
+    back: bool = False
+
+class PanelPage(NamedTuple):
+    items: Tuple[PanelItem, ...]
+    pos: PanelPos
+    has_prev: bool
+    has_next: bool
+    total: Optional[int]  # приблизительно, из счётчиков; None — для поиска не считаем
+    page_size: int
+
+    @property
+    def page(self) -> int:
+        return self.pos.page
+
+    @property
+    def total_pages(self) -> Optional[int]:
+        if self.total is None:
+            return None
+        return max(1, (self.total + self.page_size - 1) // self.page_size)
+
+@dataclass
+class PanelView:
+    """What a panel message shows — enough to render any page without reading UserState."""
+    kind: str
+    user_id: int
+    project_ids: Tuple[int, ...]
+    query: Optional[str]
+    pos: PanelPos = PanelPos()
+    selected: FrozenSet[int] = frozenset()
+    sel_version: Optional[Tuple[int, int]] = None  # None — выбор ещё не прочитан
+
+_content_epoch = 0
+_project_versions: Dict[int, int] = defaultdict(int)
+_sel_epoch = 0
+_sel_versions: Dict[int, int] = defaultdict(int)
+# страницы и (по total_key) приблизительные итоги проектов
+_pages: "OrderedDict[Hashable, Tuple[float, PanelPage | int]]" = OrderedDict()
+_views: "OrderedDict[Tuple[int, int], PanelView]" = OrderedDict()
+
+def bump_content_version(project_ids: Optional[Iterable[int]] = None) -> None:
+    """Invalidate panels of these projects (None — of all projects)."""
+    global _content_epoch
+    if project_ids is None:
+        _content_epoch += 1
+        _pages.clear()
+        return
+    pids = set(project_ids)
+    for pid in pids:
+        _project_versions[pid] += 1
+    # ключ страницы и итога: (..., project_ids, ...) на позиции 1
+    for key in [k for k in _pages if not pids.isdisjoint(k[1])]:
+        del _pages[key]
+
+def content_version(project_ids: Tuple[int, ...]) -> Tuple[int, Tuple[int, ...]]:
+    return _content_epoch, tuple(_project_versions.get(pid, 0) for pid in project_ids)
+
+def selection_version(user_id: int) -> Tuple[int, int]:
+    return _sel_epoch, _sel_versions[user_id]
+
+def page_key(view: PanelView, pos: PanelPos) -> Hashable:
+    return view.kind, view.project_ids, view.query, pos.cursor, pos.back, content_version(view.project_ids)
+
+def total_key(view: PanelView) -> Hashable:
+    return "total", view.project_ids, content_version(view.project_ids)
+
+def get_page(key: Hashable) -> Optional[PanelPage | int]:
+    hit = _pages.get(key)
+    if hit is None:
+        return None
+    stamp, pg = hit
+    if time.monotonic() - stamp > PANEL_CACHE_TTL:
+        del _pages[key]
+        return None
+    _pages.move_to_end(key)
+    return pg
+
+def put_page(key: Hashable, pg: PanelPage | int) -> None:
+    _pages[key] = (time.monotonic(), pg)
+    if len(_pages) > PANEL_CACHE_SIZE:
+        _pages.popitem(last=False)
+
+def panel_view(chat_id: int, message_id: int) -> Optional[PanelView]:
+    view = _views.get((chat_id, message_id))
+    if view is not None:
+        _views.move_to_end((chat_id, message_id))
+    return view
+
+def remember_view(chat_id: int, message_id: int, view: PanelView) -> None:
+    _views[(chat_id, message_id)] = view
+    if len(_views) > PANEL_VIEWS_SIZE:
+        _views.popitem(last=False)
+
+def forget_view(chat_id: int, message_id: int) -> None:
+    _views.pop((chat_id, message_id), None)
+
+# --- инвалидация по записям в БД ---
+
+_CONTENT_TABLES = frozenset({"artifacts", "artifact_tags", "tags"})
+# что видно в панели (и по чему она фильтрует); остальные колонки artifacts — нет
+_PANEL_ATTRS = ("title", "created_at", "project_id", "tags")
+
+def _where_projects(stmt) -> Optional[FrozenSet[int]]:
+    """Projects pinned by a top-level `artifacts.project_id == x` / `IN (...)` conjunct of WHERE, else None."""
+    where = getattr(stmt, "whereclause", None)
+    if where is None:
+        return None
+    terms = where.clauses if getattr(where, "operator", None) is operators.and_ else [where]
+    for t in terms:
+        if not (isinstance(t, BinaryExpression) and isinstance(t.right, BindParameter)):
+            continue
+        if getattr(t.left, "table", None) is not Artifact.__table__ or t.left.key != "project_id":
+            continue
+        if t.operator is operators.eq:
+            return frozenset([t.right.value])
+        if t.operator is operators.in_op:
+            return frozenset(t.right.value)
+    return None
+
+def _updated_columns(state) -> Optional[set]:
+    """Column names an UPDATE sets (from .values() or executemany parameters); None if unknown."""
+    values = getattr(state.statement, "_values", None)
+    if values:
+        return {getattr(k, "key", k) for k in values}
+    params = state.parameters
+    if isinstance(params, dict) and params:
+        return set(params)
+    if isinstance(params, (list, tuple)) and params and all(isinstance(p, dict) for p in params):
+        return set().union(*params)
+    return None
+
+def _defer(session, key: str, values: Iterable) -> None:
+    """Remember what this transaction touched; applied in after_commit (None — everything)."""
+    session.info.setdefault(key, set()).update(values)
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context) -> None:
+    touched = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Artifact):
+            touched.add(obj.project_id)
+    for obj in session.dirty:
+        if isinstance(obj, Artifact):
+            attrs = inspect(obj).attrs
+            if any(attrs[a].history.has_changes() for a in _PANEL_ATTRS):
+                touched.add(obj.project_id)
+                touched.update(attrs.project_id.history.deleted)  # перенос в другой проект
+        elif isinstance(obj, UserState) and inspect(obj).attrs.selected_artifact_ids.history.has_changes():
+            _defer(session, "panel_selections", [obj.user_id])
+    touched.discard(None)
+    if touched:
+        _defer(session, "panel_projects", touched)
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(state) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    name = getattr(getattr(state.statement, "table", None), "name", None)
+    if name in _CONTENT_TABLES:
+        if name == "tags" and state.is_insert:
+            return  # новое имя тега в панели не видно, пока его нет в artifact_tags
+        if name == "artifacts" and state.is_update:
+            cols = _updated_columns(state)
+            if cols is not None and cols.isdisjoint(_PANEL_ATTRS):
+                return  # резюме, ключевые слова, статусы — панель их не показывает
+        projects = _where_projects(state.statement) if name == "artifacts" and not state.is_insert else None
+        _defer(state.session, "panel_projects", projects if projects is not None else [None])
+    elif name == "user_state":
+        # массовый UPDATE мимо объектов — сбрасываем выбор у всех view
+        _defer(state.session, "panel_selections", [None])
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session) -> None:
+    global _sel_epoch
+    projects = session.info.pop("panel_projects", None)
+    if projects:
+        bump_content_version(None if None in projects else projects)
+    users = session.info.pop("panel_selections", None)
+    if users:
+        if None in users:
+            _sel_epoch += 1
+        for uid in users - {None}:
+            _sel_versions[uid] += 1
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session) -> None:
+    session.info.pop("panel_projects", None)
+    session.info.pop("panel_selections", None)
@@ -39,11 +39,13 @@ def build_context_prompt(sources: List[Dict[str, Any]]) -> str:
     
     context_parts = ["SOURCES:"]
     
-    for source in sources:
+    # Стабильный порядок (id источника, idx чанка): одинаковый набор источников
+    # даёт побайтно одинаковый префикс, и провайдер может переиспользовать кэш промпта
+    for source in sorted(sources, key=lambda s: s["id"]):
         source_id = source["id"]
         title = source["title"]
-        tags = source.get("tags", [])
-        chunks = source.get("chunks", [])
+        tags = sorted(source.get("tags", []))
+        chunks = sorted(source.get("chunks", []), key=lambda c: c.get("idx", 0))
         
         # Add source header
         tag_str = " ".join([f"#{tag}" for tag in tags]) if tags else ""
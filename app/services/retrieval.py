@@ -1,18 +1,57 @@
 """Retrieval service for loading content from selected sources."""
+import os
 import logging
-import unicodedata
+from collections import OrderedDict
 from typing import List, Tuple, Dict, Any
 from sqlalchemy import select
 
 from app.db import session_scope
 from app.models import Artifact, Chunk
 from app.services.memory import get_linked_project_ids
+from app.utils.textnorm import normalize_text
+from app.tokenizer import count_tokens, encoding_for_model, encoding_label
 
 logger = logging.getLogger(__name__)
 
-async def load_selected_sources(user_id: int, selected_artifact_ids: List[int]) -> Tuple[List[Dict[str, Any]], int]:
+# Новые чанки нормализуются при импорте; старые — один раз на chunk id и кэшируются
+NORMALIZE_CACHE_SIZE = int(os.getenv("NORMALIZE_CACHE_SIZE", "20000"))
+_norm_cache: "OrderedDict[int, str]" = OrderedDict()
+
+def normalized_chunk_text(chunk_id: int, text: str) -> str:
+    """normalize_text(text) memoized by chunk id (chunk rows are immutable; re-import creates new ids)."""
+    cached = _norm_cache.get(chunk_id)
+    if cached is not None:
+        _norm_cache.move_to_end(chunk_id)
+        return cached
+    out = normalize_text(text)
+    _norm_cache[chunk_id] = out
+    if len(_norm_cache) > NORMALIZE_CACHE_SIZE:
+        _norm_cache.popitem(last=False)
+    return out
+
+# Chunk.tokens в чужой кодировке (старые строки, другая модель) пересчитываются один раз на (chunk id, кодировка)
+_token_cache: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+
+def chunk_token_count(chunk: Chunk, text: str, label: str) -> int:
+    """Token count of a chunk in encoding `label`: the stored value if it matches, else a memoized recount."""
+    if chunk.encoding == label and chunk.tokens:
+        return chunk.tokens
+    key = (chunk.id, label)
+    cached = _token_cache.get(key)
+    if cached is not None:
+        _token_cache.move_to_end(key)
+        return cached
+    n = count_tokens(text, encoding=None if label == "bytes" else label)
+    _token_cache[key] = n
+    if len(_token_cache) > NORMALIZE_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return n
+
+async def load_selected_sources(user_id: int, selected_artifact_ids: List[int],
+                                model: str | None = None) -> Tuple[List[Dict[str, Any]], int]:
     """
     Load content from selected sources (active + linked projects).
+    Token counts are in the encoding of `model` (default: the import encoding).
     
     Returns:
         Tuple of (sources_metadata, total_tokens)
@@ -34,13 +73,14 @@ async def load_selected_sources(user_id: int, selected_artifact_ids: List[int])
         query = select(Artifact).where(
             Artifact.id.in_(selected_artifact_ids),
             Artifact.project_id.in_(project_ids)
-        )
+        ).order_by(Artifact.id)  # stable order -> stable prompt prefix
         
         result = await session.execute(query)
         artifacts = result.scalars().all()
         
         sources_metadata = []
         total_tokens = 0
+        label = encoding_label(encoding_for_model(model) if model else None)
         
         # Process each artifact
         for artifact in artifacts:
@@ -55,17 +95,18 @@ async def load_selected_sources(user_id: int, selected_artifact_ids: List[int])
             
             for chunk in chunks:
                 # Normalize text
-                normalized_text = normalize_text(chunk.text)
+                normalized_text = normalized_chunk_text(chunk.id, chunk.text)
                 # Only include chunks with actual content
                 if normalized_text.strip():
+                    tokens = chunk_token_count(chunk, normalized_text, label)
                     normalized_chunks.append({
                         "idx": chunk.idx,
                         "text": normalized_text,
-                        "tokens": chunk.tokens or len(normalized_text) // 4  # Fallback estimation
+                        "tokens": tokens
                     })
                     
                     # Count tokens
-                    artifact_tokens += chunk.tokens or len(normalized_text) // 4
+                    artifact_tokens += tokens
             
             # Create source metadata (only if we have content)
             if normalized_chunks:
@@ -75,7 +116,9 @@ async def load_selected_sources(user_id: int, selected_artifact_ids: List[int])
                     "tags": [tag.name for tag in artifact.tags] if artifact.tags else [],
                     "created_at": artifact.created_at,
                     "chunks": normalized_chunks,
-                    "total_tokens": artifact_tokens
+                    "total_tokens": artifact_tokens,
+                    "summary": artifact.summary,
+                    "keywords": artifact.keywords or [],
                 }
                 
                 sources_metadata.append(source_metadata)
@@ -86,21 +129,6 @@ async def load_selected_sources(user_id: int, selected_artifact_ids: List[int])
         
         return sources_metadata, total_tokens
 
-def normalize_text(text: str) -> str:
-    """
-    Normalize text to UTF-8 NFC and clean control characters.
-    """
-    if not text:
-        return ""
-    
-    # Normalize to NFC form
-    normalized = unicodedata.normalize('NFC', text)
-    
-    # Remove null characters and control characters (except newlines and tabs)
-    cleaned = ''.join(char for char in normalized if char == '\n' or char == '\t' or not unicodedata.category(char).startswith('C'))
-    
-    return cleaned
-
 def remove_duplicate_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Remove duplicate sources based on content similarity.
@@ -112,6 +140,91 @@ def remove_duplicate_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, An
     # In a more advanced implementation, we could check for duplicate content
     return sources
 
+def _fit_text(text: str, limit: int, model: str | None = None) -> str:
+    """Longest prefix of text within limit tokens (пропорциональное укорачивание + пересчёт)."""
+    if limit <= 0:
+        return ""
+    while text:
+        n = count_tokens(text, model=model)
+        if n <= limit:
+            break
+        text = text[:max(0, len(text) * limit // n - 1)]
+    return text
+
+def pack_sources(sources: List[Dict[str, Any]], token_budget: int,
+                 model: str | None = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Fit sources into token_budget without silently dropping whole sources.
+
+    1. Пока не влезаем — самый большой полный источник заменяется его фоновым резюме.
+    2. Если сами резюме больше бюджета — они обрезаются, а затем убираются, начиная
+       с конца списка (источники идут по приоритету, первый — важнейший).
+    3. Если резюме не хватило (или их ещё нет) — оставшиеся полные источники режутся
+       поровну через extract_chunks_for_context в остаток бюджета.
+
+    stats["truncated"] — только источники, у которых действительно что-то отрезано.
+
+    Returns:
+        Tuple of (packed_sources, stats)
+    """
+    total = sum(s["total_tokens"] for s in sources)
+    stats = {"tokens_before": total, "summarized": [], "truncated": []}
+    if total <= token_budget:
+        stats["tokens_after"] = total
+        return sources, stats
+
+    packed = [dict(s) for s in sources]
+    # крупные первыми, при равенстве — по id (детерминированно для кэша промпта)
+    for src in sorted(packed, key=lambda s: (-s["total_tokens"], s["id"])):
+        if total <= token_budget:
+            break
+        summary = (src.get("summary") or "").strip()
+        if not summary:
+            continue
+        kw = src.get("keywords") or []
+        text = f"[summary] {summary}" + (f"\n[keywords] {', '.join(kw)}" if kw else "")
+        tokens = count_tokens(text, model=model)
+        if tokens >= src["total_tokens"]:
+            continue
+        total -= src["total_tokens"] - tokens
+        src["chunks"] = [{"idx": 0, "text": text, "tokens": tokens}]
+        src["total_tokens"] = tokens
+        src["summarized"] = True
+        stats["summarized"].append(src["id"])
+
+    if total > token_budget:
+        full = [s for s in packed if not s.get("summarized")]
+        summarized = [s for s in packed if s.get("summarized")]
+        over = sum(s["total_tokens"] for s in summarized) - token_budget
+        # резюме сами не влезают: режем/убираем с наименее приоритетного
+        for src in reversed(summarized):
+            if over <= 0:
+                break
+            text = _fit_text(src["chunks"][0]["text"], src["total_tokens"] - over, model)
+            tokens = count_tokens(text, model=model) if text else 0
+            over -= src["total_tokens"] - tokens
+            src["chunks"] = [{"idx": 0, "text": text, "tokens": tokens}] if text else []
+            src["total_tokens"] = tokens
+            stats["truncated"].append(src["id"])
+        # последний рубеж: режем полные источники в остаток бюджета
+        rest = token_budget - sum(s["total_tokens"] for s in summarized)
+        kept: Dict[int, List[Dict[str, Any]]] = {}
+        for ch in extract_chunks_for_context(full, max(0, rest)):
+            kept.setdefault(ch["source_id"], []).append(
+                {"idx": ch["chunk_idx"], "text": ch["text"], "tokens": ch["tokens"]}
+            )
+        for src in full:
+            chunks = kept.get(src["id"], [])
+            tokens = sum(c["tokens"] for c in chunks)
+            if tokens < src["total_tokens"]:
+                stats["truncated"].append(src["id"])
+            src["chunks"] = chunks
+            src["total_tokens"] = tokens
+        total = sum(s["total_tokens"] for s in packed)
+
+    stats["tokens_after"] = total
+    return packed, stats
+
 def extract_chunks_for_context(sources: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
     """
     Extract chunks from sources based on token budget.
@@ -135,7 +248,9 @@ def extract_chunks_for_context(sources: List[Dict[str, Any]], token_budget: int)
         
         # Take chunks until we exceed the budget for this source
         for chunk in source_chunks:
-            chunk_tokens = chunk.get("tokens", len(chunk.get("text", "")) // 4)
+            chunk_tokens = chunk.get("tokens")
+            if chunk_tokens is None:
+                chunk_tokens = count_tokens(chunk.get("text", ""))
             if source_tokens + chunk_tokens > budget_per_source:
                 break
                 
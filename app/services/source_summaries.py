@@ -0,0 +1,118 @@
+"""Background per-artifact summaries and keywords (compressed retrieval tier).
+
+Каждый новый источник ставит задачу source_summary в очередь jobs (в той же транзакции,
+что и сам артефакт). На старте resume_source_summaries() добирает всё, у чего
+summary IS NULL, так что генерация идемпотентна и продолжается после рестарта.
+"""
+from __future__ import annotations
+import os
+import re
+import logging
+from collections import Counter
+from typing import List
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import session_scope
+from app.models import Artifact
+from app.services.jobs import enqueue, job_handler, JobContext
+
+logger = logging.getLogger(__name__)
+
+SOURCE_SUMMARY_KINDS = ("import", "note")
+SOURCE_SUMMARY_MAX_TOKENS = int(os.getenv("SOURCE_SUMMARY_MAX_TOKENS", "300"))
+KEYWORDS_TOP_N = 12
+
+_WORD_RE = re.compile(r"[^\W\d_][\w-]{2,}", re.UNICODE)
+_STOPWORDS = frozenset("""
+the and for with that this from are was were have has not but you your all can will into
+its our their they them than then there what when which who how why also only over more
+self none true false return import def class const let var function
+это как что для или его она они при так уже все еще над под без чем где кто она оно
+быть был была были если когда тоже только также этот эта эти того чтобы может можно
+""".split())
+
+def extract_keywords(text: str, top_n: int = KEYWORDS_TOP_N) -> List[str]:
+    """Cheap local keyword extraction: most frequent non-stopword terms."""
+    if not text:
+        return []
+    counts = Counter(
+        w for w in (m.group(0).lower() for m in _WORD_RE.finditer(text[:200_000]))
+        if w not in _STOPWORDS
+    )
+    return [w for w, _ in counts.most_common(top_n)]
+
+async def enqueue_source_summary(st: AsyncSession, artifact_id: int) -> None:
+    """Queue summary generation for an artifact in the caller's transaction."""
+    from app.llm import LLM_DISABLED
+    if LLM_DISABLED:
+        return
+    await enqueue(st, "source_summary", {"artifact_id": artifact_id}, dedupe_key=f"summary:{artifact_id}")
+
+async def _pending_ids(limit: int) -> List[int]:
+    async with session_scope() as st:
+        res = await st.execute(
+            select(Artifact.id)
+            .where(
+                Artifact.summary.is_(None),
+                Artifact.kind.in_(SOURCE_SUMMARY_KINDS),
+                Artifact.summary_status.is_distinct_from("failed"),
+            )
+            .order_by(Artifact.id)
+            .limit(limit)
+        )
+        return [row[0] for row in res.all()]
+
+async def summarize_source(artifact_id: int, final_attempt: bool = True) -> bool:
+    """Generate summary + keywords for one artifact. Safe to call twice.
+
+    Ошибка LLM пробрасывается (задачу повторит очередь); на последней попытке
+    артефакт помечается failed, чтобы не крутиться вечно.
+    """
+    from app.services.summarizer import summarize_artifact
+
+    async with session_scope() as st:
+        art = await st.get(Artifact, artifact_id)
+        if not art or art.summary is not None:
+            return False
+        raw_text = art.raw_text or ""
+        try:
+            summary = await summarize_artifact(st, artifact_id, max_tokens=SOURCE_SUMMARY_MAX_TOKENS)
+        except Exception:
+            if not final_attempt:
+                raise
+            summary = ""
+        values = {"keywords": extract_keywords(raw_text)}
+        if summary:
+            values.update(summary=summary, summary_status="done")
+        else:
+            values.update(summary_status="failed")
+        # WHERE summary IS NULL — параллельный воркер/повторный запуск не перезапишет готовое
+        await st.execute(
+            update(Artifact)
+            .where(Artifact.id == artifact_id, Artifact.summary.is_(None))
+            .values(**values)
+        )
+        await st.commit()
+    return bool(summary)
+
+@job_handler("source_summary", max_attempts=3)
+async def _source_summary_job(ctx: JobContext):
+    artifact_id = int(ctx.payload["artifact_id"])
+    done = await summarize_source(artifact_id, final_attempt=ctx.attempt >= 3)
+    return {"artifact_id": artifact_id, "summarized": done}
+
+async def resume_source_summaries(limit: int = 5000) -> int:
+    """Startup sweep: queue summaries for artifacts that still have none (dedupe skips queued ones)."""
+    from app.llm import LLM_DISABLED
+    if LLM_DISABLED:
+        return 0
+    ids = await _pending_ids(limit)
+    async with session_scope() as st:
+        for artifact_id in ids:
+            await enqueue_source_summary(st, artifact_id)
+        await st.commit()
+    if ids:
+        logger.info(f"Queued source summaries for {len(ids)} artifacts")
+    return len(ids)
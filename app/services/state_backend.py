@@ -0,0 +1,231 @@
+"""Pluggable key-value state backend: in-memory or Postgres, with TTL and atomic ops.
+
+Короткоживущее состояние хендлеров (выбор тегов, последний документ, ожидание
+подтверждений, FSM aiogram) живёт здесь, а не в словарях модулей: с
+STATE_BACKEND=postgres его видят все реплики и оно переживает рестарт.
+Значения — JSON (списки вместо множеств). Атомарные операции (add, pop, toggle,
+merge) в Postgres — один оператор, в памяти — без await между чтением и записью.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import datetime as dt
+from typing import Any, Dict, Mapping, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from app.config import settings
+from app.models import KVState
+from app.utils.ttl import TTLStore
+
+# FSM без активности дольше — забывается (0 — хранить бессрочно)
+FSM_TTL = int(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+# Как часто чистить просроченные строки kv_state (не чаще, чем раз в N секунд на процесс)
+STATE_PURGE_SECONDS = 300
+# Потолок ключей в памяти: при переполнении первыми уходят ключи с ближайшим TTL
+STATE_MEMORY_MAX_KEYS = int(os.getenv("STATE_MEMORY_MAX_KEYS", "100000"))
+
+_MISSING = object()
+
+def _copy(value: Any) -> Any:
+    # одинаковая семантика для обоих бэкендов: только JSON, без общих изменяемых объектов
+    return json.loads(json.dumps(value))
+
+class StateBackend:
+    """Key-value store with per-key TTL (seconds; None — no expiry)."""
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Atomically set key only if it is absent or expired; True if this call set it."""
+        raise NotImplementedError
+
+    async def pop(self, key: str, default: Any = None) -> Any:
+        """Atomically read and delete."""
+        raise NotImplementedError
+
+    async def toggle(self, key: str, member: str, ttl: Optional[float] = None) -> bool:
+        """Atomically add/remove member of the list under key; True if it is there now."""
+        raise NotImplementedError
+
+    async def merge(self, key: str, patch: Mapping[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        """Atomically dict.update the mapping under key; returns the new mapping."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+class MemoryStateBackend(StateBackend):
+    """Per-process TTLStore: expired keys drop on read or as their deadline passes, size is bounded."""
+
+    def __init__(self, maxsize: int = STATE_MEMORY_MAX_KEYS):
+        self._data = TTLStore(maxsize=maxsize)
+
+    def _put(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self._data.set(key, value, ttl or None)
+        self._data.expire()  # только наступившие дедлайны, O(k log n)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+        return _copy(value) if value is not _MISSING else default
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._put(key, _copy(value), ttl)
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        if key in self._data:
+            return False
+        self._put(key, _copy(value), ttl)
+        return True
+
+    async def pop(self, key: str, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    async def toggle(self, key: str, member: str, ttl: Optional[float] = None) -> bool:
+        cur = list(self._data.get(key) or [])
+        present = member not in cur
+        cur = cur + [member] if present else [m for m in cur if m != member]
+        self._put(key, cur, ttl)
+        return present
+
+    async def merge(self, key: str, patch: Mapping[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        cur = dict(self._data.get(key) or {})
+        cur.update(_copy(dict(patch)))
+        self._put(key, cur, ttl)
+        return _copy(cur)
+
+class PostgresStateBackend(StateBackend):
+    """kv_state table shared by all replicas; each operation is one statement in its own session."""
+
+    def __init__(self):
+        self._purged_at = 0.0
+
+    @staticmethod
+    def _expires(ttl: Optional[float]):
+        # время сервера БД — одинаковое для всех реплик
+        return sa.func.now() + sa.literal(dt.timedelta(seconds=ttl)) if ttl else None
+
+    @staticmethod
+    def _alive():
+        return sa.or_(KVState.expires_at.is_(None), KVState.expires_at > sa.func.now())
+
+    async def _run(self, stmt):
+        from app.db import session_scope
+        async with session_scope() as st:
+            res = await st.execute(stmt)
+            row = res.first() if res.returns_rows else None
+            if time.monotonic() - self._purged_at > STATE_PURGE_SECONDS:
+                self._purged_at = time.monotonic()
+                await st.execute(sa.delete(KVState).where(KVState.expires_at <= sa.func.now()))
+            await st.commit()
+            return row
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        row = await self._run(sa.select(KVState.value).where(KVState.key == key, self._alive()))
+        return row[0] if row is not None else default
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        stmt = pg_insert(KVState).values(key=key, value=_copy(value), expires_at=self._expires(ttl))
+        await self._run(stmt.on_conflict_do_update(
+            index_elements=[KVState.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        ))
+
+    async def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        stmt = pg_insert(KVState).values(key=key, value=_copy(value), expires_at=self._expires(ttl))
+        # живую строку не трогаем — RETURNING пуст; просроченную перезаписываем
+        row = await self._run(stmt.on_conflict_do_update(
+            index_elements=[KVState.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+            where=sa.and_(KVState.expires_at.is_not(None), KVState.expires_at <= sa.func.now()),
+        ).returning(KVState.key))
+        return row is not None
+
+    async def pop(self, key: str, default: Any = None) -> Any:
+        row = await self._run(
+            sa.delete(KVState).where(KVState.key == key)
+            .returning(KVState.value, KVState.expires_at > sa.func.now())
+        )
+        if row is None or row[1] is False:
+            return default
+        return row[0]
+
+    def _upsert(self, key: str, value: Any, ttl: Optional[float], update):
+        """INSERT value, or on conflict update(existing) — a fresh value if the existing one expired."""
+        stmt = pg_insert(KVState).values(key=key, value=value, expires_at=self._expires(ttl))
+        expired = sa.and_(KVState.expires_at.is_not(None), KVState.expires_at <= sa.func.now())
+        return stmt.on_conflict_do_update(
+            index_elements=[KVState.key],
+            set_={"value": sa.case((expired, stmt.excluded.value), else_=update(stmt.excluded.value)),
+                  "expires_at": stmt.excluded.expires_at},
+        ).returning(KVState.value)
+
+    async def toggle(self, key: str, member: str, ttl: Optional[float] = None) -> bool:
+        cur = KVState.value
+        row = await self._run(self._upsert(key, [member], ttl, lambda new: sa.case(
+            (cur.has_key(member), cur.op("-", return_type=postgresql.JSONB)(member)),
+            else_=cur.op("||", return_type=postgresql.JSONB)(new),
+        )))
+        return member in (row[0] if row is not None else [])
+
+    async def merge(self, key: str, patch: Mapping[str, Any], ttl: Optional[float] = None) -> Dict[str, Any]:
+        cur = KVState.value
+        row = await self._run(self._upsert(key, _copy(dict(patch)), ttl,
+                                           lambda new: cur.op("||", return_type=postgresql.JSONB)(new)))
+        return row[0] if row is not None else dict(patch)
+
+class BackendFSMStorage(BaseStorage):
+    """aiogram FSM storage on top of a StateBackend (state and data under separate keys)."""
+
+    def __init__(self, backend: StateBackend, key_builder: KeyBuilder | None = None, ttl: Optional[float] = None):
+        self.backend = backend
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.ttl = ttl
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key, "state")
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.backend.pop(k)
+        else:
+            await self.backend.set(k, state, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self.backend.get(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = self.key_builder.build(key, "data")
+        if not data:
+            await self.backend.pop(k)
+        else:
+            await self.backend.set(k, dict(data), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return await self.backend.get(self.key_builder.build(key, "data")) or {}
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        return await self.backend.merge(self.key_builder.build(key, "data"), data, self.ttl)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+_backend: Optional[StateBackend] = None
+
+def get_state_backend() -> StateBackend:
+    """Process-wide backend chosen by STATE_BACKEND (memory | postgres)."""
+    global _backend
+    if _backend is None:
+        _backend = PostgresStateBackend() if settings.state_backend == "postgres" else MemoryStateBackend()
+    return _backend
+
+def fsm_storage() -> BackendFSMStorage:
+    return BackendFSMStorage(get_state_backend(), ttl=FSM_TTL or None)
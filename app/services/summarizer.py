@@ -0,0 +1,176 @@
+"""Map-reduce summarization service for sources that don't fit into one request."""
+from __future__ import annotations
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Sequence, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import session_scope
+from app.models import Chunk, SummaryCache
+from app.tokenizer import count_tokens, make_chunks
+
+logger = logging.getLogger(__name__)
+
+# Сколько токенов частичных резюме уходит в один reduce-запрос
+SUMMARY_GROUP_TOKENS = int(os.getenv("SUMMARY_GROUP_TOKENS", "6000"))
+# Если текст меньше — суммаризируем одним запросом, без map-reduce
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", "12000"))
+SUMMARY_MAP_MAX_TOKENS = int(os.getenv("SUMMARY_MAP_MAX_TOKENS", "400"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
+# Версия промптов входит в ключ кэша: поменяли промпт — старые резюме не переиспользуем
+_PROMPT_VERSION = "v1"
+
+MAP_INSTRUCTION = (
+    "Сожми фрагмент большого документа в 3–7 фактологичных пунктов. "
+    "Сохрани имена, числа, решения и термины. Без вступлений."
+)
+REDUCE_INSTRUCTION = (
+    "Ниже — частичные резюме последовательных частей одного документа. "
+    "Объедини их в одно связное резюме, убери повторы, сохрани ключевые факты."
+)
+FINAL_INSTRUCTION = (
+    "Сделай сжатое, фактологичное резюме текста ниже: 5–10 пунктов или ~120–200 слов. "
+    "Без рассуждений, только итог."
+)
+
+def _hash_key(model: str, instruction: str, text: str) -> str:
+    h = hashlib.sha256()
+    for part in (_PROMPT_VERSION, model, instruction, text):
+        h.update(part.encode("utf-8", errors="ignore"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+def group_by_tokens(texts: Sequence[str], group_tokens: int = SUMMARY_GROUP_TOKENS) -> List[str]:
+    """Split a sequence of texts into consecutive groups of at most ~group_tokens.
+
+    Группы детерминированы для одного и того же набора текстов, но сдвигаются от
+    любой вставки — поэтому map (исходные чанки) кэшируется по чанку, а группами
+    склеиваются только частичные резюме в reduce.
+    """
+    groups: List[str] = []
+    cur: List[str] = []
+    cur_tokens = 0
+    for t in texts:
+        if not t or not t.strip():
+            continue
+        n = count_tokens(t)
+        if cur and cur_tokens + n > group_tokens:
+            groups.append("\n\n".join(cur))
+            cur, cur_tokens = [], 0
+        cur.append(t)
+        cur_tokens += n
+    if cur:
+        groups.append("\n\n".join(cur))
+    return groups
+
+async def _cache_get(keys: Sequence[str]) -> dict[str, str]:
+    if not keys:
+        return {}
+    try:
+        async with session_scope() as st:
+            res = await st.execute(select(SummaryCache.key, SummaryCache.summary).where(SummaryCache.key.in_(list(keys))))
+            return {k: v for k, v in res.all()}
+    except Exception as e:
+        logger.warning(f"Summary cache read failed: {e}")
+        return {}
+
+async def _cache_put(items: dict[str, str], model: str) -> None:
+    if not items:
+        return
+    try:
+        async with session_scope() as st:
+            stmt = pg_insert(SummaryCache).values(
+                [{"key": k, "model": model, "summary": v} for k, v in items.items()]
+            ).on_conflict_do_nothing(index_elements=["key"])
+            await st.execute(stmt)
+            await st.commit()
+    except Exception as e:
+        logger.warning(f"Summary cache write failed: {e}")
+
+async def _summarize_many(texts: Sequence[str], instruction: str, model: str, max_tokens: int) -> List[str]:
+    """Summarize each text in parallel (bounded by the LLM limiter), reusing cached results.
+
+    Ошибки (и отключённый LLM — summarize_once тогда бросает) не кэшируются:
+    вместо резюме идёт начало исходного текста.
+    """
+    from app.llm import summarize_once
+
+    keys = [_hash_key(model, instruction, t) for t in texts]
+    cached = await _cache_get(keys)
+    missing = [(k, t) for k, t in zip(keys, texts) if k not in cached]
+    if missing:
+        results = await asyncio.gather(
+            *(summarize_once(t, instruction, model=model, max_tokens=max_tokens) for _, t in missing),
+            return_exceptions=True,
+        )
+        fresh: dict[str, str] = {}
+        for (k, t), r in zip(missing, results):
+            if isinstance(r, BaseException) or not r:
+                logger.warning(f"Map summary failed, keeping raw head: {r}")
+                # не кэшируем ошибку, в reduce пойдёт начало исходного фрагмента
+                cached[k] = t[:2000]
+            else:
+                fresh[k] = r
+        await _cache_put(fresh, model)
+        cached.update(fresh)
+    logger.info(f"Summaries: {len(texts)} total, {len(texts) - len(missing)} from cache")
+    return [cached[k] for k in keys]
+
+def _take_budget(parts: Sequence[str], budget_tokens: int) -> List[str]:
+    """Leading parts that fit budget_tokens; the first one that doesn't is cut to the remainder."""
+    out: List[str] = []
+    left = budget_tokens
+    for t in parts:
+        n = count_tokens(t)
+        if n > left:
+            if left > 0:
+                out.extend(make_chunks(t, left, 0)[:1])
+            break
+        out.append(t)
+        left -= n
+    return out
+
+async def reduce_to_budget(texts: Sequence[str], budget_tokens: int, model: str = SUMMARY_MODEL) -> List[str]:
+    """Hierarchically summarize texts until their total size fits budget_tokens (never returns more)."""
+    parts = [t for t in texts if t and t.strip()]
+    if sum(count_tokens(t) for t in parts) <= budget_tokens:
+        return parts
+    # map: каждый исходный чанк -> частичное резюме, ключ кэша — сам чанк (вставка соседа
+    # не сбивает кэш); короткие чанки сжимать нечего — идут как есть
+    short = {i for i, t in enumerate(parts) if count_tokens(t) <= SUMMARY_MAP_MAX_TOKENS}
+    mapped = iter(await _summarize_many([t for i, t in enumerate(parts) if i not in short],
+                                        MAP_INSTRUCTION, model, SUMMARY_MAP_MAX_TOKENS))
+    parts = [t if i in short else next(mapped) for i, t in enumerate(parts)]
+    # reduce: склеиваем резюме группами, пока не влезем в бюджет
+    while len(parts) > 1 and sum(count_tokens(t) for t in parts) > budget_tokens:
+        groups = group_by_tokens(parts)
+        if len(groups) == len(parts):
+            # каждое резюме уже больше группы — дальше не сожмём
+            break
+        parts = await _summarize_many(groups, REDUCE_INSTRUCTION, model, SUMMARY_MAP_MAX_TOKENS)
+    # берём сколько влезет
+    return _take_budget(parts, budget_tokens)
+
+async def summarize_chunks(chunks: Sequence[str], model: str | None = None, max_tokens: int = 500) -> str:
+    """Summarize an arbitrarily large sequence of chunks with map-reduce."""
+    from app.llm import summarize_once
+
+    model = model or SUMMARY_MODEL
+    parts = await reduce_to_budget(chunks, SUMMARY_SINGLE_PASS_TOKENS, model=model)
+    if not parts:
+        return ""
+    return await summarize_once("\n\n".join(parts), FINAL_INSTRUCTION, model=model, max_tokens=max_tokens)
+
+async def summarize_artifact(session: AsyncSession, artifact_id: int, model: str | None = None, max_tokens: int = 500) -> str:
+    """Summarize all chunks of an artifact in idx order."""
+    res = await session.execute(
+        select(Chunk.text).where(Chunk.artifact_id == artifact_id).order_by(Chunk.idx.asc())
+    )
+    chunks = [row[0] for row in res.all()]
+    return await summarize_chunks(chunks, model=model, max_tokens=max_tokens)
@@ -1,24 +1,30 @@
 """Token budget service for managing context limits."""
 import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
-# Model context limits (approximate)
+# Model context limits (approximate); keys are matched as prefixes, longest first ("gpt-4o-2024-08-06" → "gpt-4o")
 MODEL_CONTEXT_LIMITS = {
+    "gpt-5": 400000,
+    "gpt-4.1": 1047576,
     "gpt-4o-mini": 128000,
     "gpt-4o": 128000,
     "gpt-4-turbo": 128000,
     "gpt-4": 8192,
     "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4": 200000,
 }
+_PREFIXES = sorted(MODEL_CONTEXT_LIMITS, key=len, reverse=True)
 
 # Default values
 DEFAULT_MODEL = "gpt-4o-mini"
 DEFAULT_CONTEXT_LIMIT = 128000
 DEFAULT_MAX_TOKENS_OUT = 2048
-DEFAULT_SYSTEM_TOKENS = 300  # Approximate tokens for system prompt
+DEFAULT_SYSTEM_TOKENS = None  # None — посчитать build_system_prompt() токенизатором модели
 DEFAULT_MARGIN = 1000  # Safety margin
 
 def get_model_context_limit(model: str) -> int:
@@ -31,12 +37,29 @@ def get_model_context_limit(model: str) -> int:
     Returns:
         Context limit in tokens
     """
-    return MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT)
+    m = (model or "").lower()
+    if m in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[m]
+    for prefix in _PREFIXES:
+        if m.startswith(prefix):
+            return MODEL_CONTEXT_LIMITS[prefix]
+    return DEFAULT_CONTEXT_LIMIT
+
+_system_tokens: Dict[str, int] = {}
+
+def system_prompt_tokens(model: str) -> int:
+    """Exact token count of the system prompt in the model's encoding (cached per encoding)."""
+    from app.tokenizer import count_tokens, encoding_for_model
+    from app.services.prompt_builder import build_system_prompt
+    enc = encoding_for_model(model)
+    if enc not in _system_tokens:
+        _system_tokens[enc] = count_tokens(build_system_prompt(), encoding=enc)
+    return _system_tokens[enc]
 
 def calculate_token_budget(
     model: str = DEFAULT_MODEL,
     max_tokens_out: int = DEFAULT_MAX_TOKENS_OUT,
-    system_tokens: int = DEFAULT_SYSTEM_TOKENS,
+    system_tokens: Optional[int] = DEFAULT_SYSTEM_TOKENS,
     margin: int = DEFAULT_MARGIN
 ) -> int:
     """
@@ -45,13 +68,15 @@ def calculate_token_budget(
     Args:
         model: Model name
         max_tokens_out: Maximum tokens for output
-        system_tokens: Tokens reserved for system prompt
+        system_tokens: Tokens reserved for system prompt (None — counted from build_system_prompt)
         margin: Safety margin
         
     Returns:
         Available tokens for input context
     """
     context_limit = get_model_context_limit(model)
+    if system_tokens is None:
+        system_tokens = system_prompt_tokens(model)
     in_budget = context_limit - max_tokens_out - system_tokens - margin
     return max(0, in_budget)  # Ensure non-negative
 
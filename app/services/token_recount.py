@@ -0,0 +1,84 @@
+"""Background recount of Chunk.tokens after the tokenizer encoding changes.
+
+Chunk.encoding хранит, в какой кодировке посчитан Chunk.tokens. Когда кодировка
+импорта меняется (cl100k_base → o200k_base, или tiktoken стал доступен вместо
+байтового фолбэка), старые счётчики врут — задача recount_tokens пересчитывает их
+пачками по id. Выборка идёт по несовпадающей кодировке, поэтому после рестарта
+задача просто продолжает с того места, где остановилась.
+"""
+from __future__ import annotations
+import os
+import asyncio
+import logging
+from typing import List
+
+from sqlalchemy import func, select, update
+
+from app.db import session_scope
+from app.models import Chunk
+from app.services.jobs import enqueue, job_handler, JobContext
+from app.tokenizer import count_tokens_batch, encoding_label
+
+logger = logging.getLogger(__name__)
+
+RECOUNT_BATCH = int(os.getenv("RECOUNT_BATCH", "500"))
+
+def _stale(label: str):
+    return Chunk.encoding.is_distinct_from(label)
+
+async def _stale_count(label: str) -> int:
+    async with session_scope() as st:
+        res = await st.execute(select(func.count()).select_from(Chunk).where(_stale(label)))
+        return int(res.scalar() or 0)
+
+async def enqueue_token_recount() -> bool:
+    """Startup check: queue recount_tokens if any chunk was counted in another encoding."""
+    label = await asyncio.to_thread(encoding_label)
+    async with session_scope() as st:
+        res = await st.execute(select(Chunk.id).where(_stale(label)).limit(1))
+        if res.scalar() is None:
+            return False
+        job = await enqueue(st, "recount_tokens", {"encoding": label}, dedupe_key=f"recount:{label}")
+        await st.commit()
+    if job:
+        logger.info(f"Queued token recount to {label}")
+    return job is not None
+
+async def _next_batch(label: str, after_id: int) -> List[tuple[int, str]]:
+    async with session_scope() as st:
+        res = await st.execute(
+            select(Chunk.id, Chunk.text)
+            .where(Chunk.id > after_id, _stale(label))
+            .order_by(Chunk.id)
+            .limit(RECOUNT_BATCH)
+        )
+        return [(row[0], row[1] or "") for row in res.all()]
+
+@job_handler("recount_tokens", max_attempts=5)
+async def _recount_tokens_job(ctx: JobContext):
+    label = ctx.payload.get("encoding") or encoding_label()
+    if label != await asyncio.to_thread(encoding_label):
+        # кодировку сменили ещё раз — новую задачу поставит следующий старт
+        return {"encoding": label, "skipped": True}
+    total = await _stale_count(label)
+    done = last_id = 0
+    while True:
+        rows = await _next_batch(label, last_id)
+        if not rows:
+            break
+        # encode — CPU, уводим из event loop; фолбэк "bytes" считает байты без tiktoken
+        counts = await asyncio.to_thread(
+            count_tokens_batch, [text for _, text in rows], None if label == "bytes" else label
+        )
+        async with session_scope() as st:
+            # ORM bulk UPDATE по первичному ключу — один executemany на пачку
+            await st.execute(
+                update(Chunk),
+                [{"id": cid, "tokens": n, "encoding": label} for (cid, _), n in zip(rows, counts)],
+            )
+            await st.commit()
+        done += len(rows)
+        last_id = rows[-1][0]
+        await ctx.progress(f"{done}/{total} chunks → {label}")
+    logger.info(f"Token recount done: {done} chunks -> {label}")
+    return {"encoding": label, "recounted": done}
@@ -4,11 +4,13 @@ import uuid
 import io
 import os
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from urllib.parse import urljoin
-from minio import Minio
 from app.config import settings
 
+if TYPE_CHECKING:
+    from minio import Minio
+
 logger = logging.getLogger(__name__)
 _client: Optional[Minio] = None
 
@@ -21,6 +23,7 @@ def _client_or_none() -> Optional[Minio]:
         return None
     
     try:
+        from minio import Minio  # ~0.3 с на импорт — только когда MinIO настроен
         endpoint = settings.minio_endpoint.replace("http://", "").replace("https://", "")
         _client = Minio(
             endpoint,
@@ -33,8 +36,8 @@ def _client_or_none() -> Optional[Minio]:
         logger.warning(f"Failed to initialize MinIO client: {e}")
         return None
 
-async def ensure_bucket() -> None:
-    """Ensure that the configured bucket exists."""
+def _ensure_bucket() -> None:
+    """Blocking part of ensure_bucket (MinIO client calls are synchronous)."""
     c = _client_or_none()
     if not c:
         return
@@ -46,6 +49,10 @@ async def ensure_bucket() -> None:
     except Exception as e:
         logger.warning(f"Failed to ensure MinIO bucket: {e}")
 
+async def ensure_bucket() -> None:
+    """Ensure that the configured bucket exists."""
+    _ensure_bucket()
+
 async def save_file(filename: str, data: bytes) -> str | None:
     """Save file to MinIO and return public URL, or None if MinIO not configured."""
     c = _client_or_none()
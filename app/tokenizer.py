@@ -1,46 +1,160 @@
 """Token-based chunking with tiktoken + graceful fallback."""
 from __future__ import annotations
-from typing import List
+import os
+import threading
+from typing import List, NamedTuple, Sequence
 
-try:
-    import tiktoken
-    _enc = tiktoken.get_encoding("cl100k_base")
-except Exception:
-    tiktoken = None
-    _enc = None
+# Кодировка для импорта (Chunk.tokens): предпочтительные модели gpt-5 / gpt-4o считают в o200k_base
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# Метка в Chunk.encoding, когда tiktoken недоступен и токены — это UTF-8 байты
+BYTES_ENCODING = "bytes"
 
-def _encode(text: str) -> List[int]:
+# Семейства моделей → кодировка (проверяются по префиксу, o200k раньше — "gpt-4o" начинается с "gpt-4")
+_O200K_MODELS = ("gpt-5", "gpt-4o", "gpt-4.1", "gpt-4.5", "chatgpt-4o", "o1", "o3", "o4")
+_CL100K_MODELS = ("gpt-4", "gpt-3.5", "text-embedding-3", "text-embedding-ada")
+
+def encoding_for_model(model: str | None) -> str:
+    """tiktoken encoding name for a chat model; unknown models use TOKENIZER_ENCODING."""
+    m = (model or "").lower()
+    if m.startswith(_O200K_MODELS):
+        return "o200k_base"
+    if m.startswith(_CL100K_MODELS):
+        return "cl100k_base"
+    return TOKENIZER_ENCODING
+
+# Кодировки грузятся при первом обращении (или фоновым прогревом после старта):
+# tiktoken.get_encoding читает/качает BPE-файл — это сотни мс на холодном контейнере
+_encodings: dict = {}
+_enc_lock = threading.Lock()
+
+def get_encoding(name: str | None = None):
+    """tiktoken encoding (default TOKENIZER_ENCODING), loaded once on first use; None if unavailable (bytes fallback)."""
+    name = name or TOKENIZER_ENCODING
+    if name not in _encodings:
+        with _enc_lock:
+            if name not in _encodings:
+                try:
+                    import tiktoken
+                    _encodings[name] = tiktoken.get_encoding(name)
+                except Exception:
+                    _encodings[name] = None
+    return _encodings[name]
+
+def encoding_label(name: str | None = None) -> str:
+    """What token counts made with this encoding really are: its name, or 'bytes' for the fallback."""
+    name = name or TOKENIZER_ENCODING
+    return name if get_encoding(name) is not None else BYTES_ENCODING
+
+# Потоки для encode_ordinary_batch (tiktoken отпускает GIL внутри Rust)
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", "8"))
+
+class ChunkSpan(NamedTuple):
+    """Chunk text, its token count and [start_offset, end_offset) character offsets in the source text."""
+    text: str
+    token_count: int
+    start_offset: int
+    end_offset: int
+
+def _encode(text: str, encoding: str | None = None) -> List[int]:
     """Encode text to tokens, with fallback to bytes if tiktoken unavailable."""
-    if _enc is None:
-        return list(text.encode("utf-8", errors="ignore"))
-    return _enc.encode(text)
+    enc = get_encoding(encoding)
+    if enc is None:
+        # surrogatepass — те же байты, что и при расчёте смещений в _spans_from_tokens
+        return list(text.encode("utf-8", errors="surrogatepass"))
+    # encode_ordinary: "<|endoftext|>" в импортированном файле — просто текст, а не ошибка
+    return enc.encode_ordinary(text)
 
 def _decode(tokens: List[int]) -> str:
     """Decode tokens to text, with fallback to bytes if tiktoken unavailable."""
-    if _enc is None:
+    enc = get_encoding()
+    if enc is None:
         return bytes(tokens).decode("utf-8", errors="ignore")
-    return _enc.decode(tokens)
+    return enc.decode(tokens)
+
+def _byte_offsets(toks: Sequence[int], marks: Sequence[int]) -> dict[int, int]:
+    """UTF-8 byte offset before token index k for each k in sorted marks (decode_bytes per segment, not per token)."""
+    enc = get_encoding()
+    if enc is None:
+        return {k: k for k in marks}
+    out: dict[int, int] = {}
+    prev = acc = 0
+    for k in marks:
+        acc += len(enc.decode_bytes(toks[prev:k]))
+        prev = k
+        out[k] = acc
+    return out
+
+def _spans_from_tokens(text: str, toks: Sequence[int], size: int, overlap: int, base: int = 0) -> List[ChunkSpan]:
+    """Slice text at token windows without decoding each window (offsets are character offsets + base)."""
+    if not toks:
+        return []
+    step = max(1, size - max(0, overlap))
+    windows = [(i, min(i + size, len(toks))) for i in range(0, len(toks), step)]
+    marks = sorted({i for i, _ in windows} | {j for _, j in windows})
+    byte_at = _byte_offsets(toks, marks)
+
+    if text.isascii():
+        # байт == символ
+        char_of = byte_at
+    else:
+        data = text.encode("utf-8", errors="surrogatepass")
+        char_of = {}
+        pos_b = pos_c = 0
+        # байтовые границы окон → символьные смещения, инкрементально за один проход по тексту
+        for k in marks:
+            b = byte_at[k]
+            # граница токена может попасть внутрь многобайтового символа — сдвигаем к его началу
+            while 0 < b < len(data) and (data[b] & 0xC0) == 0x80:
+                b -= 1
+            if b >= pos_b:
+                pos_c += len(data[pos_b:b].decode("utf-8", errors="surrogatepass"))
+                pos_b = b
+            char_of[k] = pos_c
+
+    return [ChunkSpan(text[char_of[i]:char_of[j]], j - i, base + char_of[i], base + char_of[j])
+            for i, j in windows]
+
+def _strip_bounds(text: str) -> tuple[str, int]:
+    stripped = text.strip()
+    return stripped, (len(text) - len(text.lstrip())) if stripped else 0
+
+def chunk_spans(text: str, size: int = 1600, overlap: int = 150) -> List[ChunkSpan]:
+    """
+    Чанки с числом токенов и смещениями в исходном тексте — один encode на документ.
+    """
+    stripped, base = _strip_bounds(text)
+    if not stripped:
+        return []
+    return _spans_from_tokens(stripped, _encode(stripped), size, overlap, base)
+
+def chunk_spans_batch(texts: Sequence[str], size: int = 1600, overlap: int = 150,
+                      num_threads: int = TOKENIZER_THREADS) -> List[List[ChunkSpan]]:
+    """chunk_spans for many documents; tiktoken encodes the batch in a thread pool (encode_ordinary_batch)."""
+    prepared = [_strip_bounds(t) for t in texts]
+    enc = get_encoding()
+    if enc is None:
+        encoded = [_encode(s) for s, _ in prepared]
+    else:
+        encoded = enc.encode_ordinary_batch([s for s, _ in prepared], num_threads=num_threads)
+    return [_spans_from_tokens(s, toks, size, overlap, base) if s else []
+            for (s, base), toks in zip(prepared, encoded)]
 
 def make_chunks(text: str, size: int = 1600, overlap: int = 150) -> list[str]:
     """
     Создает чанки текста на основе токенов с грациозным откатом.
     """
-    text = text.strip()
-    if not text:
-        return []
-    
-    toks = _encode(text)
-    step = max(1, size - max(0, overlap))
-    chunks: list[str] = []
-    
-    for i in range(0, len(toks), step):
-        window = toks[i:i + size]
-        chunks.append(_decode(window))
-    
-    return chunks
-
-def count_tokens(text: str) -> int:
+    return [s.text for s in chunk_spans(text, size, overlap)]
+
+def count_tokens(text: str, model: str | None = None, encoding: str | None = None) -> int:
     """
-    Подсчитывает количество токенов в тексте.
+    Подсчитывает количество токенов в тексте (в кодировке модели, если она указана).
     """
-    return len(_encode(text))
\ No newline at end of file
+    return len(_encode(text, encoding or (encoding_for_model(model) if model else None)))
+
+def count_tokens_batch(texts: Sequence[str], encoding: str | None = None,
+                       num_threads: int = TOKENIZER_THREADS) -> List[int]:
+    """Token counts for many texts in one encode_ordinary_batch."""
+    enc = get_encoding(encoding)
+    if enc is None:
+        return [len(t.encode("utf-8", errors="surrogatepass")) for t in texts]
+    return [len(toks) for toks in enc.encode_ordinary_batch(list(texts), num_threads=num_threads)]
@@ -0,0 +1,41 @@
+# Long LLM answers: parts, API calls and keyboard placement for send_long_answer
+# usage: python -m app.tools.bench_answer [chars ...]
+import sys, asyncio
+from types import SimpleNamespace
+from app.utils.markdown import md_to_tg_html, TG_MESSAGE_LIMIT
+from app.utils.tg import send_long_answer
+
+PARAGRAPH = ("Ответ со ссылками [12] и сравнением a < b && c > d. **Важно:** `x<y` в коде.\n"
+             "```python\nfor i in range(3):\n    print(i < 2)\n```\n\n")
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []  # (method, len, has_kb)
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        assert len(text) <= TG_MESSAGE_LIMIT, "MESSAGE_TOO_LONG"
+        self.sent.append(("edit", len(text), reply_markup is not None))
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        assert len(text) <= TG_MESSAGE_LIMIT, "MESSAGE_TOO_LONG"
+        self.sent.append(("send", len(text), reply_markup is not None))
+        return SimpleNamespace(message_id=100 + len(self.sent))
+
+    async def send_document(self, chat_id, document, caption=None, reply_markup=None):
+        self.sent.append(("document", len(document.data), reply_markup is not None))
+        return SimpleNamespace(message_id=100 + len(self.sent))
+
+async def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1500, 9000, 15000, 60000]
+    for size in sizes:
+        text = (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+        html = md_to_tg_html(text)
+        bot = FakeBot()
+        ids = await send_long_answer(bot, 1, html, reply_markup=object(), edit_message_id=1, plain=text)
+        kb_on = [n for n, s in enumerate(bot.sent) if s[2]]
+        print(f"{size:>6} chars (html {len(html)}): before -> {'ok' if len(html) <= TG_MESSAGE_LIMIT else 'MESSAGE_TOO_LONG, LLM call lost'}; "
+              f"after -> {[s[0] for s in bot.sent]}, max part {max(s[1] for s in bot.sent if s[0] != 'document')}, "
+              f"keyboard on part {kb_on} of {len(ids)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# Benchmark registered chunkers on a fixed corpus (generated from a seed, or a directory): chunks/sec, average tokens per chunk, stored tokens
+# usage: python -m app.tools.bench_chunkers [corpus_dir]   (без аргумента — сгенерированный корпус, seed 7)
+import sys, json, time, random
+from pathlib import Path
+from app.chunking import CHUNKERS, ChunkParams, chunk_documents
+from app.ignore import default_spec, iter_text_files
+
+def load_corpus(root: Path) -> list[tuple[str, str]]:
+    """(relative path, text) for every text file under root, sorted — same corpus on every run."""
+    return sorted(iter_text_files(root, default_spec()))
+
+WORDS = ("память проект импорт источник ответ вопрос чанк токен резюме тег выбор кодировка "
+         "the bot imports project files and answers questions about them with sources").split()
+
+def _sentence(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(6, 18))).capitalize() + "."
+
+def _markdown(rnd: random.Random) -> str:
+    parts = []
+    for i in range(rnd.randint(4, 12)):
+        parts.append(f"{'#' * rnd.randint(1, 3)} Section {i}\n")
+        parts.append("\n".join(_sentence(rnd) for _ in range(rnd.randint(2, 12))) + "\n")
+        if rnd.random() < 0.3:
+            parts.append("```python\n" + "\n".join(f"x_{j} = {j}" for j in range(rnd.randint(3, 15))) + "\n```\n")
+    return "\n".join(parts)
+
+def _python(rnd: random.Random) -> str:
+    parts = ["import os\nimport json\n"]
+    for i in range(rnd.randint(5, 25)):
+        cls = rnd.random() < 0.2
+        head, ind = (f"class C{i}:\n    def m(self, a):\n", " " * 8) if cls else (f"def f{i}(a, b=None):\n", " " * 4)
+        body = "\n".join(f"{ind}v{j} = len({rnd.choice(WORDS)!r}) + {j}" for j in range(rnd.randint(2, 30)))
+        parts.append(f'{head}{ind}"""{_sentence(rnd)}"""\n{body}\n{ind}return a\n')
+    return "\n\n".join(parts)
+
+def _json(rnd: random.Random) -> str:
+    return json.dumps({f"key{i}": {"title": _sentence(rnd), "tags": rnd.sample(WORDS, 3), "n": i}
+                       for i in range(rnd.randint(10, 120))}, ensure_ascii=False, indent=2)
+
+def _plain(rnd: random.Random) -> str:
+    return "\n\n".join(" ".join(_sentence(rnd) for _ in range(rnd.randint(3, 10))) for _ in range(rnd.randint(5, 40)))
+
+def generate_corpus(files: int = 400, seed: int = 7) -> list[tuple[str, str]]:
+    """Deterministic mixed corpus (Markdown, Python, JSON, plain text) — одинаковый на любой машине."""
+    rnd = random.Random(seed)
+    kinds = (("md", _markdown), ("py", _python), ("json", _json), ("txt", _plain))
+    out = []
+    for i in range(files):
+        ext, make = kinds[i % len(kinds)]
+        out.append((f"gen/{i:04d}.{ext}", make(rnd)))
+    return out
+
+def main():
+    # по умолчанию — сгенерированный корпус: цифры сравнимы между машинами и коммитами
+    root = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+    corpus = load_corpus(root) if root else generate_corpus()
+    names = [rel for rel, _ in corpus]
+    texts = [text for _, text in corpus]
+    params = ChunkParams.from_settings()
+    print(f"corpus: {root or 'generated, seed 7'} — {len(corpus)} files, {sum(map(len, texts)) / 1e6:.1f} M chars; "
+          f"size={params.size} overlap={params.overlap} struct_overlap={params.struct_overlap}")
+    print(f"{'chunker':<10} {'chunks':>7} {'chunks/s':>10} {'avg tok':>8} {'stored tok':>11} {'time ms':>9}")
+    for name in sorted(CHUNKERS):
+        t0 = time.perf_counter()
+        spans = [s for doc in chunk_documents(texts, names, params, name) for s in doc]
+        dt = time.perf_counter() - t0
+        tokens = sum(s.token_count for s in spans)
+        print(f"{name:<10} {len(spans):>7} {len(spans) / dt:>10.0f} {tokens / max(1, len(spans)):>8.0f} "
+              f"{tokens:>11} {dt * 1000:>9.1f}")
+
+if __name__ == "__main__":
+    main()
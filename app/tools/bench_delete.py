@@ -0,0 +1,44 @@
+# API calls per panel page flip: delete_message per id vs batched delete_messages
+# usage: python -m app.tools.bench_delete [page_size]
+import sys, asyncio
+from aiogram.exceptions import TelegramBadRequest
+from app.utils.tg import delete_messages, parse_msg_ids
+
+class CountingBot:
+    """Bot stand-in that counts deleteMessage/deleteMessages calls (optionally rejecting batches)."""
+
+    def __init__(self, reject_batches: bool = False):
+        self.reject_batches = reject_batches
+        self.calls = 0
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls += 1
+        return True
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls += 1
+        if self.reject_batches:
+            raise TelegramBadRequest(None, "Bad Request: message can't be deleted")
+        return True
+
+async def main():
+    page = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    csv = ",".join(str(100 + i) for i in range(page))  # как UserState.memory_page_msg_ids
+    ids = parse_msg_ids(csv) + [99]  # + footer
+
+    bot = CountingBot()
+    for msg_id in ids:
+        await bot.delete_message(1, msg_id)
+    print(f"page of {page} + footer, one by one:     {bot.calls} calls")
+    bot = CountingBot()
+    await delete_messages(bot, 1, ids)
+    print(f"page of {page} + footer, deleteMessages: {bot.calls} calls")
+    bot = CountingBot()
+    await delete_messages(bot, 1, range(1, 251))
+    print(f"250 messages, deleteMessages:          {bot.calls} calls")
+    bot = CountingBot(reject_batches=True)
+    await delete_messages(bot, 1, ids)
+    print(f"batch rejected -> fallback:            {bot.calls} calls")
+
+if __name__ == "__main__":
+    asyncio.run(main())
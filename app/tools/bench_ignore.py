@@ -0,0 +1,47 @@
+# Benchmark .pmignore matching on a synthetic archive listing
+# usage: python -m app.tools.bench_ignore [entries]
+import sys, time, random
+from pathspec import PathSpec
+from app.ignore import DEFAULT_PMIGNORE, default_spec, should_ignore
+
+def make_listing(n: int, seed: int = 42) -> list[str]:
+    """Archive-like listing over a fixed directory tree; ~60% of entries under ignored trees."""
+    rnd = random.Random(seed)
+    tops = ["src", "docs", "tests", "node_modules", "node_modules", "node_modules", ".git", "dist", "app"]
+    exts = [".py", ".md", ".json", ".ts", ".js", ".png", ".txt", ".log"]
+    dirs = []
+    for _ in range(max(50, n // 40)):  # ~40 файлов на каталог, как в реальных репозиториях
+        depth = rnd.randint(1, 5)
+        dirs.append("/".join([rnd.choice(tops)] + [f"d{rnd.randint(0, 40)}" for _ in range(depth)]))
+    return [f"{rnd.choice(dirs)}/f{i}{rnd.choice(exts)}" for i in range(n)]
+
+def bench(label: str, fn, paths: list[str], scale: int = 1) -> float:
+    t0 = time.perf_counter()
+    hits = sum(1 for p in paths if fn(p))
+    dt = (time.perf_counter() - t0) * scale
+    print(f"{label:<38} {dt * 1000:9.1f} ms  ignored={hits * scale}")
+    return dt
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    paths = make_listing(n)
+    print(f"entries: {n}")
+
+    # старый путь: PathSpec собирается заново на каждый файл (меряем на 2% и масштабируем)
+    sample = paths[: max(1, n // 50)]
+    rebuild = lambda p: PathSpec.from_lines("gitwildmatch", DEFAULT_PMIGNORE.splitlines()).match_file(p)
+    t_old = bench("rebuild spec per file (extrapolated)", rebuild, sample, scale=n // len(sample))
+
+    compiled = PathSpec.from_lines("gitwildmatch", DEFAULT_PMIGNORE.splitlines())
+    t_comp = bench("compiled spec, per-file match", compiled.match_file, paths)
+
+    t_should = bench("should_ignore() (cached compile)", should_ignore, paths)
+
+    spec = default_spec()
+    t_prune = bench("IgnoreSpec with dir-prefix pruning", spec.match_file, paths)
+
+    print(f"speedup vs rebuild: compiled x{t_old / t_comp:.0f}, should_ignore x{t_old / t_should:.0f}, "
+          f"pruned x{t_old / t_prune:.0f} (pruned vs compiled x{t_comp / t_prune:.1f})")
+
+if __name__ == "__main__":
+    main()
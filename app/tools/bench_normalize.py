@@ -0,0 +1,42 @@
+# Benchmark text normalization (NFC + control-char stripping) on ~1 MB of text
+# usage: python -m app.tools.bench_normalize [megabytes]
+import sys, time, unicodedata
+from app.utils.textnorm import normalize_text, _control_re
+from app.services.retrieval import normalized_chunk_text
+
+RU = "Нормализация текста перед сборкой промпта: NFC и вычистка управляющих символов.\t"
+RU_CTRL = "Тот же текст, но с zero-width space​ и soft hyphen\u00ad внутри слов.\x00\n"
+EN = "def handler(msg):\r\n    return msg.text  # plain ASCII source code\x00\x07\n"
+
+def old_normalize(text: str) -> str:
+    """Previous retrieval.normalize_text: unicodedata.category per character."""
+    normalized = unicodedata.normalize("NFC", text)
+    return "".join(ch for ch in normalized if ch == "\n" or ch == "\t" or not unicodedata.category(ch).startswith("C"))
+
+def bench(label: str, fn, text: str, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<34} {best * 1000:9.2f} ms  {len(text.encode()) / best / 1e6:9.1f} MB/s")
+    return best
+
+def main():
+    mb = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    t0 = time.perf_counter()
+    _control_re()
+    print(f"control-char regex build (once per process): {(time.perf_counter() - t0) * 1000:.0f} ms")
+    for case_id, (name, unit) in enumerate((("cyrillic", RU), ("cyrillic+format chars", RU_CTRL), ("ascii source", EN))):
+        text = unit * (int(mb * 1024 * 1024) // len(unit.encode()) + 1)
+        assert old_normalize(text) == normalize_text(text)
+        print(f"\n{name}: {len(text.encode()) / 1e6:.1f} MB")
+        t_old = bench("old: category() per char", old_normalize, text)
+        t_new = bench("new: translate / regex", normalize_text, text)
+        # повторная сборка промпта: чанк уже нормализован → выдача из кэша по id
+        normalized_chunk_text(case_id, text)
+        t_cache = bench("cached by chunk id", lambda t: normalized_chunk_text(case_id, t), text)
+        print(f"speedup: x{t_old / t_new:.0f} (regex), x{t_old / t_cache:.0f} (cache hit)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Per-user ordering under load: N simultaneous users, K updates each, through a real Dispatcher
+# usage: python -m app.tools.bench_ordering [users] [updates_per_user]
+# FSM — настоящий fsm_storage() (STATE_BACKEND=postgres — через kv_state)
+import sys, time, asyncio
+from collections import defaultdict
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, Update
+from app.services.state_backend import fsm_storage
+from app.utils.ordering import install_user_ordering, user_unlocked
+
+WORK = 0.02  # «работа» хендлера, с
+SLOW_USER = 1
+SLOW = 2.0  # один пользователь с долгим хендлером не должен тормозить остальных
+
+def make_update(update_id: int, user_id: int, seq: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": str(seq),
+        },
+    })
+
+async def run(users: int, per_user: int, ordered: bool) -> None:
+    seen = defaultdict(list)
+    active = defaultdict(int)
+    overlaps = 0
+    stale = 0
+    finished_at = {}
+    router = Router()
+
+    @router.message()
+    async def handler(m: Message, state: FSMContext, raw_state):
+        nonlocal overlaps, stale
+        uid = m.from_user.id
+        # FSM прочитан до хендлера: должен быть шаг предыдущего апдейта этого пользователя
+        if uid != SLOW_USER and raw_state != (f"bench:{int(m.text) - 1}" if m.text != "0" else None):
+            stale += 1
+        active[uid] += 1
+        if active[uid] > 1 and uid != SLOW_USER:
+            overlaps += 1
+        seen[uid].append(int(m.text))
+        if uid == SLOW_USER and m.text == "0":
+            async with user_unlocked():  # как вызов LLM в ask: остальные апдейты пользователя не ждут
+                await asyncio.sleep(SLOW)
+        else:
+            await asyncio.sleep(WORK)
+        active[uid] -= 1
+        await state.set_state(f"bench:{m.text}" if m.text != str(per_user - 1) else None)
+        finished_at[uid] = time.perf_counter()
+
+    dp = Dispatcher(storage=fsm_storage())
+    mw = install_user_ordering(dp) if ordered else None
+    dp.include_router(router)
+    bot = Bot("123456:TEST")
+
+    # как поллинг: задача на апдейт, в порядке прихода, пользователи вперемешку
+    t0 = time.perf_counter()
+    tasks, uid_seq = [], 0
+    for seq in range(per_user):
+        for uid in range(1, users + 1):
+            uid_seq += 1
+            tasks.append(asyncio.create_task(dp.feed_update(bot, make_update(uid_seq, uid, seq))))
+    await asyncio.gather(*tasks)
+    took = time.perf_counter() - t0
+    await bot.session.close()
+
+    out_of_order = sum(1 for uid, s in seen.items() if uid != SLOW_USER and s != sorted(s))
+    others = [finished_at[uid] - t0 for uid in finished_at if uid != SLOW_USER]
+    print(f"{'ordered' if ordered else 'no ordering'}: wall {took:.2f}s, other users done within {max(others):.2f}s, "
+          f"same-user overlaps {overlaps}, out-of-order users {out_of_order}, stale FSM reads {stale}, "
+          f"user {SLOW_USER} order {seen[SLOW_USER]}, locks left {len(mw) if mw is not None else '-'}")
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{users} users x {per_user} updates, handler {WORK * 1000:.0f} ms (user {SLOW_USER}: {SLOW:.0f} s unlocked); "
+          f"serial per user {per_user * WORK:.2f}s, fully serial {users * per_user * WORK:.0f}s")
+    await run(users, per_user, ordered=False)
+    await run(users, per_user, ordered=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+# Simulated flood control: panel page flips straight to the API vs through OutboundScheduler
+# usage: python -m app.tools.bench_outbound [chats] [flips]
+import sys, time, asyncio
+from collections import defaultdict
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, EditMessageText, SendMessage
+from app.utils.outbound import OutboundScheduler, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST
+
+class FakeTelegram:
+    """make_request stand-in: per-chat token bucket like Telegram's, RetryAfter when it is empty."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+        self.state = defaultdict(lambda: [burst, time.monotonic()])
+        self.calls = self.floods = 0
+
+    async def __call__(self, bot, method):
+        self.calls += 1
+        await asyncio.sleep(0.005)  # RTT
+        tokens, stamp = self.state[method.chat_id]
+        now = time.monotonic()
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        if tokens < 1:
+            self.state[method.chat_id] = [tokens, now]
+            self.floods += 1
+            raise TelegramRetryAfter(method, "Flood control exceeded", int((1 - tokens) / self.rate) + 1)
+        self.state[method.chat_id] = [tokens - 1, now]
+        return True
+
+def page_flip(chat_id: int, n: int):
+    """What a panel page flip did: delete 6 old messages, send 5 items + footer, edit the footer twice."""
+    return ([DeleteMessage(chat_id=chat_id, message_id=n * 100 + i) for i in range(6)]
+            + [SendMessage(chat_id=chat_id, text=f"item {i}") for i in range(6)]
+            + [EditMessageText(chat_id=chat_id, message_id=1, text=f"page {n} ({k})") for k in range(3)])
+
+async def run(label: str, call, chats: int, flips: int, api: FakeTelegram):
+    t0 = time.perf_counter()
+    methods = [m for n in range(flips) for c in range(chats) for m in page_flip(1000 + c, n)]
+    results = await asyncio.gather(*(call(m) for m in methods), return_exceptions=True)
+    failed = sum(isinstance(r, Exception) for r in results)
+    print(f"{label:<12} requests={len(methods)} api_calls={api.calls} retry_after={api.floods} "
+          f"failed={failed} time={time.perf_counter() - t0:.1f}s")
+
+async def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    flips = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"telegram limit: {OUTBOUND_CHAT_RATE}/s per chat, burst {OUTBOUND_CHAT_BURST}; {chats} chats x {flips} flips")
+    api = FakeTelegram(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+    await run("direct", lambda m: api(None, m), chats, flips, api)
+    api = FakeTelegram(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+    scheduler = OutboundScheduler()
+    await run("scheduler", lambda m: scheduler(api, None, m), chats, flips, api)
+    print(f"scheduler stats: {scheduler.stats}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+# Telegram API calls and DB queries per list-panel page flip (single message, keyset cursors, page cache)
+# usage: python -m app.tools.bench_panels [flips]
+import sys, asyncio, datetime as dt
+from types import SimpleNamespace
+from app.ui import show_list_panel, parse_page_callback, PANEL_PAGE_SIZE
+from app.services.panel_cache import PanelView, bump_content_version
+import app.handlers.ask  # noqa: F401 — регистрирует панель "aw"
+
+TOTAL = 40
+BASE = dt.datetime(2025, 1, 1, tzinfo=dt.timezone.utc)
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+        self.markup = None
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.calls += 1
+        self.markup = reply_markup
+        return SimpleNamespace(message_id=500 + self.calls)
+
+    async def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.calls += 1
+        self.markup = reply_markup
+        return True
+
+class FakeSession:
+    """Counts statements; emulates the keyset page query over TOTAL artifacts (created_at grows with id)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seeks = []
+
+    async def execute(self, stmt):
+        self.queries += 1
+        sql = str(stmt)
+        if "project_counters" in sql:
+            return SimpleNamespace(all=lambda: [(1, TOTAL, dt.datetime.now(dt.timezone.utc))])
+        if "user_state" in sql:
+            return SimpleNamespace(scalar=lambda: "")
+        params = list(stmt.compile().params.values())
+        # курсор = пара (datetime, id) — id идёт сразу за datetime
+        bound = next((params[k + 1] for k, v in enumerate(params) if isinstance(v, dt.datetime)), None)
+        back = "created_at ASC" in sql
+        self.seeks.append(bound)
+        ids = list(range(TOTAL, 0, -1))
+        if bound is not None:
+            ids = sorted(i for i in ids if i > bound) if back else [i for i in ids if i < bound]
+        rows = [SimpleNamespace(id=i, title=f"doc {i}", created_at=BASE + dt.timedelta(seconds=i), tags=["rel"])
+                for i in ids[:PANEL_PAGE_SIZE + 1]]
+        return SimpleNamespace(all=lambda: rows)
+
+def button(bot: FakeBot, text: str):
+    return next((b.callback_data for row in bot.markup.inline_keyboard for b in row if b.text.startswith(text)), None)
+
+async def main():
+    flips = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bot, st = FakeBot(), FakeSession()
+    view = PanelView("aw", 1, (1,), None)
+    msg_id = await show_list_panel(st, bot, 1, view)
+    bot.calls = st.queries = 0
+    forward, pages = True, []
+    for _ in range(flips):
+        data = button(bot, "Далее" if forward else "⬅️") or button(bot, "⬅️" if forward else "Далее")
+        forward = data == button(bot, "Далее")
+        pos = parse_page_callback(data)
+        await show_list_panel(st, bot, 1, view, pos, message_id=msg_id)
+        pages.append(view.pos.page)
+        if not button(bot, "Далее") or not button(bot, "⬅️"):
+            forward = not forward
+    print("before: ~12 API calls (6 deletes, 5 items, footer), OFFSET page + COUNT(*) per flip")
+    print(f"after:  {flips} flips -> {bot.calls / flips:.1f} API calls, {st.queries / flips:.2f} DB queries per flip")
+    print(f"pages visited: {pages}")
+    bump_content_version()
+    st.queries = 0
+    await show_list_panel(st, bot, 1, view, message_id=msg_id)
+    print(f"after artifact change: {st.queries} queries to refill the page (seek + counters)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
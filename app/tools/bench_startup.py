@@ -0,0 +1,59 @@
+# Startup cost: per-module import time (python -X importtime) and time until the dispatcher is ready
+# usage: python -m app.tools.bench_startup [top_n]
+import os, re, sys, subprocess
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+READY = (
+    "import time; t0 = time.perf_counter();"
+    "import app.main; from aiogram import Dispatcher;"
+    "dp = Dispatcher(); dp.include_router(app.main.root_router);"
+    "print(f'READY {time.perf_counter() - t0:.3f}')"
+)
+
+LAZY = (
+    "import time, app.main;"
+    "from app.warmup import _load_tokenizer, _load_openai, _load_text_tables, _load_minio\n"
+    "for f in (_load_tokenizer, _load_openai, _load_text_tables, _load_minio):\n"
+    "    t0 = time.perf_counter(); f(); print(f'LAZY {f.__name__} {time.perf_counter() - t0:.3f}')"
+)
+
+def run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench")}
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(args, env=env, capture_output=True, text=True, timeout=300)
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    run("import app.main")  # прогреть .pyc и файловый кэш — меряем второй запуск
+
+    p = run(READY, importtime=True)
+    rows = []
+    for line in p.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(2)), int(m.group(1)), len(m.group(3)) // 2, m.group(4)))
+    ready = next((l.split()[1] for l in p.stdout.splitlines() if l.startswith("READY")), "?")
+    print(f"import app.main + routers ready: {ready} s (with -X importtime overhead)")
+
+    print(f"\ntop {top} modules by cumulative import time:")
+    for cum, self_us, depth, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cum / 1000:8.1f} ms  (self {self_us / 1000:7.1f})  {'  ' * min(depth, 6)}{name}")
+
+    print("\napp.* modules:")
+    for cum, self_us, depth, name in sorted((r for r in rows if r[3].startswith("app")), reverse=True)[:top]:
+        print(f"  {cum / 1000:8.1f} ms  (self {self_us / 1000:7.1f})  {name}")
+
+    heavy = ("openai", "tiktoken", "minio")
+    eager = sorted({r[3].split(".")[0] for r in rows if r[3].split(".")[0] in heavy})
+    print(f"\nheavy deps imported at startup: {', '.join(eager) or 'none'}")
+
+    p = run(LAZY)
+    print("deferred to warm-up / first use:")
+    for line in p.stdout.splitlines():
+        if line.startswith("LAZY"):
+            _, name, sec = line.split()
+            print(f"  {float(sec) * 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
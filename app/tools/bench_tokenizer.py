@@ -0,0 +1,40 @@
+# Benchmark import chunking: decode-per-window + re-encode vs single-pass spans vs batched spans
+# usage: python -m app.tools.bench_tokenizer [docs] [kb_per_doc]
+import os, sys, time
+from app import tokenizer
+from app.tokenizer import chunk_spans, chunk_spans_batch, count_tokens, _encode, _decode, TOKENIZER_THREADS
+from app.services.artifacts import IMPORT_BATCH_DOCS
+
+DOC = ("Импорт документа: текст режется на окна по токенам с перекрытием. "
+       "def f(x):\n    return x * 2  # code\n")
+
+def old_chunks(text: str, size: int, overlap: int) -> list[tuple[str, int]]:
+    """Previous path: encode, decode every window, then count_tokens() re-encodes each chunk."""
+    toks = _encode(text.strip())
+    step = max(1, size - overlap)
+    return [(ch, count_tokens(ch)) for ch in (_decode(toks[i:i + size]) for i in range(0, len(toks), step))]
+
+def bench(label: str, fn) -> float:
+    t0 = time.perf_counter()
+    n = fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<40} {dt * 1000:9.1f} ms  chunks={n}")
+    return dt
+
+def main():
+    docs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    kb = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    texts = [f"#{i}\n" + DOC * (kb * 1024 // len(DOC.encode())) for i in range(docs)]
+    enc = tokenizer.get_encoding()
+    print(f"tokenizer: {'tiktoken ' + enc.name if enc else 'bytes fallback'}; "
+          f"{docs} docs x {kb} KB; cpus={os.cpu_count()} threads={TOKENIZER_THREADS}")
+    t_old = bench("decode windows + count_tokens", lambda: sum(len(old_chunks(t, 1600, 150)) for t in texts))
+    t_one = bench("chunk_spans (one encode per doc)", lambda: sum(len(chunk_spans(t, 1600, 150)) for t in texts))
+    # как в импорте ZIP/репозитория: по IMPORT_BATCH_DOCS документов за вызов
+    t_batch = bench(f"chunk_spans_batch x{IMPORT_BATCH_DOCS} (thread pool)", lambda: sum(
+        sum(map(len, chunk_spans_batch(texts[i:i + IMPORT_BATCH_DOCS], 1600, 150)))
+        for i in range(0, len(texts), IMPORT_BATCH_DOCS)))
+    print(f"speedup: single-pass x{t_old / t_one:.1f}, batched x{t_old / t_batch:.1f}")
+
+if __name__ == "__main__":
+    main()
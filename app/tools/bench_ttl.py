@@ -0,0 +1,53 @@
+# Expiry cost and staleness: full sweep every 300 s (old SimpleStateManager) vs heap TTLStore
+# usage: python -m app.tools.bench_ttl [keys]
+import sys, time, random
+from app.utils.ttl import TTLStore
+
+SWEEP_INTERVAL = 300
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rnd = random.Random(1)
+    ttls = [rnd.uniform(10, 3600) for _ in range(n)]
+
+    # старый способ: dict + проход по всем ключам раз в 300 с
+    clock = Clock()
+    states = {i: clock.now + t for i, t in enumerate(ttls)}
+    clock.now = 60.0
+    t0 = time.perf_counter()
+    expired = [k for k, exp in states.items() if clock.now > exp]
+    for k in expired:
+        del states[k]
+    sweep = time.perf_counter() - t0
+    print(f"sweep:    {n} keys scanned to drop {len(expired)} -> {sweep * 1000:.1f} ms per pass, "
+          f"expired keys linger up to {SWEEP_INTERVAL} s")
+
+    clock = Clock()
+    store = TTLStore(clock=clock)
+    for i, t in enumerate(ttls):
+        store.set(i, i, t)
+    clock.now = 60.0
+    t0 = time.perf_counter()
+    due = store.expire()
+    heap = time.perf_counter() - t0
+    print(f"TTLStore: {len(due)} due keys popped -> {heap * 1000:.1f} ms; get() after deadline misses immediately")
+    clock.now = 61.0
+    t0 = time.perf_counter()
+    due = store.expire()
+    print(f"TTLStore: next second, {len(due)} due -> {(time.perf_counter() - t0) * 1000:.2f} ms (sweep would rescan {len(store)})")
+
+    clock = Clock()
+    bounded = TTLStore(maxsize=10_000, clock=clock)
+    for i in range(n):
+        bounded.set(i, i, rnd.uniform(10, 3600))
+    print(f"bounded:  {n} inserts into maxsize=10000 -> {len(bounded)} keys, heap {len(bounded._heap)} entries")
+
+if __name__ == "__main__":
+    main()
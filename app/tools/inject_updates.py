@@ -0,0 +1,93 @@
+# Fake update injector for webhook mode: POSTs synthetic Telegram updates and reports updates/sec
+# usage: python -m app.tools.inject_updates [--url URL] [--secret S] [--count N] [--users U] [--concurrency C]
+#        python -m app.tools.inject_updates --self-test   (in-process webhook app with a counting dispatcher, no DB)
+import argparse, asyncio, time
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from app.config import settings
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def fake_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+            "text": f"ping {update_id}",
+        },
+    }
+
+async def inject(url: str, secret: str, count: int, users: int, concurrency: int) -> tuple[int, int, float]:
+    sem = asyncio.Semaphore(concurrency)
+    ok = failed = 0
+
+    async def post(session: aiohttp.ClientSession, i: int):
+        nonlocal ok, failed
+        async with sem:
+            async with session.post(url, json=fake_update(i, 1000 + i % users), headers={SECRET_HEADER: secret}) as r:
+                if r.status == 200:
+                    ok += 1
+                else:
+                    failed += 1
+
+    t0 = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, i) for i in range(1, count + 1)))
+    return ok, failed, time.perf_counter() - t0
+
+async def self_test(args) -> None:
+    from app.webhook import build_webhook_app
+    handled = 0
+    router = Router()
+
+    @router.message()
+    async def _count(m: Message):
+        nonlocal handled
+        handled += 1
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot("123456:TEST")
+    app = build_webhook_app(dp, bot, args.secret, "/tg/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/tg/webhook"
+    try:
+        ok, failed, took = await inject(url, args.secret, args.count, args.users, args.concurrency)
+        for _ in range(100):  # апдейты обрабатываются в фоне после ответа 200
+            if handled >= ok:
+                break
+            await asyncio.sleep(0.05)
+        print(f"{ok} accepted, {failed} rejected, {handled} handled in {took:.2f}s -> {ok / took:.0f} updates/sec")
+        ok, failed, _ = await inject(url, "wrong-secret", 10, 1, 5)
+        print(f"wrong secret: {ok} accepted, {failed} rejected")
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+async def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--url", default=f"http://127.0.0.1:{settings.webhook_port}{settings.webhook_path}")
+    p.add_argument("--secret", default=settings.webhook_secret or "test-secret")
+    p.add_argument("--count", type=int, default=2000)
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--self-test", action="store_true")
+    args = p.parse_args()
+    if args.self_test:
+        await self_test(args)
+        return
+    ok, failed, took = await inject(args.url, args.secret, args.count, args.users, args.concurrency)
+    print(f"{ok} accepted, {failed} rejected in {took:.2f}s -> {ok / took:.0f} updates/sec")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,21 @@
 from __future__ import annotations
+import datetime as dt
+from dataclasses import dataclass
+from html import escape
+from typing import Any, Callable
+import sqlalchemy as sa
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Artifact, UserState, artifact_tags
 from app.services.memory import _ensure_user_state
+from app.services.counters import approx_artifact_count
+from app.services.panel_cache import (
+    PanelItem, PanelPage, PanelPos, PanelView, forget_view, get_page, page_key, put_page, remember_view,
+    selection_version, total_key,
+)
 
 async def show_panel(st: AsyncSession, bot: Bot, chat_id: int, user_id: int, text: str, kb: InlineKeyboardMarkup):
     """
@@ -33,4 +46,175 @@ async def clear_panel(st: AsyncSession, bot: Bot, chat_id: int, user_id: int):
         except Exception:
             pass
         stt.last_panel_msg_id = None
-        await st.flush()
\ No newline at end of file
+        await st.flush()
+
+# --- Списочные панели (Memory / ASK): одна страница = одно сообщение, листание через edit ---
+
+PANEL_PAGE_SIZE = 5
+
+@dataclass(frozen=True)
+class PanelSpec:
+    """How a list panel of one kind filters artifacts and builds its buttons."""
+    kind: str                                   # префикс callback_data: "mem", "aw"
+    where: Callable[[PanelView], Any]           # условие WHERE для Artifact по view
+    title: Callable[[PanelView], str]
+    page_cb: str                                # "mem:list" / "aw:page" + ":<page>:<n|p>:<cursor>"
+    selected_mark: str = "✅"
+    search: bool = False                        # кнопки 🔍 / ✖ Очистить (ASK)
+
+PANELS: dict[str, PanelSpec] = {}
+
+def register_panel(spec: PanelSpec) -> PanelSpec:
+    PANELS[spec.kind] = spec
+    return spec
+
+# --- курсоры keyset-пагинации: (created_at, id) → "<мкс hex>.<id hex>", влезает в 64 байта callback_data ---
+
+_EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+_US = dt.timedelta(microseconds=1)
+
+def encode_cursor(created_at: dt.datetime, art_id: int) -> str:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=dt.timezone.utc)
+    # целые микросекунды, без float — курсор должен точно совпасть с timestamptz
+    return f"{(created_at - _EPOCH) // _US:x}.{art_id:x}"
+
+def decode_cursor(cursor: str) -> tuple[dt.datetime, int]:
+    us, art_id = cursor.split(".", 1)
+    return _EPOCH + int(us, 16) * _US, int(art_id, 16)
+
+def page_callback(spec: PanelSpec, pos: PanelPos) -> str:
+    return f"{spec.page_cb}:{pos.page}:{'p' if pos.back else 'n'}:{pos.cursor or ''}"
+
+def parse_page_callback(data: str) -> PanelPos:
+    """"aw:page:3:n:<cursor>" → PanelPos; старые кнопки "aw:page:3" (OFFSET) открывают первую страницу."""
+    parts = data.split(":")
+    try:
+        if len(parts) >= 5 and parts[4]:
+            decode_cursor(parts[4])
+            return PanelPos(max(1, int(parts[2])), parts[4], parts[3] == "p")
+    except ValueError:
+        pass
+    return PanelPos()
+
+async def load_panel_page(st: AsyncSession, view: PanelView, pos: PanelPos) -> PanelPage:
+    """One page of artifacts by keyset seek on (created_at, id): page cache, else one SELECT (+ counters)."""
+    key = page_key(view, pos)
+    cached = get_page(key)
+    if cached is not None:
+        return cached._replace(pos=pos)
+    tags_q = (
+        sa.select(artifact_tags.c.tag_name)
+        .where(artifact_tags.c.artifact_id == Artifact.id)
+        .order_by(artifact_tags.c.tag_name)
+        .limit(3)
+        .correlate(Artifact)
+        .scalar_subquery()
+    )
+    cond = PANELS[view.kind].where(view)
+    order = (Artifact.created_at.desc(), Artifact.id.desc())
+    if pos.cursor:
+        seek = sa.tuple_(Artifact.created_at, Artifact.id)
+        bound = sa.tuple_(*decode_cursor(pos.cursor))
+        if pos.back:
+            # страница перед курсором: идём вверх и разворачиваем
+            cond = sa.and_(cond, seek > bound)
+            order = (Artifact.created_at.asc(), Artifact.id.asc())
+        else:
+            cond = sa.and_(cond, seek < bound)
+    stmt = (
+        sa.select(Artifact.id, Artifact.title, Artifact.created_at, sa.func.array(tags_q).label("tags"))
+        .where(cond)
+        .order_by(*order)
+        .limit(PANEL_PAGE_SIZE + 1)  # лишняя строка = есть ли ещё страница в эту сторону
+    )
+    rows = (await st.execute(stmt)).all()
+    more = len(rows) > PANEL_PAGE_SIZE
+    rows = rows[:PANEL_PAGE_SIZE]
+    if pos.back:
+        rows.reverse()
+    items = tuple(PanelItem(r.id, r.title or str(r.id), tuple(r.tags or ()), r.created_at) for r in rows)
+    has_prev = more if pos.back else pos.cursor is not None
+    has_next = pos.cursor is not None if pos.back else more
+    # итог страниц — из счётчиков проекта; для поиска не считаем
+    total = None
+    if not view.query:
+        total = get_page(total_key(view))
+        if total is None:
+            total = await approx_artifact_count(st, view.project_ids)
+            put_page(total_key(view), total)
+    pg = PanelPage(items, pos, has_prev, has_next, total, PANEL_PAGE_SIZE)
+    put_page(key, pg)
+    return pg
+
+def render_list_panel(view: PanelView, pg: PanelPage) -> tuple[str, InlineKeyboardMarkup]:
+    spec = PANELS[view.kind]
+    lines = [spec.title(view)]
+    b = InlineKeyboardBuilder()
+    for i, it in enumerate(pg.items, 1):
+        tags = " [" + " ".join(escape(t) for t in it.tags) + "]" if it.tags else ""
+        date = f", {it.created_at:%Y-%m-%d}" if it.created_at else ""
+        lines.append(f"{i}. {escape(it.title[:80])}{tags} (id {it.id}{date})")
+        mark = spec.selected_mark if it.id in view.selected else "➕"
+        b.row(InlineKeyboardButton(text=f"{i}. {mark}", callback_data=f"{spec.kind}:toggle:{it.id}"),
+              InlineKeyboardButton(text=f"{i}. 🗑", callback_data=f"{spec.kind}:delete:{it.id}"))
+    if not pg.items:
+        lines.append("Ничего не найдено.")
+    if pg.has_prev or pg.has_next:
+        nav = []
+        if pg.has_prev and pg.items:
+            first = pg.items[0]
+            prev = PanelPos(max(1, pg.page - 1), encode_cursor(first.created_at, first.id), back=True)
+            if prev.page == 1:
+                prev = PanelPos()  # первая страница — без курсора, свежие записи сверху
+            nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=page_callback(spec, prev)))
+        total = pg.total_pages
+        label = f"Стр. {pg.page}" + (f"/~{max(pg.page, total)}" if total else "")
+        nav.append(InlineKeyboardButton(text=label, callback_data=f"{spec.kind}:noop"))
+        if pg.has_next and pg.items:
+            last = pg.items[-1]
+            nxt = PanelPos(pg.page + 1, encode_cursor(last.created_at, last.id))
+            nav.append(InlineKeyboardButton(text="Далее ➡️", callback_data=page_callback(spec, nxt)))
+        b.row(*nav)
+    if spec.search:
+        search = [InlineKeyboardButton(text="🔍", callback_data="aw:search")]
+        if view.query:
+            search.append(InlineKeyboardButton(text="✖ Очистить", callback_data="aw:clear_search"))
+        b.row(*search)
+    return "\n".join(lines), b.as_markup()
+
+async def refresh_selection(st: AsyncSession, view: PanelView) -> None:
+    """Re-read the user's selection only if it changed since the view was rendered."""
+    version = selection_version(view.user_id)
+    if view.sel_version == version:
+        return
+    res = await st.execute(sa.select(UserState.selected_artifact_ids).where(UserState.user_id == view.user_id))
+    csv = res.scalar() or ""
+    view.selected = frozenset(int(x) for x in csv.split(",") if x.strip().isdigit())
+    view.sel_version = version
+
+async def show_list_panel(st: AsyncSession, bot: Bot, chat_id: int, view: PanelView, pos: PanelPos | None = None,
+                          message_id: int | None = None) -> int:
+    """Render a page of the panel (pos=None — the view's current page): edit message_id in place,
+    or send a new message. Returns the panel message id."""
+    await refresh_selection(st, view)
+    pg = await load_panel_page(st, view, pos or view.pos)
+    if not pg.items and pg.pos.cursor:
+        # удалили последние записи страницы — к началу списка
+        pg = await load_panel_page(st, view, PanelPos())
+    view.pos = pg.pos
+    text, kb = render_list_panel(view, pg)
+    if message_id:
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=kb)
+            remember_view(chat_id, message_id, view)
+            return message_id
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                remember_view(chat_id, message_id, view)
+                return message_id
+            # сообщение удалено/слишком старое — шлём новое
+            forget_view(chat_id, message_id)
+    sent = await bot.send_message(chat_id, text, reply_markup=kb)
+    remember_view(chat_id, sent.message_id, view)
+    return sent.message_id
@@ -0,0 +1,109 @@
+"""Statistical charset detection tuned for Cyrillic.
+
+Каждая кандидатная кодировка переводит байты в общее «пространство букв»
+(bytes.translate: байт → номер русской буквы или граница слова). Дальше частоты
+типичных русских биграмм считаются bytes.count() по всему префиксу — это C-циклы
+без Python-итерации по символам. Неправильная кодировка даёт почти случайные
+пары букв, и доля «частых» биграмм резко падает.
+"""
+from __future__ import annotations
+import re
+import codecs
+from functools import lru_cache
+
+from app.utils.sniff import sniff_bytes
+
+# Детектор смотрит только на начало буфера
+DETECT_PREFIX = 32 * 1024
+
+# Те же однобайтовые кодировки, что исторически пробовал decode_text_bytes
+CANDIDATES = ("cp1251", "koi8_r", "cp866")
+
+_ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_BOUNDARY = 0x20   # пробел/пунктуация/цифры ASCII
+_OTHER = 0x00      # всё остальное (не-буква в этой кодировке)
+_LETTER0 = 0x41    # буквы: 0x41..0x61, не пересекаются с границей/прочим
+
+# Частые русские биграммы (по убыванию частоты в обычном тексте)
+_BIGRAMS = """
+ст но то на ен ов ни ра во ко ро ал по пр ет ре ер ос го ат ли ль ка не ол ле ан от ор
+ес ть ва ел ло ой ом ин ти ла ит од ил ед ве ри ак де ий ие ия ск ам ви ми ся ая ых ег
+ей ым ую ем да та ту че тв бо зн мо ма ме ди ды
+""".split()
+
+# Ожидаемая доля «частых» пар среди всех пар букв для нормального текста и для мусора
+_EXPECTED_COVERAGE = 0.30
+_RANDOM_COVERAGE = len(_BIGRAMS) / (len(_ALPHABET) ** 2)
+
+_RUN_RE = re.compile(rb"[\x41-\x61]+")  # серии букв в пространстве классов
+_ASCII = bytes(range(0x80))
+
+def _letter_code(ch: str) -> int | None:
+    low = ch.lower()
+    i = _ALPHABET.find(low)
+    return _LETTER0 + i if i >= 0 else None
+
+@lru_cache(maxsize=None)
+def _table(enc: str) -> bytes:
+    """256-byte translate table: byte in enc -> letter class, boundary or other."""
+    out = bytearray(256)
+    for b in range(256):
+        if b < 0x80:
+            ch = chr(b)
+            out[b] = _OTHER if ch.isalpha() else _BOUNDARY
+            continue
+        try:
+            ch = bytes([b]).decode(enc)
+        except UnicodeDecodeError:
+            out[b] = _OTHER
+            continue
+        code = _letter_code(ch)
+        out[b] = code if code is not None else (_OTHER if ch.isalpha() else _BOUNDARY)
+    return bytes(out)
+
+@lru_cache(maxsize=None)
+def _patterns() -> tuple[bytes, ...]:
+    return tuple(sorted({bytes([_letter_code(a), _letter_code(b)]) for a, b in _BIGRAMS}))
+
+def _score(buf: bytes, enc: str, high: int) -> tuple[float, int]:
+    """(score, number of letter pairs): frequent-bigram coverage × share of high bytes that are Russian letters."""
+    t = buf.translate(_table(enc))
+    letters = len(t) - t.count(_BOUNDARY) - t.count(_OTHER)
+    pairs = letters - len(_RUN_RE.findall(t))
+    if pairs <= 0:
+        return 0.0, 0
+    hits = sum(t.count(p) for p in _patterns())
+    # все русские буквы лежат выше 0x80; если много старших байт «не буквы» — кодировка чужая
+    return (hits / pairs) * (letters / high if high else 0.0), pairs
+
+def detect_legacy(buf: bytes) -> tuple[str, float]:
+    """Best single-byte Cyrillic encoding for buf and a 0..1 confidence."""
+    buf = buf[:DETECT_PREFIX]
+    high = len(buf.translate(None, _ASCII))
+    # при равенстве побеждает более ранний кандидат (cp1251 — самая частая)
+    scored = sorted(((_score(buf, enc, high), -i, enc) for i, enc in enumerate(CANDIDATES)), reverse=True)
+    (best_cov, pairs), _, best = scored[0]
+    if pairs == 0:
+        # нет кириллицы ни в одной кодировке — западный текст; cp1251 совпадает с latin-1 в ASCII
+        return "cp1251", 0.0
+    conf = (best_cov - _RANDOM_COVERAGE) / (_EXPECTED_COVERAGE - _RANDOM_COVERAGE)
+    second_cov = scored[1][0][0] if len(scored) > 1 else 0.0
+    # маленький отрыв от второго места — уверенность ниже
+    margin = (best_cov - second_cov) / best_cov if best_cov else 0.0
+    conf = max(0.0, min(1.0, conf)) * (0.5 + 0.5 * margin)
+    # короткие тексты статистически ненадёжны
+    conf *= min(1.0, pairs / 40)
+    return best, round(conf, 3)
+
+def detect_charset(data: bytes) -> tuple[str, float]:
+    """Encoding and confidence for data (BOM / UTF-16 / UTF-8 first, then Cyrillic statistics)."""
+    head = data[:DETECT_PREFIX]
+    res = sniff_bytes(head[:4096], complete=len(data) <= 4096)
+    if res.reason in ("bom", "utf16-pattern", "ascii", "empty"):
+        return res.encoding or "utf-8", res.confidence
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=len(data) <= DETECT_PREFIX)
+        return "utf-8", 0.99
+    except UnicodeDecodeError:
+        pass
+    return detect_legacy(head)
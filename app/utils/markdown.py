@@ -1,6 +1,6 @@
 """Markdown utility for text escaping."""
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 def escape_markdown_v2(text: str) -> str:
     """
@@ -82,4 +82,170 @@ def format_response_with_sources(response_text: str, sources: list) -> str:
     
     # For now, we'll just return the response text
     # In a more advanced implementation, we could process source references
-    return response_text
\ No newline at end of file
+    return response_text
+# --- Ответы LLM в Telegram HTML ---
+
+# Лимит текста сообщения Bot API (после разбора сущностей считаются символы, но теги
+# тоже идут в запрос — режем по длине HTML, так надёжнее)
+TG_MESSAGE_LIMIT = 4096
+
+_FENCE_RE = re.compile(r"```[^\n`]*\n?(.*?)```", re.S)
+_INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
+_BOLD_RE = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*")
+
+def md_to_tg_html(text: str) -> str:
+    """Markdown answer from the LLM → Telegram HTML: everything escaped, code fences,
+    inline code and **bold** kept as <pre>/<code>/<b>."""
+    if not text:
+        return ""
+    out, pos = [], 0
+    for m in _FENCE_RE.finditer(text):
+        out.append(_inline_md(text[pos:m.start()]))
+        out.append(f"<pre>{escape_html(m.group(1).rstrip())}</pre>")
+        pos = m.end()
+    out.append(_inline_md(text[pos:]))
+    return "".join(out)
+
+def _inline_md(text: str) -> str:
+    parts = _INLINE_CODE_RE.split(text)  # нечётные — содержимое `code`
+    res = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            res.append(f"<code>{escape_html(part)}</code>")
+        else:
+            res.append(_BOLD_RE.sub(r"<b>\1</b>", escape_html(part)))
+    return "".join(res)
+
+# тег | сущность | слово с хвостовыми пробелами | пробелы
+_HTML_TOKEN_RE = re.compile(r"<[^<>]*>|&#?\w+;|[^<&\s]+\s*|\s+|[<&]")
+_TAG_NAME_RE = re.compile(r"</?\s*([a-zA-Z0-9-]+)")
+
+def _cut_priority(tok: str) -> int:
+    """How good a boundary the end of this token is: paragraph > line > sentence > word."""
+    if tok.endswith("\n\n") or tok == "</pre>":
+        return 3
+    if tok.endswith("\n"):
+        return 2
+    if tok.rstrip()[-1:] in ".!?:;" and tok != tok.rstrip():
+        return 1
+    return 0 if tok[-1:].isspace() else -1
+
+def split_html(html: str, limit: int = TG_MESSAGE_LIMIT) -> List[str]:
+    """Split Telegram HTML into parts of at most limit chars without breaking tags or entities.
+
+    Режем по лучшей границе во второй половине части (абзац > строка > предложение >
+    слово); открытые на разрезе теги закрываются в конце части и открываются заново
+    в начале следующей, так что каждая часть — валидный HTML. Каждый шаг цикла
+    либо берёт токен, либо отдаёт часть, либо сокращает токен — зацикливания нет
+    даже на мусорной разметке (незакрытые теги копятся — перестаём их переносить).
+    Простой текст — split_plain().
+    """
+    if len(html) <= limit:
+        return [html] if html.strip() else []
+    parts: List[str] = []
+    stack: List[Tuple[str, str]] = []  # (имя, открывающий тег)
+    buf: List[str] = []  # начинается с переоткрытых тегов (reopened штук)
+    reopened = 0
+    size = 0
+    cuts: List[tuple] = []  # (приоритет, индекс в buf, размер, стек на разрезе)
+
+    def emit(upto: int, st: List[Tuple[str, str]]) -> None:
+        nonlocal buf, size, cuts, reopened
+        body = "".join(buf[:upto])
+        if _TAGS_RE.sub("", body).strip():
+            parts.append(body + _closers(st))
+        buf = [t for _, t in st] + buf[upto:]
+        reopened = len(st)
+        size = sum(len(t) for t in buf)
+        cuts = []
+        # разрезы внутри перенесённого хвоста пересчитываем
+        run_stack = list(st)
+        acc = sum(len(t) for _, t in st)
+        for j in range(reopened, len(buf)):
+            _apply_tag(buf[j], run_stack)
+            acc += len(buf[j])
+            prio = _cut_priority(buf[j])
+            if prio >= 0 and acc + len(_closers(run_stack)) <= limit:
+                cuts.append((prio, j + 1, acc, list(run_stack)))
+
+    tokens = _HTML_TOKEN_RE.findall(html)
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        after = list(stack)
+        _apply_tag(tok, after)
+        if size + len(tok) + len(_closers(after)) <= limit:
+            buf.append(tok)
+            size += len(tok)
+            stack = after
+            prio = _cut_priority(tok)
+            if prio >= 0:
+                cuts.append((prio, len(buf), size, list(stack)))
+            i += 1
+            continue
+        good = [c for c in cuts if c[2] >= limit // 2]
+        if good:
+            best = max(good, key=lambda c: (c[0], c[2]))
+            emit(best[1], best[3])
+        elif cuts:
+            emit(cuts[-1][1], cuts[-1][3])
+        elif len(buf) > reopened and size + len(_closers(stack)) <= limit:
+            emit(len(buf), stack)
+        elif buf:
+            # с переоткрытыми тегами хвост не влезает ни в какую часть — разметка не телеграмная
+            # (сотни незакрытых тегов); дальше без переноса тегов, хвост разбираем заново
+            tokens[i:i] = buf[reopened:]
+            buf, stack, cuts, reopened, size = [], [], [], 0, 0
+        elif tok.startswith("<") and len(tok) > 1:
+            # тег длиннее части — отдаём как есть кусками
+            parts.extend(tok[k:k + limit] for k in range(0, len(tok), limit))
+            i += 1
+        else:
+            # одно слово длиннее части — режем его по символам (внутри текста нет тегов и сущностей)
+            tokens[i:i + 1] = [tok[:limit], tok[limit:]]
+    tail = "".join(buf)
+    if _TAGS_RE.sub("", tail).strip():
+        parts.append(tail + _closers(stack))
+    return parts
+
+_TAGS_RE = re.compile(r"<[^<>]*>")
+
+_PLAIN_CUTS = ("\n\n", "\n", ". ", "! ", "? ", "; ", " ")
+
+def split_plain(text: str, limit: int = TG_MESSAGE_LIMIT) -> List[str]:
+    """Split plain text (no markup) into parts of at most limit chars.
+
+    Та же граница, что у split_html (абзац > строка > предложение > слово во второй
+    половине части), но без разбора тегов — «<div>» в тексте остаётся текстом.
+    """
+    parts: List[str] = []
+    while len(text) > limit:
+        cut = limit
+        for sep in _PLAIN_CUTS:
+            k = text.rfind(sep, limit // 2, limit)
+            if k >= 0:
+                cut = k + len(sep)
+                break
+        parts.append(text[:cut])
+        text = text[cut:]
+    parts.append(text)
+    return [p for p in parts if p.strip()]
+
+def _closers(stack: List[Tuple[str, str]]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+def _apply_tag(tok: str, stack: List[Tuple[str, str]]) -> None:
+    """Track open tags: push on <x ...>, pop up to the matching </x>."""
+    if not tok.startswith("<") or len(tok) < 3:
+        return
+    m = _TAG_NAME_RE.match(tok)
+    if not m:
+        return
+    name = m.group(1).lower()
+    if tok.startswith("</"):
+        for k in range(len(stack) - 1, -1, -1):
+            if stack[k][0] == name:
+                del stack[k:]
+                break
+    else:
+        stack.append((name, tok))
@@ -0,0 +1,166 @@
+"""Per-user ordering of incoming updates (aiogram outer update middleware).
+
+aiogram обрабатывает апдейты параллельно задачами; хендлеры же читают и пишут
+UserState, FSM и словари в памяти (последний документ, ожидание /memory clear)
+по пользователю. Middleware берёт замок пользователя до вызова хендлеров, так
+что апдейты одного пользователя идут строго по очереди (asyncio.Lock — FIFO),
+а разные пользователи — полностью параллельно. Замок берётся до FSM aiogram,
+так что и чтение состояния идёт по очереди. Замки живут, пока на них кто-то
+ждёт, и удаляются после последнего апдейта.
+
+Лимит UPDATES_CONCURRENCY считает только апдейты, которые уже получили замок
+пользователя: ожидающие в очереди своего пользователя место не занимают, и
+один пользователь с сотней сообщений не останавливает остальных. Очередь
+пользователя ограничена UPDATES_PER_USER; лишние апдейты отбрасываются с
+предупреждением в лог.
+
+Долгие участки (вызов LLM) можно выполнить без замка — user_unlocked().
+"""
+from __future__ import annotations
+import os
+import asyncio
+import logging
+import contextlib
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+UPDATE_ORDERING = os.getenv("UPDATE_ORDERING", "1") == "1"
+# Лимит одновременно обрабатываемых апдейтов (poll -> задачи); 0 — без лимита
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", "500"))
+# Сколько апдейтов одного пользователя может ждать/обрабатываться сразу; 0 — без лимита
+UPDATES_PER_USER = int(os.getenv("UPDATES_PER_USER", "100"))
+
+class _Slot:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # апдейты, которые держат замок или ждут его
+
+class _Hold:
+    """The lock as held by one update's handler chain (released inside user_unlocked)."""
+    __slots__ = ("slot", "held", "active")
+
+    def __init__(self, slot: _Slot, active: Optional[asyncio.Semaphore]):
+        self.slot = slot
+        self.held = False
+        self.active = active  # место в UPDATES_CONCURRENCY, берётся после замка
+
+    async def acquire(self) -> None:
+        # всегда замок, потом место: держатель места никогда не ждёт замок — нет взаимной блокировки
+        await self.slot.lock.acquire()
+        self.held = True
+        if self.active is not None:
+            try:
+                await self.active.acquire()
+            except BaseException:
+                self.release()
+                raise
+
+    def release(self) -> None:
+        if self.held:
+            if self.active is not None:
+                self.active.release()
+            self.slot.lock.release()
+            self.held = False
+
+_current: ContextVar[Optional[_Hold]] = ContextVar("user_hold", default=None)
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """Serializes updates per user and caps the ones in processing; updates without a user take only a cap slot."""
+
+    def __init__(self, concurrency: int = UPDATES_CONCURRENCY, per_user: int = UPDATES_PER_USER):
+        self._slots: Dict[int, _Slot] = {}
+        self._active = asyncio.Semaphore(concurrency) if concurrency else None
+        self.per_user = per_user
+        self.dropped = 0
+
+    def busy(self, user_id: int) -> bool:
+        slot = self._slots.get(user_id)
+        return slot is not None and slot.lock.locked()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            if self._active is None:
+                return await handler(event, data)
+            async with self._active:
+                return await handler(event, data)
+        # до acquire нет ни одного await — очередь замка совпадает с порядком апдейтов
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = _Slot()
+        if self.per_user and slot.users >= self.per_user:
+            self.dropped += 1
+            logger.warning(f"User {user.id}: {slot.users} updates queued, dropping update")
+            return None
+        slot.users += 1
+        hold = _Hold(slot, self._active)
+        token = _current.set(hold)
+        try:
+            await hold.acquire()
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            hold.release()
+            slot.users -= 1
+            if not slot.users:
+                self._slots.pop(user.id, None)
+
+@contextlib.asynccontextmanager
+async def user_unlocked():
+    """Run the block without holding the current user's lock (long LLM calls, downloads).
+
+    Следующие апдейты пользователя обрабатываются, пока блок выполняется; после
+    блока хендлер снова встаёт в очередь пользователя. Место в UPDATES_CONCURRENCY
+    на время блока тоже отдаётся. Вне middleware — no-op.
+    """
+    hold = _current.get()
+    if hold is None or not hold.held:
+        yield
+        return
+    hold.release()
+    try:
+        yield
+    finally:
+        await hold.acquire()
+
+def install_user_ordering(dp: Dispatcher, concurrency: int = UPDATES_CONCURRENCY,
+                          per_user: int = UPDATES_PER_USER) -> Optional[UserOrderingMiddleware]:
+    """Register the per-user ordering middleware on all updates: after aiogram's user context, before FSM.
+
+    FSMContextMiddleware читает raw_state до хендлера — под замком, иначе
+    апдейт N+1 увидит состояние до set_state() апдейта N. Вставки в середину у
+    MiddlewareManager нет, поэтому FSM и всё после него снимаются через
+    unregister() и регистрируются заново после нашего middleware. Вызывать сразу
+    после Dispatcher(): outer middleware, зарегистрированные раньше, окажутся до
+    замка. Порядок проверяет tests/test_ordering.py.
+
+    С ordering лимит UPDATES_CONCURRENCY держит middleware — поллингу и вебхуку
+    свой лимит не нужен (иначе ожидающие замок апдейты снова занимают места).
+    """
+    if not UPDATE_ORDERING:
+        return None
+    mw = UserOrderingMiddleware(concurrency=concurrency, per_user=per_user)
+    chain = dp.update.outer_middleware
+    current = list(chain)
+    tail = current[current.index(dp.fsm):] if dp.fsm in current else []
+    for m in tail:
+        chain.unregister(m)
+    chain.register(mw)
+    for m in tail:
+        chain.register(m)
+    return mw
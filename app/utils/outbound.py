@@ -0,0 +1,207 @@
+"""Outbound Telegram request scheduler (aiogram request middleware).
+
+Все вызовы Bot API идут через bot.session, поэтому один middleware покрывает
+все хендлеры: токен-бакеты на чат и глобальный, приоритеты (ответы раньше
+правок, правки раньше уборки панелей), склейка повторных правок одного
+сообщения и прозрачный повтор после RetryAfter.
+
+Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, ~20/мин в группу.
+"""
+from __future__ import annotations
+import os
+import time
+import heapq
+import asyncio
+import logging
+import contextlib
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    EditMessageCaption, EditMessageReplyMarkup, EditMessageText, GetUpdates,
+)
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_SCHEDULER = os.getenv("OUTBOUND_SCHEDULER", "1") == "1"
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "5"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_GROUP_BURST = float(os.getenv("OUTBOUND_GROUP_BURST", "5"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Сколько бакетов чатов держать, прежде чем выкинуть простаивающие
+OUTBOUND_MAX_CHATS = 10000
+
+# Приоритеты: меньше — раньше
+PRIORITY_ANSWER = 0
+PRIORITY_EDIT = 1
+PRIORITY_CLEANUP = 2
+
+_priority: ContextVar[Optional[int]] = ContextVar("outbound_priority", default=None)
+
+@contextlib.contextmanager
+def outbound_priority(level: int):
+    """Override the priority of Bot API calls made inside the block (e.g. PRIORITY_CLEANUP for panel cleanup)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+_EDITS = (EditMessageText, EditMessageReplyMarkup, EditMessageCaption)
+
+def _default_priority(method) -> int:
+    name = method.__api_method__
+    if name.startswith("delete"):
+        return PRIORITY_CLEANUP
+    if name.startswith("edit"):
+        return PRIORITY_EDIT
+    return PRIORITY_ANSWER
+
+class TokenBucket:
+    """Token bucket whose waiters are served by priority, then FIFO."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+        self._pump: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.burst
+
+    async def acquire(self, priority: int = PRIORITY_ANSWER) -> None:
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await fut
+
+    async def _run(self) -> None:
+        while self._waiters:
+            self._refill()
+            if self.tokens >= 1:
+                _, _, fut = heapq.heappop(self._waiters)
+                if not fut.done():
+                    self.tokens -= 1
+                    fut.set_result(None)
+                continue
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Flood wait from Telegram: no tokens for `seconds` (negative balance refills back to zero)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+@dataclass
+class _PendingEdit:
+    method: Any
+    done: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Request middleware: per-chat + global rate limiting, edit coalescing and RetryAfter handling."""
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST)
+        self.chats: Dict[Any, TokenBucket] = {}
+        self._edits: Dict[Tuple[str, Any, Any], _PendingEdit] = {}
+        self.stats = {"sent": 0, "coalesced": 0, "retry_after": 0}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= OUTBOUND_MAX_CHATS:
+                for key in [k for k, b in self.chats.items() if b.idle]:
+                    del self.chats[key]
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(OUTBOUND_GROUP_RATE if group else OUTBOUND_CHAT_RATE,
+                                 OUTBOUND_GROUP_BURST if group else OUTBOUND_CHAT_BURST)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or isinstance(method, GetUpdates):
+            # getUpdates, answerCallbackQuery, inline-правки — без чатового лимита
+            return await self._send(make_request, bot, method, None)
+        prio = _priority.get()
+        if prio is None:
+            prio = _default_priority(method)
+
+        if not isinstance(method, _EDITS) or not getattr(method, "message_id", None):
+            await self._acquire(chat_id, prio)
+            return await self._send(make_request, bot, method, chat_id)
+
+        # Правка уже ждёт очереди — подменяем её текст новым и ждём общий результат
+        key = (method.__api_method__, chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.method = method
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending.done)
+        pending = self._edits[key] = _PendingEdit(method)
+        try:
+            try:
+                await self._acquire(chat_id, prio)
+            finally:
+                # после выдачи токена новые правки идут уже следующим запросом
+                self._edits.pop(key, None)
+            result = await self._send(make_request, bot, pending.method, chat_id)
+        except BaseException as e:
+            # владелец ушёл, не отправив (отменён в очереди или ошибка) — ждущие не должны висеть;
+            # отмена владельца — не их отмена, им уходит обычная ошибка
+            if not pending.done.done():
+                pending.done.set_exception(e if isinstance(e, Exception) else
+                                           RuntimeError(f"{method.__api_method__} was not sent: request cancelled"))
+                pending.done.exception()  # помечаем извлечённым: ждущих может не быть
+            raise
+        pending.done.set_result(result)
+        return result
+
+    async def _acquire(self, chat_id, priority: int) -> None:
+        await self._chat_bucket(chat_id).acquire(priority)
+        await self.global_bucket.acquire(priority)
+
+    async def _send(self, make_request, bot, method, chat_id):
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            try:
+                result = await make_request(bot, method)
+                self.stats["sent"] += 1
+                return result
+            except TelegramRetryAfter as e:
+                self.stats["retry_after"] += 1
+                if attempt >= OUTBOUND_MAX_RETRIES:
+                    raise
+                logger.warning(f"Outbound RetryAfter {e.retry_after}s on {method.__api_method__} chat={chat_id}")
+                # бакет сам выдержит паузу; повтор идёт первым в очереди чата
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.pause(e.retry_after)
+                await bucket.acquire(PRIORITY_ANSWER - 1)
+
+def install_outbound_scheduler(bot) -> Optional[OutboundScheduler]:
+    """Wrap every request of this bot with the scheduler (OUTBOUND_SCHEDULER=0 disables)."""
+    if not OUTBOUND_SCHEDULER:
+        return None
+    scheduler = OutboundScheduler()
+    bot.session.middleware(scheduler)
+    return scheduler
@@ -0,0 +1,136 @@
+"""Text/binary sniffing from the first few KB of a file.
+
+Одно решение «текст или нет» (и в какой кодировке) для всех путей импорта:
+файлы, ZIP-члены, репозитории. Многомегабайтный бинарник отсекается после 4 КБ.
+"""
+from __future__ import annotations
+import codecs
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+SNIFF_BYTES = 4096
+
+# Доля NUL-байт, после которой без BOM считаем файл бинарным (UTF-16 без BOM ловится отдельно)
+NUL_RATIO_BINARY = 0.01
+# Доля управляющих символов (кроме \t \n \r \f \b ESC)
+CTRL_RATIO_BINARY = 0.10
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Сигнатуры частых бинарных форматов — решение без подсчётов
+_MAGIC = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"%PDF", b"PK\x03\x04", b"\x1f\x8b", b"\x7fELF",
+    b"MZ", b"BZh", b"7z\xbc\xaf", b"Rar!", b"RIFF", b"OggS", b"ID3", b"\x00\x00\x01\x00",
+    b"SQLite format 3", b"\xca\xfe\xba\xbe", b"wOFF", b"wOF2",
+)
+
+_CTRL = bytes(b for b in range(32) if b not in (9, 10, 12, 13, 8, 27))
+
+@dataclass(frozen=True)
+class SniffResult:
+    is_text: bool
+    encoding: str | None
+    confidence: float
+    reason: str
+
+def _binary(reason: str) -> SniffResult:
+    return SniffResult(False, None, 1.0, reason)
+
+def _utf16_without_bom(head: bytes) -> str | None:
+    """UTF-16 without BOM: the high-byte half takes very few values (0x00 for ASCII, 0x04 for Cyrillic…)."""
+    if len(head) < 16:
+        return None
+    for enc, high, low in (("utf-16-le", head[1::2], head[0::2]), ("utf-16-be", head[0::2], head[1::2])):
+        counts = Counter(high)
+        top = sum(n for _, n in counts.most_common(3))
+        if 0 in counts and top / len(high) > 0.95 and len(set(low)) > 8:
+            return enc
+    return None
+
+def sniff_bytes(head: bytes, complete: bool = False) -> SniffResult:
+    """Decide text/binary and charset from a prefix. complete=True if head is the whole file."""
+    if not head:
+        return SniffResult(True, "utf-8", 1.0, "empty")
+    for bom, enc in _BOMS:
+        if head.startswith(bom):
+            return SniffResult(True, enc, 1.0, "bom")
+    for magic in _MAGIC:
+        if head.startswith(magic):
+            return _binary("magic")
+
+    nul = head.count(0)
+    if nul:
+        enc16 = _utf16_without_bom(head)
+        if enc16:
+            return SniffResult(True, enc16, 0.8, "utf16-pattern")
+        if nul / len(head) > NUL_RATIO_BINARY:
+            return _binary("nul-bytes")
+
+    ctrl = len(head) - len(head.translate(None, _CTRL))
+    if ctrl / len(head) > CTRL_RATIO_BINARY:
+        return _binary("control-chars")
+
+    if head.isascii():
+        return SniffResult(True, "utf-8", 1.0, "ascii")
+
+    # UTF-8: префикс может обрываться посреди многобайтового символа
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=complete)
+        return SniffResult(True, "utf-8", 0.99, "utf-8")
+    except UnicodeDecodeError:
+        pass
+
+    # charset импортирует sniff_bytes — поэтому импорт здесь
+    from app.utils.charset import detect_legacy
+    best, conf = detect_legacy(head)
+    return SniffResult(True, best, conf, "legacy-charset")
+
+def sniff_stream(f: BinaryIO) -> tuple[SniffResult, bytes]:
+    """Sniff from an open binary stream; returns (result, bytes already read)."""
+    head = f.read(SNIFF_BYTES + 1)
+    complete = len(head) <= SNIFF_BYTES
+    return sniff_bytes(head[:SNIFF_BYTES], complete=complete), head
+
+def sniff_file(path: Path) -> SniffResult:
+    with open(path, "rb") as f:
+        return sniff_stream(f)[0]
+
+def decode_sniffed(data: bytes, result: SniffResult | None = None) -> str | None:
+    """Decode in-memory bytes using the sniffed charset; None for binary."""
+    result = result or sniff_bytes(data[:SNIFF_BYTES], complete=len(data) <= SNIFF_BYTES)
+    if not result.is_text:
+        return None
+    return data.decode(result.encoding or "utf-8", errors="replace")
+
+def read_text_file(path: Path, max_bytes: int | None = None) -> str | None:
+    """Read a file as text only if the first SNIFF_BYTES look like text; None for binary/oversized."""
+    try:
+        if max_bytes is not None and path.stat().st_size > max_bytes:
+            return None
+        with open(path, "rb") as f:
+            result, head = sniff_stream(f)
+            if not result.is_text:
+                return None
+            data = head + f.read()
+    except OSError:
+        return None
+    return decode_sniffed(data, result)
+
+def read_zip_member_text(zf, info, max_bytes: int | None = None) -> str | None:
+    """Same decision for a ZIP member (zipfile.ZipFile, ZipInfo) without inflating binaries fully."""
+    if max_bytes is not None and info.file_size > max_bytes:
+        return None
+    with zf.open(info) as f:
+        result, head = sniff_stream(f)
+        if not result.is_text:
+            return None
+        data = head + f.read()
+    return decode_sniffed(data, result)
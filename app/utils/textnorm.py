@@ -0,0 +1,60 @@
+"""Text normalization: NFC + stripping control/format characters.
+
+Тот же результат, что и посимвольный unicodedata.category(ch).startswith("C"),
+но одним проходом: str.translate для ASCII и предкомпилированный regex
+для остального. Класс символов строится один раз из той же unicodedata.
+"""
+from __future__ import annotations
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+_KEEP = {"\n", "\t"}
+
+# ASCII: C0-управляющие (кроме \n \t) и DEL
+_ASCII_CTRL = {c: None for c in (*range(0x20), 0x7F) if chr(c) not in _KEEP}
+
+@lru_cache(maxsize=1)
+def _control_re() -> tuple[re.Pattern[str], re.Pattern[str]]:
+    """Regex classes of every code point in category C* (Cc/Cf/Cs/Co/Cn) except \\n and \\t: (BMP, astral).
+
+    BMP-класс sre компилирует в битовую карту (O(1) на символ); астральные диапазоны
+    в ту же карту не влезают и превращают класс в линейный перебор — поэтому отдельно.
+    """
+    bmp: list[str] = []
+    astral: list[str] = []
+    start = prev = None
+    for cp in range(sys.maxunicode + 2):
+        is_ctrl = cp <= sys.maxunicode and chr(cp) not in _KEEP and unicodedata.category(chr(cp))[0] == "C"
+        # диапазоны не пересекают границу BMP
+        if start is not None and (not is_ctrl or cp == 0x10000):
+            (bmp if start < 0x10000 else astral).append(_range(start, prev))
+            start = None
+        if is_ctrl:
+            if start is None:
+                start = cp
+            prev = cp
+    return re.compile("[" + "".join(bmp) + "]+"), re.compile("[" + "".join(astral) + "]+")
+
+def _range(a: int, b: int) -> str:
+    return f"\\U{a:08x}" if a == b else f"\\U{a:08x}-\\U{b:08x}"
+
+def normalize_text(text: str) -> str:
+    """Normalize text to NFC and remove control characters (except newlines and tabs)."""
+    if not text:
+        return ""
+    if text.isascii():
+        # NFC для ASCII — тождество
+        return text.translate(_ASCII_CTRL)
+    if not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    # isprintable() — C-цикл, False на C* (и на Zs/Zl/Zp, например NBSP — тогда просто идём в regex)
+    if text.replace("\n", "").replace("\t", "").isprintable():
+        return text
+    bmp_re, astral_re = _control_re()
+    text = bmp_re.sub("", text)
+    # есть символы вне BMP ⇔ UTF-16 длиннее 2 байт на символ (быстрее, чем max(text))
+    if len(text.encode("utf-16-le", "surrogatepass")) > 2 * len(text):
+        text = astral_re.sub("", text)
+    return text
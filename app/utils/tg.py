@@ -1,15 +1,20 @@
 """Telegram utility functions for message handling and cleanup."""
 import asyncio
 import logging
-from typing import List, Union
+from typing import Iterable, List, Optional, Union
 from aiogram import Bot
-from aiogram.types import CallbackQuery, Message
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardMarkup, Message
+from app.utils.markdown import split_html, split_plain
 
 logger = logging.getLogger(__name__)
 
 # Get TTL from environment or use default
 import os
 UI_CLEANUP_TTL = int(os.getenv("UI_CLEANUP_TTL", "4"))
+# Длиннее — не серия сообщений, а превью + файл с полным ответом
+ANSWER_MAX_PARTS = int(os.getenv("ANSWER_MAX_PARTS", "4"))
+ANSWER_PREVIEW_LIMIT = 1500
 
 async def _toast(cb: CallbackQuery, text: str, show_alert: bool = False) -> None:
     """Send a toast message via answerCallbackQuery."""
@@ -18,32 +23,118 @@ async def _toast(cb: CallbackQuery, text: str, show_alert: bool = False) -> None
     except Exception as e:
         logger.warning(f"Failed to send toast message: {e}")
 
+# Лимит Bot API deleteMessages
+DELETE_BATCH_SIZE = 100
+
+def parse_msg_ids(csv: Optional[str]) -> List[int]:
+    """"1,2,3" from UserState *_msg_ids columns → [1, 2, 3] (garbage skipped)."""
+    return [int(x) for x in (csv or "").split(",") if x.strip().isdigit()]
+
+async def _delete_one(bot: Bot, chat_id: int, msg_id: int) -> bool:
+    try:
+        return bool(await bot.delete_message(chat_id=chat_id, message_id=msg_id))
+    except Exception as e:
+        # Suppress NotFound errors but log others
+        if "message to delete not found" not in str(e).lower():
+            logger.warning(f"Failed to delete message {msg_id}: {e}")
+        return False
+
+async def delete_messages(bot: Bot, chat_id: int, msg_ids: Iterable[Optional[int]]) -> int:
+    """Delete messages in one chat with deleteMessages (up to 100 ids per call).
+
+    Telegram пропускает уже удалённые id внутри пачки; если пачка отклонена целиком
+    (например, сообщение старше 48 ч), она удаляется по одному с тем же подавлением NotFound.
+    Returns the number of API calls made.
+    """
+    ids = sorted({int(i) for i in msg_ids if i})
+    calls = 0
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start:start + DELETE_BATCH_SIZE]
+        if len(batch) == 1:
+            calls += 1
+            await _delete_one(bot, chat_id, batch[0])
+            continue
+        calls += 1
+        try:
+            await bot.delete_messages(chat_id=chat_id, message_ids=batch)
+            continue
+        except TelegramBadRequest as e:
+            logger.info(f"deleteMessages rejected in chat {chat_id} ({e}); deleting one by one")
+        except Exception as e:
+            logger.warning(f"deleteMessages failed in chat {chat_id}: {e}; deleting one by one")
+        for msg_id in batch:
+            calls += 1
+            await _delete_one(bot, chat_id, msg_id)
+    return calls
+
 async def _safe_delete(bot: Bot, chat_id: int, msg_ids: Union[int, List[int]]) -> None:
     """Safely delete messages, suppressing NotFound errors."""
     if isinstance(msg_ids, int):
         msg_ids = [msg_ids]
-    
-    for msg_id in msg_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=msg_id)
-        except Exception as e:
-            # Suppress NotFound errors but log others
-            if "message to delete not found" not in str(e).lower():
-                logger.warning(f"Failed to delete message {msg_id}: {e}")
+    await delete_messages(bot, chat_id, msg_ids)
 
 async def _send_ephemeral(bot: Bot, chat_id: int, text: str, ttl: int = UI_CLEANUP_TTL) -> None:
     """Send an ephemeral message that self-destructs after TTL seconds."""
+    from app.services.deletions import schedule_delete
     try:
         msg = await bot.send_message(chat_id=chat_id, text=text)
-        # Schedule deletion after TTL seconds
-        asyncio.create_task(_delayed_delete(bot, chat_id, msg.message_id, ttl))
+        # Schedule deletion after TTL seconds (общий планировщик, без задачи на сообщение)
+        schedule_delete(bot, chat_id, msg.message_id, ttl)
     except Exception as e:
         logger.warning(f"Failed to send ephemeral message: {e}")
 
-async def _delayed_delete(bot: Bot, chat_id: int, msg_id: int, delay: int) -> None:
-    """Delete a message after a delay."""
+async def _delayed_delete(bot: Bot, chat_id: int, msg_id: int, delay: float) -> None:
+    """Delete a message after a delay (fallback when the deletion scheduler is not running)."""
     try:
         await asyncio.sleep(delay)
         await _safe_delete(bot, chat_id, msg_id)
     except Exception as e:
-        logger.warning(f"Failed to delete message after delay: {e}")
\ No newline at end of file
+        logger.warning(f"Failed to delete message after delay: {e}")
+
+async def send_long_answer(bot: Bot, chat_id: int, html: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                           edit_message_id: Optional[int] = None, plain: Optional[str] = None,
+                           file_name: str = "answer.md") -> List[int]:
+    """Send an HTML answer of any length; returns the ids of its messages (keyboard on the last one).
+
+    Первая часть редактирует edit_message_id («Готовлю ответ…»), остальные идут
+    продолжениями. Больше ANSWER_MAX_PARTS частей — превью и документ с полным
+    текстом (plain). Если Telegram не разобрал HTML, те же части уходят простым текстом —
+    ответ LLM не теряется.
+    """
+    parts = split_html(html)
+    as_document = len(parts) > ANSWER_MAX_PARTS
+    if as_document:
+        parts = split_html(html, ANSWER_PREVIEW_LIMIT)[:1]
+    try:
+        ids = await _send_parts(bot, chat_id, parts, None if as_document else reply_markup, edit_message_id, "HTML")
+    except TelegramBadRequest as e:
+        if "parse" not in str(e).lower() or plain is None:
+            raise
+        logger.warning(f"Answer HTML rejected ({e}); sending as plain text")
+        parts = split_plain(plain)
+        if as_document:
+            parts = split_plain(plain, ANSWER_PREVIEW_LIMIT)[:1]
+        ids = await _send_parts(bot, chat_id, parts, None if as_document else reply_markup, edit_message_id, None)
+    if as_document:
+        doc = await bot.send_document(
+            chat_id=chat_id,
+            document=BufferedInputFile((plain or html).encode("utf-8"), filename=file_name),
+            caption="Полный ответ — в файле",
+            reply_markup=reply_markup,
+        )
+        ids.append(doc.message_id)
+    return ids
+
+async def _send_parts(bot: Bot, chat_id: int, parts: List[str], reply_markup: Optional[InlineKeyboardMarkup],
+                      edit_message_id: Optional[int], parse_mode: Optional[str]) -> List[int]:
+    ids: List[int] = []
+    for n, part in enumerate(parts):
+        kb = reply_markup if n == len(parts) - 1 else None
+        if n == 0 and edit_message_id:
+            await bot.edit_message_text(chat_id=chat_id, message_id=edit_message_id, text=part,
+                                        reply_markup=kb, parse_mode=parse_mode)
+            ids.append(edit_message_id)
+        else:
+            m = await bot.send_message(chat_id=chat_id, text=part, reply_markup=kb, parse_mode=parse_mode)
+            ids.append(m.message_id)
+    return ids
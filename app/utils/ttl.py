@@ -0,0 +1,141 @@
+"""Heap-based TTL store: O(log n) expiry, lazy expiry on read, bounded size.
+
+Вместо периодического прохода по всем ключам: дедлайны лежат в куче, expire()
+снимает только наступившие (O(k log n)), get() отбрасывает просроченный ключ
+сразу. Перезапись ключа оставляет в куче устаревшую запись — она пропускается
+при снятии, а куча уплотняется, когда мусора становится больше живых записей.
+
+run() — один таймер на весь store: спит до ближайшего дедлайна и отдаёт
+просроченное пачкой в on_expire (так работают отложенные удаления сообщений).
+"""
+from __future__ import annotations
+import time
+import heapq
+import asyncio
+import inspect
+from itertools import count
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+class TTLStore:
+    """dict with per-key TTL (seconds; None — no expiry) and a size bound.
+
+    При переполнении вытесняются ключи с ближайшим дедлайном, затем самые старые
+    бессрочные. on_expire(items) вызывается из expire()/run() для снятых по TTL
+    ключей — не для прочитанных get() и не для вытесненных.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None,
+                 on_expire: Optional[Callable[[List[Tuple[Hashable, Any]]], Any]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.on_expire = on_expire
+        self.clock = clock
+        self._data: Dict[Hashable, Tuple[Optional[float], Any]] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = count()
+        self._wake: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def items(self) -> Iterable[Tuple[Hashable, Any]]:
+        now = self.clock()
+        return [(k, v) for k, (exp, v) in self._data.items() if exp is None or exp > now]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        hit = self._data.get(key)
+        if hit is None:
+            return default
+        if hit[0] is not None and hit[0] <= self.clock():
+            del self._data[key]  # запись в куче станет мусором
+            return default
+        return hit[1]
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        hit = self._data.get(key)
+        return hit[0] if hit is not None else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        exp = self.clock() + ttl if ttl is not None else None
+        self._data.pop(key, None)  # новый порядок вставки — для вытеснения бессрочных
+        self._data[key] = (exp, value)
+        if exp is not None:
+            heapq.heappush(self._heap, (exp, next(self._seq), key))
+            if self._wake is not None and self._heap[0][2] == key:
+                self._wake.set()  # дедлайн раньше, чем тот, до которого спит run()
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._evict(len(self._data) - self.maxsize)
+        if len(self._heap) > 2 * len(self._data) + 64:
+            self._compact()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        del self._data[key]
+        return value
+
+    def next_expiry(self) -> Optional[float]:
+        """Nearest live deadline (clock time) or None."""
+        while self._heap:
+            exp, _, key = self._heap[0]
+            if self._live_entry(exp, key):
+                return exp
+            heapq.heappop(self._heap)
+        return None
+
+    def expire(self, now: Optional[float] = None) -> List[Tuple[Hashable, Any]]:
+        """Remove and return all entries whose deadline has passed."""
+        now = self.clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            exp, _, key = heapq.heappop(self._heap)
+            if self._live_entry(exp, key):
+                due.append((key, self._data.pop(key)[1]))
+        return due
+
+    async def run(self, linger: float = 0.0) -> None:
+        """Expire entries as their deadlines come, handing each batch to on_expire. Runs until cancelled.
+
+        linger — сколько подождать после дедлайна, чтобы снять пачкой всё, что истекает следом.
+        """
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                due = self.expire()
+                if due and self.on_expire is not None:
+                    res = self.on_expire(due)
+                    if inspect.isawaitable(res):
+                        await res
+                nxt = self.next_expiry()
+                self._wake.clear()
+                timeout = None if nxt is None else max(0.0, nxt + linger - self.clock())
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wake = None
+
+    def _live_entry(self, exp: float, key: Hashable) -> bool:
+        hit = self._data.get(key)
+        return hit is not None and hit[0] == exp
+
+    def _evict(self, n: int) -> None:
+        while n > 0 and self._heap:
+            exp, _, key = heapq.heappop(self._heap)
+            if self._live_entry(exp, key):
+                del self._data[key]
+                n -= 1
+        while n > 0 and self._data:
+            del self._data[next(iter(self._data))]
+            n -= 1
+
+    def _compact(self) -> None:
+        self._heap = [e for e in self._heap if self._live_entry(e[0], e[2])]
+        heapq.heapify(self._heap)
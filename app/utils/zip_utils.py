@@ -8,6 +8,7 @@ import os
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any
 import logging
+from app.utils.sniff import SNIFF_BYTES, sniff_bytes, read_zip_member_text
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +22,14 @@ TEXT_EXTENSIONS = {
 # Maximum file size for processing (5MB)
 MAX_FILE_SIZE = 5 * 1024 * 1024
 
-def is_text_file(file_path: str) -> bool:
-    """Check if file should be processed as text based on extension."""
+def is_text_file(file_path: str, head: bytes | None = None) -> bool:
+    """Check if file should be processed as text.
+
+    With head (first bytes of the file) the content sniffer decides; without it —
+    cheap extension guess (used for stats/validation where nothing is read).
+    """
+    if head is not None:
+        return sniff_bytes(head[:SNIFF_BYTES]).is_text
     path = Path(file_path)
     return path.suffix.lower() in TEXT_EXTENSIONS
 
@@ -54,34 +61,16 @@ def extract_text_files(zip_bytes: bytes, max_files: int = 1000) -> Dict[str, str
                 
                 file_path = file_info.filename
                 
-                # Skip if not a text file
-                if not is_text_file(file_path):
-                    continue
-                
                 # Check file size
                 if file_info.file_size > MAX_FILE_SIZE:
                     logger.warning(f"File {file_path} too large ({file_info.file_size} bytes), skipping")
                     continue
                 
                 try:
-                    # Extract and decode file content
-                    with zip_file.open(file_info) as file:
-                        content_bytes = file.read()
-                        
-                    # Try to decode as UTF-8
-                    try:
-                        content = content_bytes.decode('utf-8')
-                    except UnicodeDecodeError:
-                        # Try other encodings
-                        for encoding in ['latin-1', 'cp1252', 'utf-8-sig']:
-                            try:
-                                content = content_bytes.decode(encoding)
-                                break
-                            except UnicodeDecodeError:
-                                continue
-                        else:
-                            logger.warning(f"Could not decode {file_path}, skipping")
-                            continue
+                    # Text/binary and charset by the first 4 KB (not by extension)
+                    content = read_zip_member_text(zip_file, file_info)
+                    if content is None:
+                        continue
                     
                     text_files[file_path] = content
                     processed_count += 1
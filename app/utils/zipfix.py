@@ -31,16 +31,9 @@ def fix_zip_name(name: str, flag_bits: int) -> str:
 
 def decode_text_bytes(data: bytes) -> str:
     """
-    Корректная декодировка содержимого: сначала UTF-8, затем популярные RU-энкодинги.
+    Корректная декодировка содержимого: BOM/UTF-16/UTF-8, затем статистический выбор
+    между cp1251 / koi8_r / cp866 (раньше cp1251 принимался всегда — он почти не падает).
     """
-    try:
-        return data.decode("utf-8")
-    except Exception:
-        pass
-    for enc in ("cp1251", "cp866", "koi8_r", "utf-16"):
-        try:
-            return data.decode(enc)
-        except Exception:
-            continue
-    # последний шанс: "сломанный" UTF-8 без падения
-    return data.decode("utf-8", errors="ignore")
\ No newline at end of file
+    from app.utils.charset import detect_charset
+    enc, _conf = detect_charset(data)
+    return data.decode(enc, errors="replace")
@@ -0,0 +1,60 @@
+"""Background warm-up after polling has started.
+
+Тяжёлые вещи (openai, tiktoken-кодировка, MinIO, regex нормализации) грузятся
+лениво при первом обращении; этот прогрев делает то же самое в фоне, чтобы
+первый /ask после рестарта не платил за холодный старт, а /start отвечал сразу.
+"""
+from __future__ import annotations
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") == "1"
+
+def _load_openai() -> None:
+    from app.llm import _get_client
+    from app.services.llm import get_client
+    _get_client()
+    get_client()
+
+def _load_tokenizer() -> None:
+    from app.tokenizer import get_encoding
+    get_encoding()
+
+def _load_text_tables() -> None:
+    from app.utils.textnorm import _control_re
+    from app.utils.charset import _table, _patterns, CANDIDATES
+    _control_re()
+    _patterns()
+    for enc in CANDIDATES:
+        _table(enc)
+
+def _load_minio() -> None:
+    from app.storage import _client_or_none
+    _client_or_none()
+
+def _load_minio_bucket() -> None:
+    from app.storage import _ensure_bucket
+    _ensure_bucket()
+
+async def _step(name: str, coro) -> None:
+    t0 = time.perf_counter()
+    try:
+        await coro
+        logger.debug(f"Warm-up step {name}: {int((time.perf_counter() - t0) * 1000)} ms")
+    except Exception as e:
+        logger.warning(f"Warm-up step {name} failed: {e}")
+
+async def warm_up() -> None:
+    """Load lazily-initialized clients and tables; each step is independent and failures are only logged."""
+    if not WARMUP_ENABLED:
+        return
+    # импорты и загрузка кодировки — CPU/диск, уводим из event loop по одному
+    await _step("tokenizer", asyncio.to_thread(_load_tokenizer))
+    await _step("openai", asyncio.to_thread(_load_openai))
+    await _step("text tables", asyncio.to_thread(_load_text_tables))
+    await _step("minio client", asyncio.to_thread(_load_minio))
+    await _step("minio bucket", asyncio.to_thread(_load_minio_bucket))
@@ -0,0 +1,102 @@
+"""Webhook entry point: aiohttp server instead of long polling (BOT_MODE=webhook).
+
+Telegram шлёт апдейты POST-ом на WEBHOOK_URL + WEBHOOK_PATH; подлинность проверяется
+заголовком X-Telegram-Bot-Api-Secret-Token (WEBHOOK_SECRET). Несколько реплик можно
+ставить за балансировщик (все слушают один путь с одним секретом, setWebhook
+идемпотентен), но только со STATE_BACKEND=postgres: очередь задач, FSM и состояние
+хендлеров тогда в Postgres. С STATE_BACKEND=memory run_webhook не стартует без
+WEBHOOK_SINGLE_REPLICA=1.
+
+Что остаётся в процессе, даже с Postgres:
+- порядок апдейтов пользователя (app.utils.ordering) — только внутри реплики: два
+  апдейта одного пользователя на разных репликах идут параллельно;
+- кэш панелей и представлений (panel_cache) — свой у каждой реплики, версии
+  сбрасываются только коммитами этой реплики;
+- таймеры удаления эфемерных сообщений — у реплики, которая их запланировала
+  (после рестарта хвост поднимают из pending_deletions все реплики).
+
+Одновременно обрабатывается не больше UPDATES_CONCURRENCY апдейтов на реплику (как в
+поллинге); с ordering лимит держит middleware, без него — этот обработчик: следующий
+POST ждёт места, и Telegram сам придерживает доставку.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from app.config import settings
+from app.utils.ordering import UPDATES_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+async def _healthz(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+class _LimitedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler with at most `limit` updates in processing (0 — no limit)."""
+
+    def __init__(self, *args, limit: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slots = asyncio.Semaphore(limit) if limit else None
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self._slots is None:
+            return await super()._handle_request_background(bot=bot, request=request)
+        # место освобождает задача апдейта; до тех пор ответ Telegram не уходит
+        await self._slots.acquire()
+        try:
+            return await super()._handle_request_background(bot=bot, request=request)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _background_feed_update(self, bot: Bot, update: dict) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, secret: str | None = None, path: str | None = None,
+                      concurrency: int = UPDATES_CONCURRENCY) -> web.Application:
+    """aiohttp app that feeds verified updates into the dispatcher (+ GET /healthz for the load balancer)."""
+    app = web.Application()
+    # handle_in_background: 200 сразу, апдейт обрабатывается задачей — Telegram не ждёт LLM
+    _LimitedRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, limit=concurrency).register(
+        app, path=path or settings.webhook_path)
+    app.router.add_get("/healthz", _healthz)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot, concurrency: int = UPDATES_CONCURRENCY) -> None:
+    """Serve the webhook until cancelled; registers it with Telegram when WEBHOOK_URL is set."""
+    if not settings.webhook_secret:
+        raise RuntimeError("WEBHOOK_SECRET is required in webhook mode")
+    if settings.state_backend == "memory":
+        if not settings.webhook_single_replica:
+            raise RuntimeError("STATE_BACKEND=memory is per-process: use STATE_BACKEND=postgres for webhook replicas "
+                               "(or WEBHOOK_SINGLE_REPLICA=1 if there is exactly one)")
+        logger.warning("Webhook mode with STATE_BACKEND=memory: FSM and handler state are per-process, "
+                       "do NOT run more than one replica")
+
+    async def _set_webhook():
+        url = settings.webhook_url.rstrip("/") + settings.webhook_path
+        await bot.set_webhook(url, secret_token=settings.webhook_secret,
+                              allowed_updates=dp.resolve_used_update_types())
+        logger.info(f"Webhook set: {url}")
+
+    if settings.webhook_url:
+        dp.startup.register(_set_webhook)
+    app = build_webhook_app(dp, bot, settings.webhook_secret, concurrency=concurrency)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.webhook_host, settings.webhook_port)
+    await site.start()
+    logger.info(f"Webhook server listening on {settings.webhook_host}:{settings.webhook_port}{settings.webhook_path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,35 @@
+"""Chunk offsets: text[start_offset:end_offset] is exactly the chunk, for every chunker."""
+import random
+
+from app.chunking import CHUNKERS, ChunkParams, chunk_documents
+from app.tokenizer import chunk_spans, chunk_spans_batch
+
+WORDS = ["память", "проект", "token", "😀", "naïve", "汉字", "a", "\n", "\n\n", "  ", "def f():", "# Title"]
+
+def make_text(rnd: random.Random, n: int) -> str:
+    return "".join(rnd.choice(WORDS) + rnd.choice(" \n") for _ in range(n))
+
+def test_chunk_spans_round_trip():
+    rnd = random.Random(3)
+    for _ in range(30):
+        text = "  \n" + make_text(rnd, rnd.randint(1, 400)) + "\n "
+        spans = chunk_spans(text, size=rnd.randint(8, 64), overlap=rnd.randint(0, 6))
+        assert spans and spans[0].start_offset >= 0 and spans[-1].end_offset <= len(text)
+        for sp in spans:
+            assert text[sp.start_offset:sp.end_offset] == sp.text
+
+def test_batch_matches_single():
+    rnd = random.Random(5)
+    texts = [make_text(rnd, rnd.randint(0, 200)) for _ in range(20)]
+    assert chunk_spans_batch(texts, size=32, overlap=4) == [chunk_spans(t, size=32, overlap=4) for t in texts]
+
+def test_every_chunker_round_trips():
+    rnd = random.Random(7)
+    texts = ["# A\n\n" + make_text(rnd, 300), "def f():\n    return 1\n\n" + make_text(rnd, 300),
+             '{"a": "' + "x" * 500 + '", "b": [1, 2, 3]}', make_text(rnd, 300)]
+    names = ["doc.md", "mod.py", "data.json", "notes.txt"]
+    params = ChunkParams(size=40, overlap=5, struct_overlap=3)
+    for chunker in CHUNKERS:
+        for text, spans in zip(texts, chunk_documents(texts, names, params, chunker)):
+            for sp in spans:
+                assert text[sp.start_offset:sp.end_offset] == sp.text, chunker
@@ -0,0 +1,135 @@
+"""Per-user update ordering through a real Dispatcher with a slow FSM storage."""
+import time
+import random
+import asyncio
+from collections import defaultdict
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, Update
+
+from app.services.state_backend import BackendFSMStorage, MemoryStateBackend
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+
+from app.utils.ordering import UserOrderingMiddleware, install_user_ordering
+
+class SlowBackend(MemoryStateBackend):
+    """MemoryStateBackend with 1–20 ms latency per call, like a remote store."""
+
+    def __init__(self, seed: int = 1):
+        super().__init__()
+        self.rnd = random.Random(seed)
+
+    async def _lag(self):
+        await asyncio.sleep(self.rnd.uniform(0.001, 0.02))
+
+    async def get(self, key, default=None):
+        await self._lag()
+        return await super().get(key, default)
+
+    async def set(self, key, value, ttl=None):
+        await self._lag()
+        await super().set(key, value, ttl)
+
+    async def pop(self, key, default=None):
+        await self._lag()
+        return await super().pop(key, default)
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    })
+
+def make_dispatcher(handler, **kwargs) -> Dispatcher:
+    router = Router()
+    router.message()(handler)
+    dp = Dispatcher(storage=BackendFSMStorage(SlowBackend()))
+    assert install_user_ordering(dp, **kwargs) is not None
+    dp.include_router(router)
+    return dp
+
+async def feed_all(dp: Dispatcher, updates):
+    bot = Bot("123456:TEST")
+    try:
+        # как поллинг: задача на апдейт, в порядке прихода
+        await asyncio.gather(*(asyncio.create_task(dp.feed_update(bot, u)) for u in updates))
+    finally:
+        await bot.session.close()
+
+def test_same_user_in_order_and_sees_previous_state():
+    seen, states = [], []
+
+    async def handler(m: Message, state: FSMContext, raw_state):
+        seen.append(int(m.text))
+        states.append(raw_state)
+        await asyncio.sleep(random.uniform(0.001, 0.01))
+        await state.set_state(f"step{m.text}")
+
+    dp = make_dispatcher(handler)
+    asyncio.run(feed_all(dp, [make_update(i, 7, str(i)) for i in range(1, 11)]))
+
+    assert seen == list(range(1, 11))
+    # raw_state читается FSM-middleware до хендлера: апдейт N видит set_state() апдейта N-1
+    assert states == [None] + [f"step{i}" for i in range(1, 10)]
+
+def test_users_do_not_block_each_other():
+    users, per_user, work = 500, 3, 0.02
+    seen = defaultdict(list)
+
+    async def handler(m: Message, state: FSMContext):
+        await state.get_state()
+        await asyncio.sleep(work)
+        seen[m.from_user.id].append(int(m.text))
+
+    dp = make_dispatcher(handler)
+    updates = [make_update(seq * users + uid, uid, str(seq))
+               for seq in range(per_user) for uid in range(1, users + 1)]
+    t0 = time.perf_counter()
+    asyncio.run(feed_all(dp, updates))
+    took = time.perf_counter() - t0
+
+    assert all(s == list(range(per_user)) for s in seen.values()) and len(seen) == users
+    # по очереди на пользователя ~ per_user * (work + обращения к хранилищу) < 0.5 с плюс накладные
+    # расходы диспетчера; если бы пользователи ждали друг друга — users * per_user * work = 30 с
+    assert took < users * per_user * work / 5
+
+def test_installed_between_user_context_and_fsm():
+    # вставка идёт через публичные unregister/register; если aiogram поменяет цепочку — падаем здесь
+    dp = Dispatcher()
+    mw = install_user_ordering(dp)
+    chain = list(dp.update.outer_middleware)
+    ctx = next(i for i, m in enumerate(chain) if isinstance(m, UserContextMiddleware))
+    assert ctx < chain.index(mw) < chain.index(dp.fsm)
+    assert sum(isinstance(m, UserOrderingMiddleware) for m in chain) == 1 and chain.count(dp.fsm) == 1
+
+def test_waiting_updates_do_not_take_slots():
+    order = []
+
+    async def handler(m: Message):
+        await asyncio.sleep(0.02)
+        order.append(m.from_user.id)
+
+    # 2 места; у пользователя 1 очередь из 10 апдейтов — пользователь 2 не ждёт её конца
+    dp = make_dispatcher(handler, concurrency=2, per_user=0)
+    updates = [make_update(i, 1, str(i)) for i in range(10)] + [make_update(100, 2, "x")]
+    asyncio.run(feed_all(dp, updates))
+    assert order.index(2) <= 1
+
+def test_per_user_queue_is_capped():
+    seen = []
+
+    async def handler(m: Message):
+        await asyncio.sleep(0.01)
+        seen.append(int(m.text))
+
+    dp = make_dispatcher(handler, per_user=3)
+    mw = next(m for m in dp.update.outer_middleware if isinstance(m, UserOrderingMiddleware))
+    asyncio.run(feed_all(dp, [make_update(i, 7, str(i)) for i in range(6)] + [make_update(99, 8, "99")]))
+    assert sorted(seen) == [0, 1, 2, 99]
+    assert mw.dropped == 3
@@ -0,0 +1,29 @@
+"""pack_sources: summaries larger than the budget, truncated only for sources actually cut."""
+from app.services.retrieval import pack_sources
+from app.tokenizer import count_tokens
+
+def make_source(sid: int, chunks: int, summary: str | None = None) -> dict:
+    text = "word " * 100
+    ch = [{"idx": i, "text": text, "tokens": count_tokens(text)} for i in range(chunks)]
+    return {"id": sid, "title": str(sid), "chunks": ch, "total_tokens": sum(c["tokens"] for c in ch),
+            "summary": summary, "keywords": []}
+
+def test_summaries_over_budget_are_trimmed_from_the_end():
+    sources = [make_source(1, 5, "alpha beta " * 50), make_source(2, 5, "gamma delta " * 50)]
+    budget = count_tokens("[summary] " + "alpha beta " * 50) + 10
+    packed, stats = pack_sources(sources, budget)
+    assert stats["tokens_after"] <= budget
+    # первый (приоритетный) источник сохраняет резюме целиком, второй урезан до остатка
+    assert packed[0]["chunks"][0]["text"].startswith("[summary] alpha")
+    assert packed[0]["total_tokens"] == count_tokens(packed[0]["chunks"][0]["text"])
+    assert stats["truncated"] == [2]
+
+def test_truncated_lists_only_sources_that_were_cut():
+    sources = [make_source(1, 5, "alpha beta " * 50), make_source(2, 1), make_source(3, 4)]
+    summary = count_tokens("[summary] " + "alpha beta " * 50)
+    one = sources[1]["total_tokens"]
+    packed, stats = pack_sources(sources, summary + 2 * one + 5)
+    assert stats["summarized"] == [1]
+    assert stats["truncated"] == [3]
+    assert packed[1]["total_tokens"] == one
+    assert stats["tokens_after"] <= summary + 2 * one + 5
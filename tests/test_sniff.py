@@ -0,0 +1,45 @@
+"""sniff_bytes: BOMs, UTF-16 without BOM, NUL/control ratios, legacy Cyrillic charsets."""
+import codecs
+
+from app.utils.sniff import SNIFF_BYTES, decode_sniffed, sniff_bytes
+
+TEXT = "Привет, мир! Импорт документов проекта в память бота. " * 20
+
+def test_boms():
+    assert sniff_bytes(codecs.BOM_UTF8 + TEXT.encode("utf-8")).encoding == "utf-8-sig"
+    assert sniff_bytes(TEXT.encode("utf-16")).encoding == "utf-16"
+    assert sniff_bytes(codecs.BOM_UTF32_LE + TEXT.encode("utf-32-le")).encoding == "utf-32"
+    # BOM решает раньше подсчёта NUL-байт
+    assert sniff_bytes(codecs.BOM_UTF16_BE + TEXT.encode("utf-16-be")).reason == "bom"
+
+def test_utf16_without_bom():
+    for enc in ("utf-16-le", "utf-16-be"):
+        res = sniff_bytes(TEXT.encode(enc)[:SNIFF_BYTES])
+        assert (res.is_text, res.encoding, res.reason) == (True, enc, "utf16-pattern")
+        assert decode_sniffed(TEXT.encode(enc)) == TEXT
+
+def test_nul_ratio():
+    # один NUL на 4 КБ текста — ещё текст, 2% — уже бинарник
+    text = (b"plain ascii line\n" * 300)[:SNIFF_BYTES - 1] + b"\x00"
+    assert sniff_bytes(text).is_text
+    dirty = bytearray(b"a" * SNIFF_BYTES)
+    dirty[::50] = b"\x00" * len(dirty[::50])
+    res = sniff_bytes(bytes(dirty))
+    assert (res.is_text, res.reason) == (False, "nul-bytes")
+
+def test_magic_and_control_chars():
+    assert sniff_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100).reason == "magic"
+    assert sniff_bytes(bytes(range(1, 8)) * 100).reason == "control-chars"
+
+def test_utf8_prefix_cut_mid_character():
+    data = TEXT.encode("utf-8")
+    cut = next(i for i in range(100, len(data)) if data[i] & 0xC0 == 0x80)
+    head = data[:cut]  # обрыв посреди двухбайтовой буквы
+    assert sniff_bytes(head, complete=False).encoding == "utf-8"
+    assert sniff_bytes(head, complete=True).encoding != "utf-8"
+
+def test_legacy_charsets():
+    for enc in ("cp1251", "koi8_r", "cp866"):
+        res = sniff_bytes(TEXT.encode(enc), complete=True)
+        assert (res.is_text, res.encoding, res.reason) == (True, enc, "legacy-charset")
+        assert decode_sniffed(TEXT.encode(enc)) == TEXT
@@ -0,0 +1,41 @@
+""".pmignore -> sparse-checkout patterns: order kept, «!» re-includes, checked against real git."""
+import shutil
+import subprocess
+
+import pytest
+
+from app.ignore import DEFAULT_PMIGNORE
+from app.repo import _sparse_patterns
+
+PMIGNORE = """
+# комментарий
+docs/
+!docs/keep.md
+
+*.log
+"""
+
+def test_patterns_invert_and_keep_order():
+    assert _sparse_patterns(PMIGNORE) == ["/*", "!docs/", "docs/keep.md", "!*.log"]
+
+def test_defaults_have_no_comments_or_blanks():
+    pats = _sparse_patterns(DEFAULT_PMIGNORE)
+    assert pats[0] == "/*" and all(p and not p.startswith("#") for p in pats)
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_git_checks_out_reincluded_file(tmp_path):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.email=t@t", "-c", "user.name=t", *args], cwd=tmp_path,
+                       check=True, capture_output=True)
+
+    files = {"docs/a.md": "a", "docs/keep.md": "k", "src/x.py": "x", "big.log": "l", "src/deep/y.log": "y"}
+    git("init", "-q")
+    for rel, text in files.items():
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text(text)
+    git("add", "-A")
+    git("commit", "-qm", "init")
+    git("sparse-checkout", "set", "--no-cone", *_sparse_patterns(PMIGNORE))
+
+    present = sorted(rel for rel in files if (tmp_path / rel).exists())
+    assert present == ["docs/keep.md", "src/x.py"]
@@ -0,0 +1,56 @@
+"""split_html / split_plain: part size, valid markup in every part, no lost text, always terminates."""
+import re
+import random
+import threading
+
+from app.utils.markdown import md_to_tg_html, split_html, split_plain
+
+TAG_RE = re.compile(r"<(/?)([a-zA-Z0-9-]+)[^>]*>")
+
+WORDS = ["ответ", "ссылка", "a<b", "x & y", "**жирный**", "_курсив_", "`код<i>`", "[12]",
+         "очень" * 30, "конец.", "вопрос?", "\n", "\n\n", "```python\nprint(1 < 2)\n```\n"]
+
+def balanced(part: str) -> bool:
+    stack = []
+    for closing, name in TAG_RE.findall(part):
+        if not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return False
+    return not stack
+
+def text_of(html: str) -> str:
+    return "".join(TAG_RE.sub("", html).split())
+
+def split_in_time(fn, *args, timeout: float = 5.0):
+    out = []
+    worker = threading.Thread(target=lambda: out.append(fn(*args)), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert out, f"{fn.__name__} did not finish in {timeout}s"
+    return out[0]
+
+def test_parts_fit_are_balanced_and_keep_text():
+    rnd = random.Random(1)
+    for _ in range(200):
+        md = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 1500)))
+        html = md_to_tg_html(md)
+        limit = rnd.choice([200, 1500, 4096])
+        parts = split_in_time(split_html, html, limit)
+        assert all(len(p) <= limit for p in parts)
+        assert all(balanced(p) for p in parts)
+        assert text_of("".join(parts)) == text_of(html)
+
+def test_unclosed_tags_terminate():
+    text = "Use <div> tags and x < y & z. " * 300
+    parts = split_in_time(split_html, text, 4096)
+    assert all(len(p) <= 4096 for p in parts)
+    assert text_of("".join(parts)) == text_of(text)
+
+def test_plain_text_is_not_treated_as_html():
+    text = "Use <div> tags and x < y & z. " * 300
+    parts = split_in_time(split_plain, text, 4096)
+    assert "".join(parts) == text
+    assert all(len(p) <= 4096 for p in parts)
+    assert "</div>" not in "".join(parts)
+    assert split_plain("Use <div> here") == ["Use <div> here"]
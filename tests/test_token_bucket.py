@@ -0,0 +1,51 @@
+"""TokenBucket: burst, refill rate, priority before FIFO, pause after RetryAfter."""
+import time
+import asyncio
+
+from app.utils.outbound import PRIORITY_ANSWER, PRIORITY_CLEANUP, PRIORITY_EDIT, TokenBucket
+
+def test_burst_then_rate():
+    async def scenario():
+        b = TokenBucket(rate=50, burst=3)
+        t0 = time.perf_counter()
+        for _ in range(3):
+            await b.acquire()
+        burst = time.perf_counter() - t0
+        for _ in range(5):
+            await b.acquire()
+        return burst, time.perf_counter() - t0
+
+    burst, total = asyncio.run(scenario())
+    assert burst < 0.01
+    # 5 токенов сверх burst при 50/с — не меньше 0.1 с
+    assert 0.09 <= total < 0.5
+
+def test_priority_then_fifo():
+    order = []
+
+    async def scenario():
+        b = TokenBucket(rate=100, burst=1)
+        await b.acquire()  # бакет пуст — дальше все ждут
+
+        async def take(name, prio):
+            await b.acquire(prio)
+            order.append(name)
+
+        tasks = [asyncio.create_task(take(n, p)) for n, p in (
+            ("cleanup", PRIORITY_CLEANUP), ("edit1", PRIORITY_EDIT), ("answer", PRIORITY_ANSWER), ("edit2", PRIORITY_EDIT))]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["answer", "edit1", "edit2", "cleanup"]
+
+def test_pause_blocks_for_retry_after():
+    async def scenario():
+        b = TokenBucket(rate=100, burst=5)
+        b.pause(0.1)
+        assert not b.idle
+        t0 = time.perf_counter()
+        await b.acquire()
+        return time.perf_counter() - t0
+
+    waited = asyncio.run(scenario())
+    assert 0.09 <= waited < 0.5
@@ -0,0 +1,66 @@
+"""TTLStore: lazy expiry on read, heap expiry, eviction order, run() batches."""
+import asyncio
+
+from app.utils.ttl import TTLStore
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_get_drops_expired_key():
+    clock = Clock()
+    s = TTLStore(clock=clock)
+    s.set("a", 1, ttl=10)
+    s.set("b", 2)
+    clock.now = 9.9
+    assert s.get("a") == 1
+    clock.now = 10
+    assert s.get("a") is None and "a" not in s
+    assert s.get("b") == 2 and len(s) == 1
+
+def test_expire_returns_only_due_and_skips_overwritten():
+    clock = Clock()
+    s = TTLStore(clock=clock)
+    s.set("a", 1, ttl=5)
+    s.set("b", 2, ttl=20)
+    s.set("a", 3, ttl=30)  # старая запись в куче — мусор
+    clock.now = 25
+    assert s.expire() == [("b", 2)]
+    assert s.next_expiry() == 30
+    assert s.expire(now=30) == [("a", 3)] and len(s) == 0
+
+def test_eviction_nearest_deadline_then_oldest_unbounded():
+    clock = Clock()
+    s = TTLStore(maxsize=3, clock=clock)
+    s.set("forever1", 1)
+    s.set("late", 2, ttl=100)
+    s.set("soon", 3, ttl=1)
+    s.set("forever2", 4)
+    assert "soon" not in s and len(s) == 3
+    s.set("forever3", 5)
+    assert "late" not in s
+    s.set("forever4", 6)
+    assert sorted(k for k, _ in s.items()) == ["forever2", "forever3", "forever4"]
+
+def test_heap_is_compacted_on_rewrites():
+    s = TTLStore()
+    for i in range(1000):
+        s.set("k", i, ttl=60)
+    assert len(s) == 1 and len(s._heap) <= 2 * len(s) + 64
+
+def test_run_hands_batches_to_on_expire():
+    got = []
+
+    async def scenario():
+        s = TTLStore(on_expire=got.append)
+        task = asyncio.create_task(s.run())
+        s.set("x", 1, ttl=0.05)
+        s.set("y", 2, ttl=0.01)  # раньше дедлайна, до которого спит run()
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert [k for batch in got for k, _ in batch] == ["y", "x"]